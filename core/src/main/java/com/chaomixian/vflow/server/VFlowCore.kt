@@ -18,6 +18,7 @@ import java.net.InetAddress
 import java.net.ServerSocket
 import java.net.Socket
 import java.util.concurrent.Executors
+import java.util.concurrent.Semaphore
 import kotlin.system.exitProcess
 
 /**
@@ -253,23 +254,74 @@ object VFlowCore {
         reader: BufferedReader,
         writer: PrintWriter
     ) {
+        // 带 id 的请求并发处理，限制单连接在途数量
+        val inFlight = Semaphore(Config.MAX_PIPELINED_REQUESTS)
         while (isRunning) {
             val reqStr = reader.readLine() ?: break
             val req = try { JSONObject(reqStr) } catch(e:Exception) { null }
 
             if (req != null) {
                 if (req.optString("target") == "system" && req.optString("method") == "exit") {
-                    writer.println(JSONObject().put("success", true).toString())
+                    // 先让在途的流水线请求写完响应，再回复并退出
+                    awaitInFlight(inFlight)
+                    writer.println(withRequestId(JSONObject().put("success", true).toString(), req))
                     isRunning = false
                     executor.submit { Thread.sleep(500); exitProcess(0) }
-                    return
+                    break
                 }
-                if (tryRouteStreamRequest(req, reqStr, writer)) {
-                    return
+                if (isStreamRequest(req)) {
+                    // 推送流独占连接，在途请求的响应不能和推送帧交错
+                    awaitInFlight(inFlight)
+                    if (tryRouteStreamRequest(req, reqStr, writer)) {
+                        break
+                    }
+                }
+                if (req.has("id")) {
+                    // 流水线模式：响应回显 id，可能乱序返回，由客户端按 id 匹配
+                    inFlight.acquire()
+                    try {
+                        executor.submit {
+                            try {
+                                // PrintWriter.println 内部加锁，多个线程写同一连接不会交错
+                                writer.println(withRequestId(routeRequest(req.optString("target"), reqStr), req))
+                            } finally {
+                                inFlight.release()
+                            }
+                        }
+                    } catch (e: Exception) {
+                        inFlight.release()
+                        throw e
+                    }
+                    continue
                 }
                 writer.println(routeRequest(req.optString("target"), reqStr))
             }
         }
+        // 等待在途请求写完响应后再关闭连接
+        inFlight.acquire(Config.MAX_PIPELINED_REQUESTS)
+    }
+
+    /**
+     * 等待当前连接上所有在途的流水线请求写完响应
+     */
+    private fun awaitInFlight(inFlight: Semaphore) {
+        inFlight.acquire(Config.MAX_PIPELINED_REQUESTS)
+        inFlight.release(Config.MAX_PIPELINED_REQUESTS)
+    }
+
+    /**
+     * 把请求中的 id 回显到响应里；不带 id 的请求原样返回，保持旧协议
+     */
+    private fun withRequestId(response: String, req: JSONObject): String {
+        if (!req.has("id")) {
+            return response
+        }
+        val id = req.get("id")
+        return try {
+            JSONObject(response).put("id", id).toString()
+        } catch (e: Exception) {
+            JSONObject().put("success", false).put("error", "Invalid worker response").put("id", id).toString()
+        }
     }
 
     private fun resolveUnixSocketName(): String {
@@ -331,10 +383,13 @@ object VFlowCore {
         }
     }
 
+    private fun isStreamRequest(req: JSONObject): Boolean {
+        return req.optString("target") == "clipboard" && req.optString("method") == "subscribeClipboardStream"
+    }
+
     private fun tryRouteStreamRequest(req: JSONObject, requestStr: String, clientWriter: PrintWriter): Boolean {
         val target = req.optString("target")
-        val method = req.optString("method")
-        if (target != "clipboard" || method != "subscribeClipboardStream") {
+        if (!isStreamRequest(req)) {
             return false
         }
 
@@ -39,6 +39,10 @@ object Config {
     // 0 = 无限超时，适用于长连接场景
     const val SOCKET_TIMEOUT = 0
 
+    // 单个客户端连接上同时处理的带 id 请求上限（流水线模式）
+    // 超过后 Master 暂停读取该连接，形成背压
+    const val MAX_PIPELINED_REQUESTS = 32
+
     // 监听地址配置
     const val LOCALHOST = "127.0.0.1"  // 本地回环
     const val BIND_ADDRESS = "0.0.0.0"  // 绑定所有网卡，允许远程连接
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+HTTP 压测工具 - 与 test_http_server.py 配套的负载生成器
+
+按 HttpRequestModule 的请求形态构造请求体：
+    json       application/json; charset=utf-8
+    form       application/x-www-form-urlencoded
+    multipart  multipart/form-data，包含 N 个文件（字段名 file）
+
+每个工作线程持有一条 keep-alive 连接，闭环发送请求，依次扫描多个并发级别，
+统计 p50/p95/p99 延迟、req/s 与上传 MB/s。结果可以保存为基线文件，
+之后的运行与基线比较，吞吐下降或 p99 上升超过阈值即视为回归（退出码 1）。
+multipart 的文件内容每次请求都不同，测的是服务器落盘路径；--dedup 发送相同内容，测内容去重路径。
+
+用法：
+    python3 test_http_server.py --mode threaded --quiet
+    python3 http_benchmark.py --target http://127.0.0.1:8000 --save-baseline baseline.json
+    python3 http_benchmark.py --shapes multipart --files 4 --file-kb 512 --baseline baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode, urlsplit
+
+from perf_stats import percentile
+
+
+SHAPES = ("json", "form", "multipart")
+# 每个文件开头按请求写入的随机字节数，使每次上传的文件内容都不同
+NONCE_BYTES = 16
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Load generator for test_http_server.py reproducing HttpRequestModule request shapes."
+    )
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the server under test.")
+    parser.add_argument("--path", default="/upload", help="Request path used for every shape.")
+    parser.add_argument(
+        "--shapes",
+        default=",".join(SHAPES),
+        help=f"Comma-separated request shapes to run. Choices: {', '.join(SHAPES)}.",
+    )
+    parser.add_argument("--concurrency", default="1,8,32,64", help="Comma-separated concurrency levels to sweep.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run each shape/concurrency level.")
+    parser.add_argument("--requests", type=int, help="Send exactly N requests per level instead of --duration.")
+    parser.add_argument("--warmup", type=float, default=0.5, help="Warm-up seconds per level, excluded from stats.")
+    parser.add_argument("--files", type=int, default=2, help="Number of files per multipart request.")
+    parser.add_argument("--file-kb", type=int, default=256, help="Size of each multipart file in KB.")
+    parser.add_argument("--fields", type=int, default=8, help="Number of fields in json/form bodies.")
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Upload identical file content on every request to measure the server's warm dedup path.",
+    )
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request socket timeout in seconds.")
+    parser.add_argument("--baseline", help="Compare results against this baseline file.")
+    parser.add_argument("--save-baseline", help="Write results to this baseline file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Regression threshold in percent for req/s drop and p99 increase.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return parser
+
+
+def build_body(shape: str, args: argparse.Namespace) -> tuple[bytes, str, list[int]]:
+    """按 HttpRequestModule.createRequestBody 的格式构造请求体，每种形态只构造一次
+
+    同时返回每个文件内容在请求体中的偏移，发送时在这些位置写入 NONCE_BYTES 个随机字节
+    （--dedup 时返回空列表，每次上传相同内容）。
+    """
+    fields = {f"key{i}": f"value-{i}-" + "x" * 16 for i in range(args.fields)}
+    if shape == "json":
+        return json.dumps(fields).encode("utf-8"), "application/json; charset=utf-8", []
+    if shape == "form":
+        return urlencode(fields).encode("utf-8"), "application/x-www-form-urlencoded", []
+
+    boundary = uuid.uuid4().hex
+    parts: list[bytes] = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        )
+    # 请求体只构造一次，文件内容的前 NONCE_BYTES 字节在每次发送时改写，
+    # 否则除第一次外的上传都会命中服务器的内容去重（硬链接已有文件），测到的不是写盘路径
+    nonce_offsets: list[int] = []
+    offset = sum(len(part) for part in parts)
+    for index in range(args.files):
+        header = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="image_{index}.jpg"\r\n'
+            f"Content-Type: image/jpeg\r\n\r\n".encode("utf-8")
+        )
+        content = os.urandom(args.file_kb * 1024)
+        parts += [header, content, b"\r\n"]
+        if len(content) >= NONCE_BYTES and not args.dedup:
+            nonce_offsets.append(offset + len(header))
+        offset += len(header) + len(content) + 2
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}", nonce_offsets
+
+
+class LoadWorker:
+    """每个线程一条持久连接，闭环发送直到截止时间或请求配额用完"""
+
+    def __init__(self, target: str, path: str, body: bytes, content_type: str, timeout: float,
+                 nonce_offsets: list[int] | None = None):
+        parts = urlsplit(target)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.path = parts.path.rstrip("/") + path
+        self.body = body
+        self.nonce_offsets = nonce_offsets or []
+        self.headers = {"Content-Type": content_type, "Content-Length": str(len(body))}
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.bytes_sent = 0
+        self.recording = False
+        self.remaining: int | None = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if self.scheme == "https":
+                conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def _request_body(self) -> bytes | bytearray:
+        """本次请求的请求体：每个线程持有一份副本，只改写文件开头的随机字节"""
+        if not self.nonce_offsets:
+            return self.body
+        body = getattr(self.local, "body", None)
+        if body is None:
+            body = self.local.body = bytearray(self.body)
+        for offset in self.nonce_offsets:
+            body[offset:offset + NONCE_BYTES] = os.urandom(NONCE_BYTES)
+        return body
+
+    def _reset_connection(self) -> None:
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self.local.conn = None
+
+    def _take_ticket(self) -> bool:
+        if self.remaining is None:
+            return True
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def run(self, deadline: float | None) -> None:
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                if not self._take_ticket():
+                    break
+                self._send_once()
+        finally:
+            self._reset_connection()
+
+    def _send_once(self) -> None:
+        body = self._request_body()
+        started = time.perf_counter()
+        try:
+            conn = self._connection()
+            conn.request("POST", self.path, body=body, headers=self.headers)
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - started
+            if response.will_close:
+                self._reset_connection()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            self._reset_connection()
+            elapsed = time.perf_counter() - started
+            ok = False
+        if not self.recording:
+            return
+        with self.lock:
+            if ok:
+                self.latencies.append(elapsed)
+                self.bytes_sent += len(self.body)
+            else:
+                self.errors += 1
+
+
+def run_level(shape: str, concurrency: int, body: bytes, content_type: str, nonce_offsets: list[int],
+              args: argparse.Namespace) -> dict[str, Any]:
+    if args.warmup > 0:
+        warm = LoadWorker(args.target, args.path, body, content_type, args.timeout, nonce_offsets)
+        deadline = time.perf_counter() + args.warmup
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(warm.run, deadline)
+
+    worker = LoadWorker(args.target, args.path, body, content_type, args.timeout, nonce_offsets)
+    worker.recording = True
+    worker.remaining = args.requests
+    deadline = None if args.requests else time.perf_counter() + args.duration
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker.run, deadline)
+    duration = time.perf_counter() - started
+
+    latencies = sorted(worker.latencies)
+    completed = len(latencies)
+    return {
+        "shape": shape,
+        "concurrency": concurrency,
+        "body_bytes": len(body),
+        "completed": completed,
+        "errors": worker.errors,
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(completed / duration, 2) if duration > 0 else 0.0,
+        "upload_mb_per_second": round(worker.bytes_sent / 1024 / 1024 / duration, 3) if duration > 0 else 0.0,
+        "latency_ms": {
+            name: (round(value * 1000, 3) if value is not None else None)
+            for name, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+            )
+        },
+    }
+
+
+def result_key(result: dict[str, Any]) -> str:
+    return f"{result['shape']}@{result['concurrency']}"
+
+
+def compare_with_baseline(
+    results: list[dict[str, Any]], baseline: dict[str, Any], threshold: float
+) -> list[dict[str, Any]]:
+    """吞吐下降或 p99 上升超过阈值（百分比）即记为回归"""
+    previous = baseline.get("results", {})
+    regressions: list[dict[str, Any]] = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if not old:
+            continue
+        old_rps = old.get("requests_per_second") or 0
+        new_rps = result["requests_per_second"]
+        if old_rps > 0 and new_rps < old_rps * (1 - threshold / 100):
+            regressions.append({
+                "key": result_key(result),
+                "metric": "requests_per_second",
+                "baseline": old_rps,
+                "current": new_rps,
+                "change_percent": round((new_rps - old_rps) / old_rps * 100, 1),
+            })
+        old_p99 = (old.get("latency_ms") or {}).get("p99")
+        new_p99 = result["latency_ms"]["p99"]
+        if old_p99 and new_p99 is not None and new_p99 > old_p99 * (1 + threshold / 100):
+            regressions.append({
+                "key": result_key(result),
+                "metric": "latency_p99_ms",
+                "baseline": old_p99,
+                "current": new_p99,
+                "change_percent": round((new_p99 - old_p99) / old_p99 * 100, 1),
+            })
+    return regressions
+
+
+def print_results(results: list[dict[str, Any]], regressions: list[dict[str, Any]] | None) -> None:
+    print("=" * 88)
+    print(f"{'形态':<10}{'并发':>6}{'完成':>9}{'错误':>7}{'req/s':>11}{'MB/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 88)
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['shape']:<12}{result['concurrency']:>6}{result['completed']:>9}{result['errors']:>7}"
+              f"{result['requests_per_second']:>11}{result['upload_mb_per_second']:>10}"
+              f"{latency['p50'] or '-':>10}{latency['p95'] or '-':>10}{latency['p99'] or '-':>10}")
+    print("=" * 88)
+    if regressions is None:
+        return
+    if not regressions:
+        print("与基线相比没有回归")
+        return
+    print(f"发现 {len(regressions)} 项回归：")
+    for item in regressions:
+        print(f"  {item['key']:<16} {item['metric']:<22} {item['baseline']} -> {item['current']} "
+              f"({item['change_percent']:+}%)")
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    shapes = [shape.strip() for shape in args.shapes.split(",") if shape.strip()]
+    unknown = [shape for shape in shapes if shape not in SHAPES]
+    if unknown:
+        raise SystemExit(f"Unknown shape(s): {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    results: list[dict[str, Any]] = []
+    for shape in shapes:
+        body, content_type, nonce_offsets = build_body(shape, args)
+        for concurrency in levels:
+            if not args.json:
+                print(f"运行 {shape} @ 并发 {concurrency} ...", file=sys.stderr)
+            results.append(run_level(shape, concurrency, body, content_type, nonce_offsets, args))
+
+    regressions = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        payload = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "target": args.target,
+            "files": args.files,
+            "file_kb": args.file_kb,
+            "dedup": args.dedup,
+            "results": {result_key(result): result for result in results},
+        }
+        Path(args.save_baseline).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, ensure_ascii=False, indent=2))
+    else:
+        print_results(results, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
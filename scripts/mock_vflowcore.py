@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+"""
+vFlowCore 模拟服务器 - 不需要 Root 手机也能调试和压测
+
+在本机实现与 vFlowCore Master 相同的协议：每个请求一行 JSON，每个响应一行 JSON，
+同时监听 TCP（默认 127.0.0.1:19999）和抽象 UNIX socket（默认 @com_chaomixian_vflow_vflow_core）。
+各 target 的方法名、参数和响应字段与 core/ 中的 Wrapper 保持一致，状态保存在内存中。
+
+支持：
+    - system / clipboard / input / uinput / wifi / bluetooth_manager / power / activity
+      / audio / nfc / screenshot，以及剪贴板订阅流 subscribeClipboardStream
+    - 带 id 的请求并发处理并回显 id（流水线），与 core 的协议扩展一致
+    - 按方法配置延迟和失败注入，额外的 mock target 可在运行时查看和修改状态
+
+用法：
+    python3 mock_vflowcore.py
+    python3 mock_vflowcore.py --port 19999 --unix com_chaomixian_vflow_vflow_core --root
+    python3 mock_vflowcore.py --latency '*=2' --latency 'screenshot.*=150~50' --fail 'wifi.*=0.2'
+    python3 vflowcore_client.py test --scope full        # 对模拟服务器跑自动测试
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 19999
+DEFAULT_UNIX_NAME = "com_chaomixian_vflow_vflow_core"
+VERSION_CODE = 1
+VERSION_NAME = "mock"
+
+# 与 Config.MAX_PIPELINED_REQUESTS 一致：单连接同时处理的带 id 请求上限
+MAX_PIPELINED_REQUESTS = 32
+# 输入事件日志保留条数
+INPUT_LOG_SIZE = 1000
+
+# 与 Config.ROUTING_TABLE 一致：这些 target 由 Worker 处理，其余 target 返回 "No route"
+SHELL_TARGETS = {
+    "clipboard", "input", "audio", "wifi", "bluetooth_manager", "nfc", "power", "activity",
+    "connectivity", "location", "alarm", "activity_task", "screenshot",
+}
+ROOT_TARGETS = {"uinput", "system_root"}
+
+# IAudioManagerWrapper 的音频流类型和最大音量
+AUDIO_STREAMS = {
+    0: ("call", 5),
+    1: ("system", 7),
+    2: ("ring", 7),
+    3: ("music", 15),
+    4: ("alarm", 7),
+    5: ("notification", 7),
+}
+STREAM_MUSIC = 3
+ADJUST_RAISE = 1
+
+
+class MethodError(Exception):
+    """方法执行失败，对应 Worker 中 catch 后的 "Execution failed: ..." 响应"""
+
+
+def require(params: Dict[str, Any], key: str, kind: type = int) -> Any:
+    """取必填参数，缺失时的错误文本与 org.json 的 getInt/getString 一致"""
+    if key not in params:
+        raise MethodError(f'JSONObject["{key}"] not found.')
+    value = params[key]
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise MethodError(f'JSONObject["{key}"] is not a Boolean.')
+        return value
+    if kind is int:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise MethodError(f'JSONObject["{key}"] is not a int.')
+        return int(value)
+    return str(value)
+
+
+class Rule:
+    """按 target.method 匹配的配置表：精确匹配 > target.* > *"""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+
+    def set(self, pattern: str, value: Any):
+        if value is None:
+            self.values.pop(pattern, None)
+        else:
+            self.values[pattern] = value
+
+    def get(self, target: str, method: str, default: Any = None) -> Any:
+        for key in (f"{target}.{method}", f"{target}.*", "*"):
+            if key in self.values:
+                return self.values[key]
+        return default
+
+
+class Injection:
+    """延迟和失败注入
+
+    latency: "target.method" -> (毫秒, 抖动毫秒)
+    fail: 概率返回 success=false
+    disconnect: 概率不响应直接断开连接（模拟 core 崩溃或网络中断）
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self.latency = Rule()
+        self.fail = Rule()
+        self.disconnect = Rule()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay_for(self, target: str, method: str) -> float:
+        base, jitter = self.latency.get(target, method, (0.0, 0.0))
+        if jitter:
+            with self.lock:
+                base += self.random.uniform(-jitter, jitter)
+        return max(base, 0.0) / 1000
+
+    def roll(self, rule: Rule, target: str, method: str) -> bool:
+        probability = rule.get(target, method, 0.0)
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < probability
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "latency": {k: f"{v[0]:g}~{v[1]:g}" if v[1] else f"{v[0]:g}" for k, v in self.latency.values.items()},
+            "fail": dict(self.fail.values),
+            "disconnect": dict(self.disconnect.values),
+        }
+
+
+def parse_latency(spec: str) -> Tuple[str, Tuple[float, float]]:
+    """解析 "target.method=毫秒[~抖动]"，target 或 method 可以是 *"""
+    pattern, sep, value = spec.partition("=")
+    if not sep or not pattern:
+        raise argparse.ArgumentTypeError(f"延迟格式应为 target.method=ms[~jitter]: {spec}")
+    base, _, jitter = value.partition("~")
+    try:
+        return pattern, (float(base), float(jitter or 0))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"延迟格式应为 target.method=ms[~jitter]: {spec}") from None
+
+
+def parse_probability(spec: str) -> Tuple[str, float]:
+    """解析 "target.method=概率"（0~1）"""
+    pattern, sep, value = spec.partition("=")
+    try:
+        probability = float(value)
+    except ValueError:
+        probability = -1.0
+    if not sep or not pattern or not 0 <= probability <= 1:
+        raise argparse.ArgumentTypeError(f"格式应为 target.method=概率(0~1): {spec}")
+    return pattern, probability
+
+
+def build_png(width: int, height: int, seed: int = 0) -> bytes:
+    """生成灰度噪点 PNG，大小接近真实截图，用于测试大响应的分帧和传输"""
+    rng = random.Random(seed)
+    rows = bytearray()
+    row = bytes(width)
+    for y in range(height):
+        # 每 4 行换一行新噪点，其余行重复上一行：压缩后约为原始大小的 1/4，接近真实截图
+        if y % 4 == 0:
+            row = rng.randbytes(width)
+        rows += b"\x00" + row
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(bytes(rows), 6)) + chunk(b"IEND", b""))
+
+
+class MockCoreState:
+    """模拟设备的内存状态，所有连接共享"""
+
+    def __init__(self, root: bool, screen: Tuple[int, int]):
+        self.root = root
+        self.screen_width, self.screen_height = screen
+        self.lock = threading.Lock()
+        # 剪贴板序号只增不减，reset 后订阅者也不会错过或重复事件
+        self.clipboard_sequence = 0
+        self.clipboard_changed = threading.Condition(self.lock)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.clipboard = ""
+            self.switches = {"wifi": True, "bluetooth_manager": False, "nfc": False}
+            self.interactive = True
+            self.volumes = {stream: max_level // 2 for stream, (_, max_level) in AUDIO_STREAMS.items()}
+            self.input_log: deque = deque(maxlen=INPUT_LOG_SIZE)
+            self.stopped_packages: List[str] = []
+            self.requests = 0
+            self.png_cache: Dict[Tuple[int, int], bytes] = {}
+
+    # ---- 剪贴板 ----
+
+    def set_clipboard(self, text: str):
+        with self.clipboard_changed:
+            self.clipboard = text
+            self.clipboard_sequence += 1
+            self.clipboard_changed.notify_all()
+
+    def wait_clipboard(self, sequence: int, timeout: float) -> Tuple[int, str]:
+        """等待剪贴板序号超过 sequence，返回 (当前序号, 文本)"""
+        with self.clipboard_changed:
+            self.clipboard_changed.wait_for(lambda: self.clipboard_sequence != sequence, timeout)
+            return self.clipboard_sequence, self.clipboard
+
+    # ---- 输入 ----
+
+    def record_input(self, source: str, method: str, params: Dict[str, Any]):
+        with self.lock:
+            self.input_log.append({"time": round(time.time(), 3), "source": source, "method": method, "params": params})
+
+    # ---- 截图 ----
+
+    def screenshot(self, max_width: int, max_height: int) -> Tuple[int, int, bytes]:
+        width, height = self.screen_width, self.screen_height
+        scale = 1.0
+        if max_width > 0:
+            scale = min(scale, max_width / width)
+        if max_height > 0:
+            scale = min(scale, max_height / height)
+        width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+        with self.lock:
+            data = self.png_cache.get((width, height))
+        if data is None:
+            data = build_png(width, height)
+            with self.lock:
+                self.png_cache[(width, height)] = data
+        return width, height, data
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "clipboard": self.clipboard,
+                "clipboardSequence": self.clipboard_sequence,
+                "wifi": self.switches["wifi"],
+                "bluetooth": self.switches["bluetooth_manager"],
+                "nfc": self.switches["nfc"],
+                "interactive": self.interactive,
+                "volumes": {AUDIO_STREAMS[s][0]: v for s, v in self.volumes.items()},
+                "inputEvents": list(self.input_log)[-50:],
+                "inputEventCount": len(self.input_log),
+                "stoppedPackages": list(self.stopped_packages),
+                "requests": self.requests,
+            }
+
+
+class MockVFlowCore:
+    """请求路由和各 target 的实现"""
+
+    def __init__(self, state: MockCoreState, injection: Injection, verbose: bool = False):
+        self.state = state
+        self.injection = injection
+        self.verbose = verbose
+        self.shutdown: Optional[Callable[[], None]] = None
+        self.handlers: Dict[str, Callable[[str, Dict[str, Any]], Dict[str, Any]]] = {
+            "clipboard": self.handle_clipboard,
+            "input": self.handle_input,
+            "uinput": self.handle_uinput,
+            "wifi": self.handle_switch("wifi", "setWifiEnabled"),
+            "bluetooth_manager": self.handle_switch("bluetooth_manager", "setBluetoothEnabled"),
+            "nfc": self.handle_switch("nfc", "setNfcEnabled"),
+            "power": self.handle_power,
+            "activity": self.handle_activity,
+            "audio": self.handle_audio,
+            "screenshot": self.handle_screenshot,
+        }
+
+    def process(self, req: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """处理一个请求；返回 None 表示按注入规则断开连接、不响应"""
+        target = req.get("target") or ""
+        method = req.get("method") or ""
+        params = req.get("params")
+        if not isinstance(params, dict):
+            params = {}
+        with self.state.lock:
+            self.state.requests += 1
+
+        if target != "mock":
+            delay = self.injection.delay_for(target, method)
+            if delay:
+                time.sleep(delay)
+            if self.injection.roll(self.injection.disconnect, target, method):
+                return None
+            if self.injection.roll(self.injection.fail, target, method):
+                return {"success": False, "error": f"Injected failure ({target}.{method})"}
+
+        response = self.route(target, method, params)
+        if self.verbose:
+            print(f"{target}.{method} {json.dumps(params, ensure_ascii=False)} -> {json.dumps(response, ensure_ascii=False)[:200]}")
+        return response
+
+    def route(self, target: str, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """与 VFlowCore.routeRequest 一致的路由规则"""
+        if target == "system":
+            handler = self.handle_system
+        elif target == "mock":
+            handler = self.handle_mock
+        elif target in ROOT_TARGETS and not self.state.root:
+            return {"success": False, "error": "Worker error: Connection refused"}
+        elif target not in SHELL_TARGETS and target not in ROOT_TARGETS:
+            return {"success": False, "error": "No route"}
+        else:
+            handler = self.handlers.get(target)
+            if handler is None:
+                return {"success": False, "error": f"Service not found or not supported in this worker ({target})"}
+        # 与 worker 一致：处理中的任何异常（参数类型错误等）都以失败响应返回，不会没有回复
+        try:
+            return handler(method, params)
+        except Exception as e:
+            return {"success": False, "error": f"Execution failed: {e}"}
+
+    # ---- system ----
+
+    def handle_system(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "ping":
+            return {"success": True, "uid": 0 if self.state.root else 2000,
+                    "versionCode": VERSION_CODE, "versionName": VERSION_NAME}
+        if method == "exec":
+            if params.get("asRoot", False) and not self.state.root:
+                return {"success": False, "error": "RootWorker not available (Master not Root)"}
+            cmd = str(params.get("cmd", ""))
+            if not cmd.strip():
+                return {"success": False, "error": "Command is empty"}
+            # 不真正执行命令，只回显，避免在开发机上误操作
+            return {"success": True, "output": f"[mock] {cmd}"}
+        if method == "exit":
+            if self.shutdown is not None:
+                threading.Timer(0.5, self.shutdown).start()
+            return {"success": True}
+        return {"success": False, "error": "Unknown system method"}
+
+    # ---- clipboard ----
+
+    def handle_clipboard(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "setClipboard":
+            self.state.set_clipboard(require(params, "text", str))
+            return {"success": True}
+        if method == "getClipboard":
+            return {"text": self.state.clipboard, "success": True}
+        return {"success": False, "error": f"Unknown method: {method}"}
+
+    def stream_clipboard(self, write: Callable[[Dict[str, Any]], bool]):
+        """subscribeClipboardStream：先发 ready，之后每次剪贴板变化推送一条事件，直到写失败"""
+        sequence = self.state.clipboard_sequence
+        if not write({"success": True, "event": "ready", "sequence": sequence}):
+            return
+        while True:
+            current, text = self.state.wait_clipboard(sequence, 1.0)
+            if current == sequence:
+                continue
+            sequence = current
+            if not write({"text": text, "signature": f"text:{text}", "success": True,
+                          "event": "clipboard_changed", "sequence": sequence}):
+                return
+
+    # ---- input / uinput ----
+
+    def handle_input(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "tap":
+            args = {"x": require(params, "x"), "y": require(params, "y")}
+        elif method == "swipe":
+            args = {k: require(params, k) for k in ("x1", "y1", "x2", "y2")}
+            args["duration"] = int(params.get("duration", 300))
+        elif method == "key":
+            args = {"code": require(params, "code")}
+        elif method == "inputText":
+            args = {"text": require(params, "text", str)}
+        elif method == "replaySequence":
+            args = {"sequence": require(params, "sequence", str),
+                    "speedMultiplier": float(params.get("speedMultiplier", 1.0))}
+        else:
+            return {"success": False, "error": f"Unknown method: {method}"}
+        self.state.record_input("input", method, args)
+        return {"success": True}
+
+    def handle_uinput(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "tap":
+            args = {"x": require(params, "x"), "y": require(params, "y")}
+        elif method == "longPress":
+            args = {"x": require(params, "x"), "y": require(params, "y"), "duration": int(params.get("duration", 600))}
+        elif method == "swipe":
+            args = {k: require(params, k) for k in ("x1", "y1", "x2", "y2")}
+            args["duration"] = int(params.get("duration", 300))
+        else:
+            return {"success": False, "error": f"Unknown method: {method}"}
+        self.state.record_input("uinput", method, args)
+        return {"success": True}
+
+    # ---- wifi / bluetooth_manager / nfc ----
+
+    def handle_switch(self, name: str, set_method: str) -> Callable[[str, Dict[str, Any]], Dict[str, Any]]:
+        def handle(method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+            switches = self.state.switches
+            if method == set_method:
+                switches[name] = require(params, "enabled", bool)
+                return {"success": True}
+            if method == "isEnabled":
+                return {"success": True, "enabled": switches[name]}
+            if method == "toggle":
+                with self.state.lock:
+                    switches[name] = not switches[name]
+                    return {"success": True, "enabled": switches[name]}
+            return {"success": False, "error": f"Unknown method: {method}"}
+        return handle
+
+    # ---- power / activity ----
+
+    def handle_power(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "wakeUp":
+            self.state.interactive = True
+            return {"success": True}
+        if method == "goToSleep":
+            self.state.interactive = False
+            return {"success": True}
+        if method == "isInteractive":
+            return {"success": True, "enabled": self.state.interactive}
+        return {"success": False, "error": f"Unknown method: {method}"}
+
+    def handle_activity(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "forceStopPackage":
+            package = require(params, "package", str)
+            with self.state.lock:
+                self.state.stopped_packages.append(package)
+            return {"success": True}
+        return {"success": False, "error": f"Unknown method: {method}"}
+
+    # ---- audio ----
+
+    def handle_audio(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        volumes = self.state.volumes
+        stream = int(params.get("streamType", STREAM_MUSIC))
+
+        def levels(success: bool = True) -> Dict[str, Any]:
+            if not success:
+                return {"success": False}
+            return {"success": True, "currentLevel": volumes[stream], "maxLevel": AUDIO_STREAMS[stream][1]}
+
+        if method == "getAllVolumes":
+            return {"success": True, "volumes": {
+                name: {"current": volumes[s], "max": max_level} for s, (name, max_level) in AUDIO_STREAMS.items()
+            }}
+        if method not in ("setVolume", "getVolume", "adjustVolume", "mute"):
+            return {"success": False, "error": f"Unknown method: {method}"}
+        if stream not in AUDIO_STREAMS:
+            return {"success": False} if method != "getVolume" else {"success": True, "currentLevel": 0, "maxLevel": 0}
+
+        max_level = AUDIO_STREAMS[stream][1]
+        with self.state.lock:
+            if method == "setVolume":
+                volumes[stream] = min(max(int(params.get("volume", 0)), 0), max_level)
+            elif method == "adjustVolume":
+                direction = int(params.get("direction", ADJUST_RAISE))
+                volumes[stream] = min(max(volumes[stream] + (direction > 0) - (direction < 0), 0), max_level)
+            elif method == "mute":
+                volumes[stream] = 0 if params.get("mute", True) else max_level // 2
+            return levels()
+
+    # ---- screenshot ----
+
+    def handle_screenshot(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "getScreenSize":
+            return {"success": True, "width": self.state.screen_width, "height": self.state.screen_height,
+                    "rotation": 0, "displayId": int(params.get("displayId", 0))}
+        if method == "captureScreen":
+            width, height, data = self.state.screenshot(int(params.get("maxWidth", 0)), int(params.get("maxHeight", 0)))
+            # 不依赖图像库，始终返回 PNG，format 字段如实标注
+            result = {"success": True, "width": width, "height": height, "format": "png", "size": len(data)}
+            if params.get("includeBase64", True):
+                result["data"] = base64.b64encode(data).decode("ascii")
+            return result
+        if method == "captureScreenToFile":
+            path = require(params, "filePath", str)
+            _, _, data = self.state.screenshot(0, 0)
+            try:
+                with open(path, "wb") as f:
+                    f.write(data)
+            except OSError:
+                return {"success": False, "error": "Failed to capture screen to file"}
+            return {"success": True}
+        return {"success": False, "error": f"Unknown method: {method}"}
+
+    # ---- mock：运行时查看和修改模拟器状态（真实 core 中没有这个 target） ----
+
+    def handle_mock(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if method == "getState":
+            return {"success": True, "state": self.state.snapshot(), "injection": self.injection.describe()}
+        if method == "reset":
+            self.state.reset()
+            return {"success": True}
+        if method in ("setLatency", "setFailure", "setDisconnect"):
+            pattern = str(params.get("pattern", "*"))
+            if method == "setLatency":
+                ms = params.get("ms")
+                value = None if ms is None else (float(ms), float(params.get("jitter", 0)))
+                self.injection.latency.set(pattern, value)
+            else:
+                rule = self.injection.fail if method == "setFailure" else self.injection.disconnect
+                probability = params.get("probability")
+                rule.set(pattern, None if probability is None else float(probability))
+            return {"success": True, "injection": self.injection.describe()}
+        return {"success": False, "error": f"Unknown method: {method}"}
+
+
+class MockConnectionHandler(socketserver.StreamRequestHandler):
+    """一个客户端连接：与 VFlowCore.handleMasterClientLoop 相同的读写循环"""
+
+    core: MockVFlowCore
+    executor: ThreadPoolExecutor
+
+    def setup(self):
+        super().setup()
+        if isinstance(self.request, socket.socket) and self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+        self.closed = False
+
+    def write(self, response: Dict[str, Any]) -> bool:
+        data = (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.write_lock:
+            if self.closed:
+                return False
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+                return True
+            except OSError:
+                self.closed = True
+                return False
+
+    def drop(self):
+        """注入断开：不响应，直接关闭连接"""
+        with self.write_lock:
+            self.closed = True
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def respond(self, req: Dict[str, Any]) -> bool:
+        try:
+            response = self.core.process(req)
+        except Exception as e:
+            # 兜底：请求格式异常（如 params 不是对象）也必须回复，否则带 id 的请求会一直等待
+            response = {"success": False, "error": f"Execution failed: {e}"}
+        if response is None:
+            self.drop()
+            return False
+        if "id" in req:
+            response["id"] = req["id"]
+        return self.write(response)
+
+    def handle(self):
+        in_flight = threading.Semaphore(MAX_PIPELINED_REQUESTS)
+
+        def run_pipelined(req: Dict[str, Any]):
+            try:
+                self.respond(req)
+            finally:
+                in_flight.release()
+
+        def await_in_flight():
+            for _ in range(MAX_PIPELINED_REQUESTS):
+                in_flight.acquire()
+            for _ in range(MAX_PIPELINED_REQUESTS):
+                in_flight.release()
+
+        for line in self.rfile:
+            if self.closed:
+                break
+            try:
+                req = json.loads(line)
+            except ValueError:
+                # 与 Master 一致：无法解析的行直接忽略，不返回响应
+                continue
+            if not isinstance(req, dict):
+                continue
+
+            if req.get("target") == "system" and req.get("method") == "exit":
+                # 与 Master 一致：先让在途请求写完响应，再回复并退出
+                await_in_flight()
+                self.respond(req)
+                break
+            if req.get("target") == "clipboard" and req.get("method") == "subscribeClipboardStream":
+                # 流式请求独占连接直到客户端断开；在途请求的响应不能和推送帧交错
+                await_in_flight()
+                self.core.stream_clipboard(self.write)
+                break
+            if "id" in req:
+                in_flight.acquire()
+                self.executor.submit(run_pipelined, req)
+                continue
+            if not self.respond(req):
+                break
+
+        # 等待在途请求写完再关闭连接
+        for _ in range(MAX_PIPELINED_REQUESTS):
+            in_flight.acquire()
+
+
+class MockTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline mock vFlowCore speaking the newline-JSON protocol.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="TCP bind address (0.0.0.0 for remote clients).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port; 0 disables TCP.")
+    parser.add_argument("--unix", default=DEFAULT_UNIX_NAME,
+                        help="Abstract UNIX socket name (without the leading @); empty disables it.")
+    parser.add_argument("--root", action="store_true", help="Act as a root core: uid 0, uinput and exec asRoot work.")
+    parser.add_argument("--screen", default="1080x2400", help="Screen size WxH reported and captured.")
+    parser.add_argument("--latency", action="append", type=parse_latency, default=[], metavar="T.M=MS[~JITTER]",
+                        help="Per-method latency, e.g. 'input.tap=5', 'screenshot.*=150~50', '*=1'. Repeatable.")
+    parser.add_argument("--fail", action="append", type=parse_probability, default=[], metavar="T.M=P",
+                        help="Probability of a success=false reply, e.g. 'wifi.*=0.2'. Repeatable.")
+    parser.add_argument("--disconnect", action="append", type=parse_probability, default=[], metavar="T.M=P",
+                        help="Probability of dropping the connection without replying. Repeatable.")
+    parser.add_argument("--seed", type=int, help="Random seed for jitter and injection.")
+    parser.add_argument("--workers", type=int, default=64, help="Threads for pipelined (id-tagged) requests.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Print every request and reply.")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    try:
+        width, height = (int(v) for v in args.screen.lower().split("x"))
+    except ValueError:
+        print(f"❌ 屏幕尺寸格式应为 WxH: {args.screen}", file=sys.stderr)
+        return 2
+
+    injection = Injection(args.seed)
+    for pattern, value in args.latency:
+        injection.latency.set(pattern, value)
+    for pattern, value in args.fail:
+        injection.fail.set(pattern, value)
+    for pattern, value in args.disconnect:
+        injection.disconnect.set(pattern, value)
+
+    core = MockVFlowCore(MockCoreState(args.root, (width, height)), injection, args.verbose)
+    MockConnectionHandler.core = core
+    MockConnectionHandler.executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="mock-core")
+
+    servers: List[socketserver.BaseServer] = []
+    try:
+        if args.port:
+            servers.append(MockTCPServer((args.host, args.port), MockConnectionHandler))
+        if args.unix:
+            if not hasattr(socket, "AF_UNIX") or not sys.platform.startswith("linux"):
+                print("⚠️ 当前平台不支持抽象 UNIX socket，只监听 TCP")
+            else:
+                servers.append(MockUnixServer("\0" + args.unix, MockConnectionHandler))
+    except OSError as e:
+        print(f"❌ 无法监听: {e}", file=sys.stderr)
+        return 1
+    if not servers:
+        print("❌ TCP 和 UNIX socket 都被禁用", file=sys.stderr)
+        return 2
+
+    stop = threading.Event()
+    core.shutdown = stop.set
+    for server in servers:
+        threading.Thread(target=server.serve_forever, name="mock-core-accept", daemon=True).start()
+
+    print("\n🚀 vFlowCore 模拟服务器启动")
+    if args.port:
+        print(f"✓ TCP: {args.host}:{args.port}")
+    if args.unix and len(servers) == (2 if args.port else 1):
+        print(f"✓ UNIX: @{args.unix}")
+    print(f"✓ 身份: {'root (uid 0)' if args.root else 'shell (uid 2000)'}  屏幕: {width}x{height}")
+    injected = injection.describe()
+    if any(injected.values()):
+        print(f"✓ 注入: {json.dumps(injected, ensure_ascii=False)}")
+    print("✓ 运行时控制: target=mock, method=getState/reset/setLatency/setFailure/setDisconnect")
+    print("\n提示: 按 Ctrl+C 停止服务器\n")
+
+    try:
+        while not stop.wait(0.5):
+            pass
+        print("收到 system.exit，退出")
+    except KeyboardInterrupt:
+        print("\n已停止")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
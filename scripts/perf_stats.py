@@ -0,0 +1,102 @@
+"""
+性能统计工具 - test_http_server.py 与各压测、回放脚本共用的直方图和分位数
+
+    Histogram    固定桶直方图：内存占用只取决于桶的数量，可以分线程记录后合并，
+                 分位数在所在桶内线性插值，不超过观测到的最大值
+    percentile   已排序样本的分位数（最近秩），用于保留全部样本的短时压测
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any
+
+
+def exponential_bounds(start: float, factor: float, limit: float) -> list[float]:
+    """从 start 开始按 factor 倍递增、小于 limit 的桶上界"""
+    bounds: list[float] = []
+    bound = start
+    while bound < limit:
+        bounds.append(round(bound, 3))
+        bound *= factor
+    return bounds
+
+
+# 延迟直方图桶上界（毫秒）：50 µs ~ 30 s，按约 1.25 倍递增
+LATENCY_BOUNDS_MS = exponential_bounds(0.05, 1.25, 30000)
+
+
+def percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Histogram:
+    """固定桶直方图：最后一个桶是 +Inf，值等于上界时落在该桶"""
+
+    def __init__(self, bounds: list[float] = LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        """在所在桶内线性插值估算分位数，不超过观测到的最大值"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index == len(self.bounds):
+                    return self.max
+                lower = self.bounds[index - 1] if index else 0.0
+                value = lower + (self.bounds[index] - lower) * (rank - cumulative) / bucket_count
+                return min(value, self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def cumulative_buckets(self) -> list[tuple[float | None, int]]:
+        """返回 [(上界, 累计计数)]，上界 None 表示 +Inf"""
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + [None], self.counts):
+            cumulative += bucket_count
+            result.append((bound, cumulative))
+        return result
+
+    def to_dict(self, quantiles: tuple[float, ...] = (0.50, 0.95, 0.99), digits: int | None = None) -> dict[str, Any]:
+        """汇总为 JSON；buckets 只列出非空桶，值为到该上界为止的累计计数"""
+        def fmt(value):
+            return round(value, digits) if value is not None and digits is not None else value
+
+        result: dict[str, Any] = {
+            "count": self.count,
+            "sum": fmt(self.sum),
+            "mean": fmt(self.sum / self.count) if self.count else None,
+        }
+        for q in quantiles:
+            result[f"p{q * 100:g}"] = fmt(self.quantile(q))
+        result["max"] = fmt(self.max)
+        result["buckets"] = {
+            ("+Inf" if bound is None else str(bound)): cumulative
+            for (bound, cumulative), bucket_count in zip(self.cumulative_buckets(), self.counts) if bucket_count
+        }
+        return result
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+抓包回放工具 - 回放 test_http_server.py --capture 录制的流量
+
+索引文件和请求体文件都通过 mmap 读取，请求体以 memoryview 切片直接发送，
+不做额外拷贝。可以按原始时间间隔回放，也可以按倍速或尽可能快地回放。
+
+用法：
+    python3 test_http_server.py --capture capture.jsonl        # 录制
+    python3 replay_capture.py capture.jsonl --target http://127.0.0.1:8000 --speed 2
+    python3 replay_capture.py capture.jsonl --target http://192.168.1.100:8000 --speed 0 --concurrency 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import mmap
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+from perf_stats import percentile
+
+
+# 复用的持久连接已被服务器关闭时的错误：请求没有被处理，可以换新连接重发一次
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+# 回放时不沿用的逐跳头部，由 http.client 按新的连接重新生成
+HOP_BY_HOP_HEADERS = {
+    "host",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "keep-alive",
+    "expect",
+    "te",
+    "upgrade",
+    "proxy-connection",
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Replay traffic recorded by test_http_server.py --capture against any HTTP endpoint."
+    )
+    parser.add_argument("capture", help="Capture index file written by --capture (JSONL).")
+    parser.add_argument("--bodies", help="Body sidecar file. Default: <capture>.bodies")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL to replay against.")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed multiplier. 1 = original timing, 2 = twice as fast, 0 = as fast as possible.",
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of sender threads (connections).")
+    parser.add_argument("--loop", type=int, default=1, help="Replay the capture this many times.")
+    parser.add_argument("--limit", type=int, help="Only replay the first N requests.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request socket timeout in seconds.")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON.")
+    return parser
+
+
+def open_mmap(path: Path) -> mmap.mmap | None:
+    """只读映射文件；空文件返回 None（mmap 不支持长度为 0 的映射）"""
+    with path.open("rb") as f:
+        if path.stat().st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def load_entries(index: mmap.mmap | None, limit: int | None) -> list[dict[str, Any]]:
+    entries: list[dict[str, Any]] = []
+    if index is None:
+        return entries
+    for line in iter(index.readline, b""):
+        line = line.strip()
+        if not line:
+            continue
+        entries.append(json.loads(line))
+        if limit is not None and len(entries) >= limit:
+            break
+    return entries
+
+
+class Replayer:
+    """每个发送线程持有一条持久连接，按需重连"""
+
+    def __init__(self, target: str, bodies: memoryview | None, timeout: float):
+        parts = urlsplit(target)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.bodies = bodies
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.lags: list[float] = []
+        self.statuses: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.bytes_sent = 0
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if self.scheme == "https":
+                conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def _reset_connection(self) -> None:
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self.local.conn = None
+        self.local.reused = False
+
+    def send(self, entry: dict[str, Any], due: float) -> None:
+        lag = max(0.0, time.perf_counter() - due)
+        length = entry.get("n", 0)
+        body = None
+        if length and self.bodies is not None:
+            offset = entry["o"]
+            body = self.bodies[offset:offset + length]
+        headers = {name: value for name, value in entry.get("h", []) if name.lower() not in HOP_BY_HOP_HEADERS}
+        if body is not None or entry["m"] in ("POST", "PUT", "PATCH"):
+            headers["Content-Length"] = str(length)
+
+        for attempt in range(2):
+            reused = getattr(self.local, "reused", False)
+            started = time.perf_counter()
+            try:
+                conn = self._connection()
+                conn.request(entry["m"], self.base_path + entry["p"], body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                if response.will_close:
+                    self._reset_connection()
+                else:
+                    self.local.reused = True
+                with self.lock:
+                    self.latencies.append(elapsed)
+                    self.lags.append(lag)
+                    self.statuses[str(response.status)] += 1
+                    self.bytes_sent += length
+                return
+            except (OSError, http.client.HTTPException) as exc:
+                self._reset_connection()
+                # 只有复用的持久连接已被服务器关闭时才换新连接重发一次；超时等其他失败时
+                # 请求可能已被处理，重发会让 POST/PUT/PATCH 执行两次，直接计为错误
+                if attempt == 0 and reused and isinstance(exc, STALE_CONNECTION_ERRORS):
+                    continue
+                with self.lock:
+                    self.errors[type(exc).__name__] += 1
+                return
+
+
+def replay(args: argparse.Namespace) -> dict[str, Any]:
+    capture_path = Path(args.capture)
+    bodies_path = Path(args.bodies) if args.bodies else Path(str(capture_path) + ".bodies")
+
+    index_map = open_mmap(capture_path)
+    bodies_map = open_mmap(bodies_path) if bodies_path.exists() else None
+    entries = load_entries(index_map, args.limit)
+    if not entries:
+        raise SystemExit(f"No requests found in {capture_path}")
+
+    bodies_view = memoryview(bodies_map) if bodies_map is not None else None
+    replayer = Replayer(args.target, bodies_view, args.timeout)
+    first_ts = entries[0]["ts"]
+    capture_span = entries[-1]["ts"] - first_ts
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for round_index in range(args.loop):
+            round_start = time.perf_counter()
+            for entry in entries:
+                due = round_start
+                if args.speed > 0:
+                    due += (entry["ts"] - first_ts) / args.speed
+                    wait = due - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                pool.submit(replayer.send, entry, due)
+            if args.speed > 0 and round_index + 1 < args.loop:
+                # 下一轮从本轮最后一个请求的计划时间之后开始
+                wait = round_start + capture_span / args.speed - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+    duration = time.perf_counter() - started
+
+    latencies = sorted(replayer.latencies)
+    lags = sorted(replayer.lags)
+    completed = len(latencies)
+    summary = {
+        "capture": str(capture_path),
+        "target": args.target,
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "requests": len(entries) * args.loop,
+        "completed": completed,
+        "errors": dict(replayer.errors),
+        "statuses": dict(replayer.statuses),
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(completed / duration, 2) if duration > 0 else None,
+        "upload_mb_per_second": round(replayer.bytes_sent / 1024 / 1024 / duration, 3) if duration > 0 else None,
+        "latency_ms": {
+            name: (round(value * 1000, 3) if value is not None else None)
+            for name, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+        "schedule_lag_ms_p99": round(percentile(lags, 0.99) * 1000, 3) if lags else None,
+    }
+
+    if bodies_view is not None:
+        bodies_view.release()
+    for mapped in (index_map, bodies_map):
+        if mapped is not None:
+            mapped.close()
+    return summary
+
+
+def print_summary(summary: dict[str, Any]) -> None:
+    latency = summary["latency_ms"]
+    print("=" * 60)
+    print(f"回放: {summary['capture']} -> {summary['target']}")
+    print(f"速度: {summary['speed'] or '尽可能快'}  并发: {summary['concurrency']}")
+    print(f"请求: {summary['completed']}/{summary['requests']} 完成  错误: {summary['errors'] or 0}")
+    print(f"状态码: {summary['statuses']}")
+    print(f"耗时: {summary['duration_seconds']} s  吞吐: {summary['requests_per_second']} req/s, "
+          f"{summary['upload_mb_per_second']} MB/s 上传")
+    print(f"延迟: p50={latency['p50']} ms  p95={latency['p95']} ms  p99={latency['p99']} ms  max={latency['max']} ms")
+    print(f"调度滞后 p99: {summary['schedule_lag_ms_p99']} ms")
+    print("=" * 60)
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    summary = replay(args)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
+    return 0 if not summary["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,40 @@ HTTP 测试服务器 - 用于测试 HttpRequestModule
 """
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
 import json
-from urllib.parse import urlparse, parse_qs
+import multiprocessing
+import queue
+import random
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs, unquote
+import mimetypes
 import sys
 import os
 from datetime import datetime
 import re
+import shutil
+import struct
+import tempfile
+import uuid
+import zlib
+
+from perf_stats import Histogram
+
+try:
+    import brotli  # 可选依赖：pip install brotli
+except ImportError:
+    brotli = None
 
 colors = {
     'reset': '\033[0m',
@@ -28,37 +56,1306 @@ UPLOAD_DIR = "uploads"
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
+class TrafficSummary:
+    """按秒汇总请求数、入站字节数和状态码分布（--quiet 模式使用）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.statuses = Counter()
+
+    def record(self, status, bytes_in):
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.statuses[f"{status // 100}xx"] += 1
+
+    def take_line(self, elapsed):
+        """取出当前窗口的汇总行并清零；窗口内没有请求时返回 None"""
+        with self.lock:
+            requests, bytes_in, statuses = self.requests, self.bytes_in, self.statuses
+            self.requests, self.bytes_in, self.statuses = 0, 0, Counter()
+        if requests == 0:
+            return None
+        status_mix = ", ".join(f"{key}: {count}" for key, count in sorted(statuses.items()))
+        return (f"[{datetime.now().strftime('%H:%M:%S')}] {requests / elapsed:.1f} req/s | "
+                f"入站 {bytes_in / 1024 / 1024 / elapsed:.2f} MB/s ({bytes_in} 字节) | {status_mix}")
+
+class ConsoleLogger:
+    """由后台线程批量写终端的日志器
+
+    请求处理线程只把文本放进队列；后台线程每次取出队列中已有的全部内容，
+    合并成一次 write + flush。同一个请求的所有行先缓存在线程本地，
+    请求结束时作为一个整体入队，多线程下不会交错。
+    未启动后台线程时直接同步输出。
+    """
+
+    def __init__(self, batch_size=512, summary_interval=1.0):
+        self.batch_size = batch_size
+        self.summary_interval = summary_interval
+        self.quiet = False
+        self.sample_every = 1
+        self.summary = TrafficSummary()
+        self._local = threading.local()
+        self._sample_counter = 0
+        self._sample_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+
+    def start(self):
+        """启动后台写线程；fork 出的子进程需要各自调用"""
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="console-logger", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """写出队列中剩余的内容并停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._queue = None
+
+    def should_log_request(self):
+        """决定当前请求是否打印详细信息（--quiet 与 --sample N）"""
+        if self.quiet and self.sample_every <= 1:
+            return False
+        if self.sample_every <= 1:
+            return True
+        with self._sample_lock:
+            self._sample_counter += 1
+            return self._sample_counter % self.sample_every == 1
+
+    def begin_request(self):
+        self._local.lines = []
+
+    def end_request(self):
+        lines = getattr(self._local, 'lines', None)
+        self._local.lines = None
+        if lines:
+            self._emit("\n".join(lines))
+
+    def write(self, text):
+        lines = getattr(self._local, 'lines', None)
+        if lines is not None:
+            lines.append(text)
+        else:
+            self._emit(text)
+
+    def _emit(self, text):
+        if self._queue is None:
+            print(text, flush=True)
+        else:
+            self._queue.put(text)
+
+    def _run(self):
+        next_summary = time.monotonic() + self.summary_interval
+        last_summary = time.monotonic()
+        running = True
+        while running:
+            timeout = max(0.0, next_summary - time.monotonic()) if self.quiet else None
+            batch = []
+            try:
+                item = self._queue.get(timeout=timeout)
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if self.quiet and now >= next_summary:
+                line = self.summary.take_line(now - last_summary)
+                if line:
+                    batch.append(line)
+                last_summary = now
+                next_summary = now + self.summary_interval
+
+            if batch:
+                try:
+                    sys.stdout.write("\n".join(batch) + "\n")
+                    sys.stdout.flush()
+                except (OSError, ValueError):
+                    pass
+
+CONSOLE = ConsoleLogger()
+
 def color_print(color, text):
-    print(f"{colors.get(color, '')}{text}{colors['reset']}")
+    CONSOLE.write(f"{colors.get(color, '')}{text}{colors['reset']}")
+
+def log_print(text=""):
+    CONSOLE.write(text)
+
+STATS_PATH = "/__stats"
+
+class ServerStats:
+    """按 (方法, 路径) 统计请求数、状态码、请求体大小和处理耗时
+
+    路径不含查询参数；不同路径超过 max_routes 后归入 "__other__"，
+    保证长时间压测时内存占用有上限。
+    请求体和响应体分别记录线上（压缩后）与原始（解压后）字节数，
+    用于衡量压缩节省的流量。
+    """
+
+    BODY_SIZE_BOUNDS = [0, 256, 1024, 4096, 16384, 65536, 262144, 1048576,
+                        4194304, 16777216, 67108864, 268435456, 1073741824]
+    HANDLER_TIME_BOUNDS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+    # 慢客户端与超大请求体保护的计数项
+    PROTECTION_EVENTS = ("idle_timeout", "header_timeout", "body_timeout", "body_too_large")
+
+    def __init__(self, max_routes=200):
+        self.max_routes = max_routes
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.routes = {}
+            self.events = Counter()
+
+    def record_event(self, name):
+        with self.lock:
+            self.events[name] += 1
+
+    def _route(self, method, path):
+        key = (method, path)
+        route = self.routes.get(key)
+        if route is None:
+            if len(self.routes) >= self.max_routes:
+                key = (method, "__other__")
+                route = self.routes.get(key)
+            if route is None:
+                route = {
+                    "requests": 0,
+                    "statuses": Counter(),
+                    "response_bytes": 0,
+                    "response_raw_bytes": 0,
+                    "request_wire_bytes": 0,
+                    "request_raw_bytes": 0,
+                    "compressed_requests": 0,
+                    "compressed_responses": 0,
+                    "body_bytes": Histogram(self.BODY_SIZE_BOUNDS),
+                    "handler_seconds": Histogram(self.HANDLER_TIME_BOUNDS),
+                }
+                self.routes[key] = route
+        return route
+
+    def record(self, method, path, status, bytes_in, bytes_out, elapsed,
+               wire_in=None, raw_out=None, request_encoding=None, response_encoding=None):
+        """bytes_in/raw_out 为原始字节数，wire_in/bytes_out 为线上字节数（未压缩时两者相同）"""
+        with self.lock:
+            route = self._route(method, path)
+            route["requests"] += 1
+            route["statuses"][str(status)] += 1
+            route["response_bytes"] += bytes_out
+            route["response_raw_bytes"] += bytes_out if raw_out is None else raw_out
+            route["request_wire_bytes"] += bytes_in if wire_in is None else wire_in
+            route["request_raw_bytes"] += bytes_in
+            if request_encoding:
+                route["compressed_requests"] += 1
+            if response_encoding:
+                route["compressed_responses"] += 1
+            route["body_bytes"].observe(bytes_in)
+            route["handler_seconds"].observe(elapsed)
+
+    def to_dict(self):
+        with self.lock:
+            routes = []
+            for (method, path), route in sorted(self.routes.items()):
+                routes.append({
+                    "method": method,
+                    "path": path,
+                    "requests": route["requests"],
+                    "statuses": dict(route["statuses"]),
+                    "response_bytes": route["response_bytes"],
+                    "compression": {
+                        key: route[key] for key in (
+                            "request_wire_bytes", "request_raw_bytes", "compressed_requests",
+                            "response_raw_bytes", "compressed_responses",
+                        )
+                    },
+                    "body_bytes": route["body_bytes"].to_dict(),
+                    "handler_seconds": route["handler_seconds"].to_dict(),
+                })
+            uptime = time.time() - self.started_at
+            events = Counter(self.events)
+        total = sum(route["requests"] for route in routes)
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(uptime, 3),
+            "total_requests": total,
+            "requests_per_second": round(total / uptime, 3) if uptime > 0 else 0,
+            "compression": self._compression_totals(routes),
+            "protection": {name: events[name] for name in self.PROTECTION_EVENTS},
+            "routes": routes,
+        }
+
+    @staticmethod
+    def _compression_totals(routes):
+        """汇总所有路由的线上/原始字节数和压缩节省的流量"""
+        def direction(wire, raw):
+            return {
+                "wire_bytes": wire,
+                "raw_bytes": raw,
+                "saved_bytes": raw - wire,
+                "ratio": round(wire / raw, 4) if raw else None,
+            }
+        request_wire = sum(route["compression"]["request_wire_bytes"] for route in routes)
+        request_raw = sum(route["compression"]["request_raw_bytes"] for route in routes)
+        response_wire = sum(route["response_bytes"] for route in routes)
+        response_raw = sum(route["compression"]["response_raw_bytes"] for route in routes)
+        return {
+            "request": direction(request_wire, request_raw),
+            "response": direction(response_wire, response_raw),
+        }
+
+    def to_prometheus(self):
+        """导出 Prometheus 文本格式"""
+        def labels(method, path, **extra):
+            items = [("method", method), ("path", path)] + list(extra.items())
+            escaped = []
+            for key, value in items:
+                value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                escaped.append(f'{key}="{value}"')
+            return "{" + ",".join(escaped) + "}"
+
+        lines = [
+            "# HELP vflow_test_http_requests_total Requests handled, by method, path and status.",
+            "# TYPE vflow_test_http_requests_total counter",
+        ]
+        with self.lock:
+            routes = sorted(self.routes.items())
+            events = Counter(self.events)
+            for (method, path), route in routes:
+                for status, count in sorted(route["statuses"].items()):
+                    lines.append(f"vflow_test_http_requests_total{labels(method, path, status=status)} {count}")
+
+            lines.append("# HELP vflow_test_http_response_bytes_total Response bytes sent.")
+            lines.append("# TYPE vflow_test_http_response_bytes_total counter")
+            for (method, path), route in routes:
+                lines.append(f"vflow_test_http_response_bytes_total{labels(method, path)} {route['response_bytes']}")
+
+            lines.append("# HELP vflow_test_http_body_bytes_total Body bytes by direction, on the wire (compressed) and raw.")
+            lines.append("# TYPE vflow_test_http_body_bytes_total counter")
+            for (method, path), route in routes:
+                for direction, form, key in (
+                    ("request", "wire", "request_wire_bytes"),
+                    ("request", "raw", "request_raw_bytes"),
+                    ("response", "wire", "response_bytes"),
+                    ("response", "raw", "response_raw_bytes"),
+                ):
+                    lines.append(f"vflow_test_http_body_bytes_total"
+                                 f"{labels(method, path, direction=direction, form=form)} {route[key]}")
+
+            lines.append("# HELP vflow_test_http_compressed_total Requests/responses with a Content-Encoding.")
+            lines.append("# TYPE vflow_test_http_compressed_total counter")
+            for (method, path), route in routes:
+                for direction, key in (("request", "compressed_requests"), ("response", "compressed_responses")):
+                    lines.append(f"vflow_test_http_compressed_total{labels(method, path, direction=direction)} {route[key]}")
+
+            for name, key, help_text in (
+                ("vflow_test_http_request_body_bytes", "body_bytes", "Request body size."),
+                ("vflow_test_http_handler_seconds", "handler_seconds", "Time spent handling a request."),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, path), route in routes:
+                    histogram = route[key]
+                    for bound, count in histogram.cumulative_buckets():
+                        le = "+Inf" if bound is None else str(bound)
+                        lines.append(f"{name}_bucket{labels(method, path, le=le)} {count}")
+                    lines.append(f"{name}_sum{labels(method, path)} {histogram.sum}")
+                    lines.append(f"{name}_count{labels(method, path)} {histogram.count}")
+
+        lines.append("# HELP vflow_test_http_protection_events_total Timeouts and rejected oversized bodies.")
+        lines.append("# TYPE vflow_test_http_protection_events_total counter")
+        for name in self.PROTECTION_EVENTS:
+            lines.append(f'vflow_test_http_protection_events_total{{event="{name}"}} {events[name]}')
+        return "\n".join(lines) + "\n"
+
+STATS = ServerStats()
+
+GENERATED_CHUNK = bytes(range(256)) * 256  # 64 KB 的可重复填充数据
+
+class ResponseSimulator:
+    """模拟慢响应、状态码序列和大响应体
+
+    每个请求的模拟参数来自查询参数，未指定的使用启动参数中的默认值：
+      __delay=毫秒        固定延迟
+      __jitter=毫秒       在延迟基础上增加 ±jitter 的随机抖动
+      __status=503,503,200  状态码序列：同一序列每次请求前进一步，结束后停留在最后一个
+      __seq=名称          状态码序列的标识（默认按路径和序列内容区分）
+      __body_mb=N         返回 N MB 的生成数据，按块流式写出
+      __chunked=1         生成数据使用 Transfer-Encoding: chunked 而不是 Content-Length
+
+    状态码限定在 200-599；204/304 不能带响应体，不能和 __body_mb 同时使用。
+    序列位置最多记录 MAX_SEQUENCES 个，超出时淘汰最久未使用的序列（从头开始）。
+    """
+
+    MAX_SEQUENCES = 1024
+
+    def __init__(self):
+        self.defaults = {}
+        self.lock = threading.Lock()
+        self.sequence_positions = OrderedDict()
+
+    def plan(self, path, query):
+        """计算当前请求的模拟方案；参数格式错误时抛出 ValueError"""
+        def param(name):
+            values = query.get(f'__{name}')
+            return values[0] if values else self.defaults.get(name)
+
+        delay_ms = float(param('delay') or 0)
+        jitter_ms = float(param('jitter') or 0)
+        if jitter_ms:
+            delay_ms += random.uniform(-jitter_ms, jitter_ms)
+
+        status_spec = param('status')
+        statuses, body_bytes = self.parse_status_and_body(status_spec, param('body_mb'))
+
+        status = None
+        if statuses:
+            key = param('seq') or f"{path}|{status_spec}"
+            status = self.next_status(key, statuses)
+
+        return {
+            "delay": max(0.0, delay_ms) / 1000,
+            "status": status,
+            "body_bytes": body_bytes,
+            "chunked": str(param('chunked') or '0').lower() in ('1', 'true'),
+        }
+
+    @staticmethod
+    def parse_status_and_body(status_spec, body_mb):
+        """解析并校验状态码序列和生成的响应体大小，返回 (状态码列表, 字节数或 None)"""
+        statuses = [int(code) for code in str(status_spec or '').split(',') if code.strip()]
+        if any(not 200 <= code <= 599 for code in statuses):
+            raise ValueError("simulated status must be within 200-599")
+        body_bytes = int(float(body_mb) * 1024 * 1024) if body_mb not in (None, '') else None
+        if body_bytes is not None and body_bytes < 0:
+            raise ValueError("simulated body size must not be negative")
+        if body_bytes is not None and any(code in BODYLESS_STATUSES for code in statuses):
+            raise ValueError("204/304 responses cannot carry a body")
+        return statuses, body_bytes
+
+    def next_status(self, key, statuses):
+        with self.lock:
+            position = self.sequence_positions.pop(key, 0)
+            self.sequence_positions[key] = position + 1
+            if len(self.sequence_positions) > self.MAX_SEQUENCES:
+                self.sequence_positions.popitem(last=False)
+        return statuses[min(position, len(statuses) - 1)]
+
+SIMULATOR = ResponseSimulator()
+
+# 不能带响应体的状态码（1xx 不在模拟范围内）
+BODYLESS_STATUSES = (204, 304)
+
+# 流式响应与长轮询的保留路由
+SSE_PATH = "/__sse"
+NDJSON_PATH = "/__ndjson"
+LONGPOLL_PATH = "/__longpoll"
+
+def parse_stream_params(query):
+    """解析流式响应的查询参数；格式错误时抛出 ValueError
+
+      rate=N       每秒事件数 (默认 10，0 表示不限速)
+      size=N       每个事件的 JSON 大小 (字节，默认 64)
+      count=N      事件总数 (默认 0，不限)
+      duration=N   持续秒数 (默认 0，不限)；count 和 duration 都为 0 时一直发送到客户端断开
+      event=NAME   SSE 事件类型 (默认不写 event 字段，即 message)
+      retry_ms=N   SSE 重连间隔，在流开头发送 retry 字段
+    """
+    def param(name, default, convert=float):
+        values = query.get(name)
+        return convert(values[0]) if values and values[0] != '' else default
+
+    params = {
+        "rate": param('rate', 10.0),
+        "size": param('size', 64, int),
+        "count": param('count', 0, int),
+        "duration": param('duration', 0.0),
+        "event": param('event', None, str),
+        "retry_ms": param('retry_ms', None, int),
+    }
+    if params["rate"] < 0 or params["size"] < 0 or params["count"] < 0 or params["duration"] < 0:
+        raise ValueError("stream parameters must not be negative")
+    return params
+
+def build_stream_event(seq, size):
+    """生成一个事件的 JSON，用 pad 字段补齐到 size 字节左右"""
+    event = {"seq": seq, "ts": round(time.time(), 6), "pad": ""}
+    base = len(json.dumps(event, separators=(',', ':')))
+    event["pad"] = "x" * max(0, size - base)
+    return json.dumps(event, separators=(',', ':'))
+
+class LongPollHub:
+    """长轮询频道：GET 等待频道的新消息或超时，POST 向频道发布消息
+
+    每个频道只保留最新一条消息和版本号。等待时带上 since=版本号，
+    两次轮询之间发布的消息也不会丢失。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.channels = {}  # 频道 -> (版本号, 消息)
+        self.waiters = Counter()
+
+    def wait(self, channel, timeout, since=None):
+        """返回 (版本号, 消息)；超时返回 (当前版本号, None)"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            version, message = self.channels.get(channel, (0, None))
+            if since is None:
+                since = version
+            self.waiters[channel] += 1
+            try:
+                while True:
+                    version, message = self.channels.get(channel, (0, None))
+                    if version > since:
+                        return version, message
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return version, None
+                    self.condition.wait(remaining)
+            finally:
+                self.waiters[channel] -= 1
+                if self.waiters[channel] <= 0:
+                    del self.waiters[channel]
+
+    def publish(self, channel, message):
+        """发布消息并唤醒等待者，返回 (新版本号, 被唤醒的等待者数量)"""
+        with self.condition:
+            version = self.channels.get(channel, (0, None))[0] + 1
+            self.channels[channel] = (version, message)
+            waiting = self.waiters[channel]
+            self.condition.notify_all()
+        return version, waiting
+
+LONG_POLL = LongPollHub()
+
+# WebSocket 保留路由：/__ws/echo、/__ws/broadcast?room=、/__ws/push?rate=&size=&count=&duration=
+WS_PREFIX = "/__ws"
+WS_MODES = ("echo", "broadcast", "push")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+WS_OP_CONTINUATION = 0x0
+WS_OP_TEXT = 0x1
+WS_OP_BINARY = 0x2
+WS_OP_CLOSE = 0x8
+WS_OP_PING = 0x9
+WS_OP_PONG = 0xA
+
+class WebSocketClosed(Exception):
+    """连接已断开或因协议错误关闭；code 为发送给对端的关闭码"""
+
+    def __init__(self, code=1006, reason=""):
+        super().__init__(reason or f"closed ({code})")
+        self.code = code
+
+def encode_ws_frame(opcode, payload):
+    """编码一个服务端帧（不加掩码，FIN=1）"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+class WebSocketStats:
+    """WebSocket 连接数、消息数、字节数、丢弃数和延迟分布
+
+    send_seconds 为消息从进入发送队列到写入套接字的耗时（包含背压等待），
+    round_trip_seconds 为 push 模式下客户端回传消息的往返耗时。
+    """
+
+    LATENCY_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                      0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.connections = Counter()
+            self.active = getattr(self, 'active', 0)
+            self.messages_in = 0
+            self.messages_out = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.dropped = 0
+            self.send_seconds = Histogram(self.LATENCY_BOUNDS)
+            self.round_trip_seconds = Histogram(self.LATENCY_BOUNDS)
+
+    def opened(self, mode):
+        with self.lock:
+            self.connections[mode] += 1
+            self.active += 1
+
+    def closed(self):
+        with self.lock:
+            self.active -= 1
+
+    def received(self, size):
+        with self.lock:
+            self.messages_in += 1
+            self.bytes_in += size
+
+    def sent(self, size, latency):
+        with self.lock:
+            self.messages_out += 1
+            self.bytes_out += size
+            self.send_seconds.observe(latency)
+
+    def dropped_message(self):
+        with self.lock:
+            self.dropped += 1
+
+    def round_trip(self, seconds):
+        with self.lock:
+            self.round_trip_seconds.observe(seconds)
+
+    def to_dict(self):
+        with self.lock:
+            uptime = time.time() - self.started_at
+            return {
+                "connections": dict(self.connections),
+                "active": self.active,
+                "messages_in": self.messages_in,
+                "messages_out": self.messages_out,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "dropped": self.dropped,
+                "messages_out_per_second": round(self.messages_out / uptime, 3) if uptime > 0 else 0,
+                "mb_out_per_second": round(self.bytes_out / 1024 / 1024 / uptime, 3) if uptime > 0 else 0,
+                "send_seconds": self.send_seconds.to_dict(),
+                "round_trip_seconds": self.round_trip_seconds.to_dict(),
+            }
+
+    def to_prometheus(self):
+        with self.lock:
+            lines = [
+                "# HELP vflow_test_ws_connections_total WebSocket connections accepted, by mode.",
+                "# TYPE vflow_test_ws_connections_total counter",
+            ]
+            for mode, count in sorted(self.connections.items()):
+                lines.append(f'vflow_test_ws_connections_total{{mode="{mode}"}} {count}')
+            lines += [
+                "# HELP vflow_test_ws_active_connections Open WebSocket connections.",
+                "# TYPE vflow_test_ws_active_connections gauge",
+                f"vflow_test_ws_active_connections {self.active}",
+                "# HELP vflow_test_ws_messages_total WebSocket data messages, by direction.",
+                "# TYPE vflow_test_ws_messages_total counter",
+                f'vflow_test_ws_messages_total{{direction="in"}} {self.messages_in}',
+                f'vflow_test_ws_messages_total{{direction="out"}} {self.messages_out}',
+                "# HELP vflow_test_ws_bytes_total WebSocket payload bytes, by direction.",
+                "# TYPE vflow_test_ws_bytes_total counter",
+                f'vflow_test_ws_bytes_total{{direction="in"}} {self.bytes_in}',
+                f'vflow_test_ws_bytes_total{{direction="out"}} {self.bytes_out}',
+                "# HELP vflow_test_ws_dropped_total Broadcast messages dropped because a send queue was full.",
+                "# TYPE vflow_test_ws_dropped_total counter",
+                f"vflow_test_ws_dropped_total {self.dropped}",
+            ]
+            for name, histogram, help_text in (
+                ("vflow_test_ws_send_seconds", self.send_seconds, "Time from enqueue to socket write."),
+                ("vflow_test_ws_round_trip_seconds", self.round_trip_seconds, "Push round trip reported by clients."),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for bound, count in histogram.cumulative_buckets():
+                    le = "+Inf" if bound is None else str(bound)
+                    lines.append(f'{name}_bucket{{le="{le}"}} {count}')
+                lines.append(f"{name}_sum {histogram.sum}")
+                lines.append(f"{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+WS_STATS = WebSocketStats()
+
+class WebSocketConnection:
+    """RFC 6455 服务端连接
+
+    读取在请求处理线程中进行；写入由独立线程从有界发送队列中取出已编码的帧。
+    send() 在队列满时阻塞，背压会一直传递到生产者（push 的发送线程、
+    echo 的读取循环进而是客户端的 TCP 窗口）；广播使用 block=False，
+    队列满时丢弃发给该订阅者的消息并计数，慢订阅者不会拖慢其他人。
+    """
+
+    MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, sock, rfile, queue_size=256):
+        self.sock = sock
+        self.rfile = rfile
+        self.outbox = queue.Queue(maxsize=max(1, queue_size))
+        self.closed = threading.Event()
+        self.close_sent = False
+        self.close_lock = threading.Lock()
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped = 0
+        self.writer = threading.Thread(target=self._write_loop, name="ws-writer", daemon=True)
+        self.writer.start()
+
+    def _read_exact(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise WebSocketClosed(1006, "connection lost")
+        return data
+
+    def _read_frame(self):
+        first, second = self._read_exact(2)
+        if first & 0x70:
+            raise WebSocketClosed(1002, "reserved bits set")
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if not second & 0x80:
+            raise WebSocketClosed(1002, "client frames must be masked")
+        if length == 126:
+            length = struct.unpack("!H", self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read_exact(8))[0]
+        if opcode >= WS_OP_CLOSE and (length > 125 or not fin):
+            raise WebSocketClosed(1002, "invalid control frame")
+        if length > self.MAX_MESSAGE_BYTES:
+            raise WebSocketClosed(1009, "message too big")
+        mask = self._read_exact(4)
+        payload = self._read_exact(length)
+        if length:
+            # 整块异或去掉掩码，比逐字节处理快得多
+            repeated = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(length, 'little')
+        return fin, opcode, payload
+
+    def receive(self):
+        """读取下一条完整的数据消息，返回 (opcode, payload)；对端正常关闭时返回 (None, None)
+
+        ping/pong/close 控制帧在这里处理；协议错误时发送对应的关闭码并抛出 WebSocketClosed。
+        """
+        message_opcode = None
+        fragments = bytearray()
+        try:
+            while True:
+                fin, opcode, payload = self._read_frame()
+                if opcode == WS_OP_PING:
+                    self.send_control(WS_OP_PONG, payload)
+                    continue
+                if opcode == WS_OP_PONG:
+                    continue
+                if opcode == WS_OP_CLOSE:
+                    code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else 1000
+                    self.close(code if code in (1000, 1001) else 1000)
+                    return None, None
+                if opcode == WS_OP_CONTINUATION:
+                    if message_opcode is None:
+                        raise WebSocketClosed(1002, "unexpected continuation frame")
+                elif opcode in (WS_OP_TEXT, WS_OP_BINARY):
+                    if message_opcode is not None:
+                        raise WebSocketClosed(1002, "expected continuation frame")
+                    message_opcode = opcode
+                else:
+                    raise WebSocketClosed(1002, f"unknown opcode {opcode}")
+                if fin and not fragments:
+                    data = payload
+                else:
+                    fragments += payload
+                    if len(fragments) > self.MAX_MESSAGE_BYTES:
+                        raise WebSocketClosed(1009, "message too big")
+                    if not fin:
+                        continue
+                    data = bytes(fragments)
+                self.messages_in += 1
+                self.bytes_in += len(data)
+                WS_STATS.received(len(data))
+                return message_opcode, data
+        except WebSocketClosed as exc:
+            if exc.code != 1006:
+                self.close(exc.code, str(exc))
+            raise
+        except OSError as exc:
+            raise WebSocketClosed(1006, str(exc)) from exc
+
+    def send(self, opcode, payload, block=True):
+        """把数据消息放入发送队列；block=False 且队列已满时丢弃并返回 False"""
+        return self.send_frame(encode_ws_frame(opcode, payload), len(payload), block)
+
+    def send_frame(self, frame, size, block=True):
+        """发送已编码的帧（广播时同一个帧在所有订阅者之间共享）"""
+        item = (frame, size, time.perf_counter())
+        if not block:
+            try:
+                self.outbox.put_nowait(item)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                WS_STATS.dropped_message()
+                return False
+        while not self.closed.is_set():
+            try:
+                self.outbox.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def send_control(self, opcode, payload=b''):
+        try:
+            self.outbox.put((encode_ws_frame(opcode, payload), None, time.perf_counter()), timeout=1)
+        except queue.Full:
+            pass
 
-def parse_multipart_data(content_type, body):
-    """解析 multipart/form-data 数据"""
+    def close(self, code=1000, reason=""):
+        """发送关闭帧（只发送一次）并等待发送线程写完队列中的数据"""
+        with self.close_lock:
+            if self.close_sent:
+                return
+            self.close_sent = True
+        self.send_control(WS_OP_CLOSE, struct.pack("!H", code) + reason.encode('utf-8')[:120])
+        try:
+            self.outbox.put(None, timeout=1)
+        except queue.Full:
+            self.closed.set()
+        self.writer.join(timeout=5)
+
+    def _write_loop(self):
+        try:
+            while True:
+                item = self.outbox.get()
+                if item is None:
+                    break
+                frame, size, enqueued = item
+                self.sock.sendall(frame)
+                if size is not None:
+                    self.messages_out += 1
+                    self.bytes_out += size
+                    WS_STATS.sent(size, time.perf_counter() - enqueued)
+        except OSError:
+            pass
+        finally:
+            self.closed.set()
+
+class WebSocketHub:
+    """广播房间：一条消息只编码一次，非阻塞地放入每个订阅者的发送队列"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rooms = {}
+
+    def join(self, room, connection):
+        with self.lock:
+            self.rooms.setdefault(room, set()).add(connection)
+
+    def leave(self, room, connection):
+        with self.lock:
+            members = self.rooms.get(room)
+            if members is not None:
+                members.discard(connection)
+                if not members:
+                    del self.rooms[room]
+
+    def broadcast(self, room, opcode, payload):
+        """返回 (投递数, 丢弃数)"""
+        frame = encode_ws_frame(opcode, payload)
+        with self.lock:
+            members = list(self.rooms.get(room, ()))
+        delivered = 0
+        for member in members:
+            if member.send_frame(frame, len(payload), block=False):
+                delivered += 1
+        return delivered, len(members) - delivered
+
+WS_HUB = WebSocketHub()
+
+class Template:
+    """响应模板：{{名称}} 或 {{名称|默认值}} 占位符，加载时预先拆分
+
+    可用的名称：正则路由的命名分组、method、path、request_id、body（请求体文本）、
+    now（Unix 时间戳）、query.参数名、header.头部名。
+    """
+
+    PATTERN = re.compile(r'\{\{\s*([\w.\-]+)\s*(?:\|([^}]*))?\}\}')
+
+    def __init__(self, text):
+        self.parts = []
+        position = 0
+        for match in self.PATTERN.finditer(text):
+            if match.start() > position:
+                self.parts.append(text[position:match.start()])
+            self.parts.append((match.group(1), match.group(2) or ''))
+            position = match.end()
+        if position < len(text):
+            self.parts.append(text[position:])
+        self.static = all(isinstance(part, str) for part in self.parts)
+        self.text = text
+
+    def render(self, context):
+        if self.static:
+            return self.text
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, str):
+                rendered.append(part)
+            else:
+                value = context.get(part[0])
+                rendered.append(part[1] if value is None else str(value))
+        return "".join(rendered)
+
+class TemplateContext:
+    """按名称取模板变量的值；取不到时返回 None（使用占位符中的默认值）"""
+
+    def __init__(self, method, path, query, headers, groups, request_id, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.groups = groups
+        self.request_id = request_id
+        self.body = body
+
+    def get(self, name):
+        if name in self.groups:
+            return self.groups[name]
+        if name.startswith('query.'):
+            values = self.query.get(name[len('query.'):])
+            return values[0] if values else None
+        if name.startswith('header.'):
+            return self.headers.get(name[len('header.'):])
+        if name == 'method':
+            return self.method
+        if name == 'path':
+            return self.path
+        if name == 'request_id':
+            return self.request_id
+        if name == 'now':
+            return round(time.time(), 3)
+        if name == 'body':
+            return self.body.decode('utf-8', errors='replace') if self.body is not None else None
+        return None
+
+def compile_body_template(value):
+    """把 JSON 响应体中的字符串编译为 Template；返回 (编译结果, 是否包含占位符)"""
+    if isinstance(value, str):
+        template = Template(value)
+        return template, not template.static
+    if isinstance(value, dict):
+        items = {key: compile_body_template(item) for key, item in value.items()}
+        return {key: item[0] for key, item in items.items()}, any(item[1] for item in items.values())
+    if isinstance(value, list):
+        items = [compile_body_template(item) for item in value]
+        return [item[0] for item in items], any(item[1] for item in items)
+    return value, False
+
+def render_body_template(value, context):
+    if isinstance(value, Template):
+        return value.render(context)
+    if isinstance(value, dict):
+        return {key: render_body_template(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_body_template(item, context) for item in value]
+    return value
+
+class MockRoute:
+    """一条模拟路由：匹配条件和预编译的响应"""
+
+    def __init__(self, index, spec, base_dir):
+        kinds = [kind for kind in ("path", "prefix", "regex") if kind in spec]
+        if len(kinds) != 1:
+            raise ValueError(f"route #{index}: exactly one of path/prefix/regex is required")
+        self.index = index
+        self.kind = kinds[0]
+        self.pattern = spec[self.kind]
+        self.regex = re.compile(self.pattern) if self.kind == "regex" else None
+        methods = spec.get("method", "*")
+        methods = [methods] if isinstance(methods, str) else methods
+        self.methods = None if "*" in methods else {method.upper() for method in methods}
+        self.status = int(spec.get("status", 200))
+        self.delay = float(spec.get("delay_ms", 0)) / 1000
+        self.jitter = float(spec.get("jitter_ms", 0)) / 1000
+        self.headers = [(name, Template(str(value))) for name, value in spec.get("headers", {}).items()]
+        self.files = []
+
+        if "body_file" in spec:
+            body_path = os.path.join(base_dir, spec["body_file"])
+            with open(body_path, 'rb') as f:
+                self.static_body = f.read()
+            self.files.append(body_path)
+            self.body = None
+            self.content_type = spec.get("content_type") or mimetypes.guess_type(body_path)[0] or 'application/octet-stream'
+            return
+
+        body = spec.get("body")
+        self.is_json = not isinstance(body, str)
+        self.content_type = spec.get("content_type") or (
+            'application/json' if self.is_json else 'text/plain; charset=utf-8')
+        self.body, templated = compile_body_template(body)
+        self.static_body = None
+        if not templated:
+            # 不含占位符的响应体在加载时序列化一次
+            self.static_body = (json.dumps(body, ensure_ascii=False) if self.is_json else body).encode('utf-8')
+
+    def allows(self, method):
+        return self.methods is None or method in self.methods
+
+    def render_body(self, context):
+        if self.static_body is not None:
+            return self.static_body
+        rendered = render_body_template(self.body, context)
+        return (json.dumps(rendered, ensure_ascii=False) if self.is_json else rendered).encode('utf-8')
+
+def has_top_level_alternation(pattern):
+    """正则在最外层（不在分组和字符类中）是否有 |"""
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+def regex_literal_prefix(pattern):
+    """正则开头的字面前缀，用于按前缀筛选候选正则；无法确定时返回空字符串
+
+    最外层有 | 的（如 /v1|/v2）或以分组、内联标志开头的（如 (?i)/api）没有公共字面前缀，
+    返回空字符串，放进每次都检查的桶。
+    """
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    if pattern.startswith('(') or has_top_level_alternation(pattern):
+        return ""
+    prefix = []
+    for char in pattern:
+        if char in '.^$*+?{}[]\\|()':
+            # 量词作用于前一个字符，该字符不能算进前缀
+            if char in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+class CompiledRoutes:
+    """编译后的路由表，匹配顺序：精确路由 > 正则路由（按配置顺序）> 最长前缀路由
+
+    精确路由是一次字典查找；前缀路由和正则路由按（字面）前缀分桶，
+    只对路径的各个长度的前缀查桶，查找次数取决于不同前缀长度的数量而不是路由数量。
+    正则使用 fullmatch 匹配路径（不含查询参数）。
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.exact = {}
+        self.prefixes = {}
+        self.regex_buckets = {}
+        for route in routes:
+            if route.kind == "path":
+                self.exact.setdefault(route.pattern, []).append(route)
+            elif route.kind == "prefix":
+                self.prefixes.setdefault(route.pattern, []).append(route)
+            else:
+                self.regex_buckets.setdefault(regex_literal_prefix(route.pattern), []).append(route)
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes}, reverse=True)
+        self.regex_lengths = sorted({len(prefix) for prefix in self.regex_buckets}, reverse=True)
+
+    def counts(self):
+        return Counter(route.kind for route in self.routes)
+
+    def match(self, method, path):
+        """返回 (路由, 正则命名分组)；没有匹配时返回 None"""
+        for route in self.exact.get(path, ()):
+            if route.allows(method):
+                return route, {}
+
+        candidates = []
+        for length in self.regex_lengths:
+            if length <= len(path):
+                candidates.extend(self.regex_buckets.get(path[:length], ()))
+        for route in sorted(candidates, key=lambda item: item.index):
+            if route.allows(method):
+                match = route.regex.fullmatch(path)
+                if match:
+                    return route, match.groupdict()
+
+        for length in self.prefix_lengths:
+            if length <= len(path):
+                for route in self.prefixes.get(path[:length], ()):
+                    if route.allows(method):
+                        return route, {}
+        return None
+
+class MockRouteTable:
+    """从 JSON 配置文件加载的模拟路由表，文件变化时自动重新加载
+
+    配置格式：
+      {"routes": [
+        {"method": "GET", "path": "/api/user", "body": {"name": "vFlow"}},
+        {"regex": "/api/users/(?P<id>\\d+)", "body": {"id": "{{id}}", "page": "{{query.page|1}}"}},
+        {"prefix": "/static/", "status": 200, "headers": {"Cache-Control": "no-cache"},
+         "body_file": "static.html", "delay_ms": 100, "jitter_ms": 20}
+      ]}
+    body 为字符串时按文本返回，否则按 JSON 返回；body_file 相对于配置文件所在目录。
+    后台线程按修改时间轮询配置文件和 body_file，重新加载失败时保留旧的路由表。
+    """
+
+    def __init__(self):
+        self.path = None
+        self.table = None
+        self.signature = None
+        self.poll_interval = 1.0
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.table is not None
+
+    def _signature(self, files):
+        signature = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def load(self, path):
+        """加载并编译配置文件；格式错误时抛出 ValueError 或 OSError"""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        specs = config.get("routes", []) if isinstance(config, dict) else config
+        base_dir = os.path.dirname(os.path.abspath(path))
+        try:
+            routes = [MockRoute(index, spec, base_dir) for index, spec in enumerate(specs)]
+        except re.error as exc:
+            raise ValueError(f"invalid regex: {exc}") from exc
+        files = [path] + [file for route in routes for file in route.files]
+        self.path = path
+        self.signature = self._signature(files)
+        self.table = CompiledRoutes(routes)
+        return self.table
+
+    def reload_if_changed(self):
+        files = [entry[0] for entry in self.signature]
+        if self._signature(files) == self.signature:
+            return
+        try:
+            table = self.load(self.path)
+        except (OSError, ValueError) as exc:
+            # 记下新签名，避免同一个错误每次轮询都重复打印
+            self.signature = self._signature(files)
+            color_print('red', f"❌ 重新加载模拟路由失败，继续使用旧的路由表: {exc}")
+            return
+        color_print('green', f"🔄 已重新加载模拟路由: {self.describe(table)}")
+
+    @staticmethod
+    def describe(table):
+        counts = table.counts()
+        return (f"{len(table.routes)} 条 (精确 {counts['path']}, 前缀 {counts['prefix']}, "
+                f"正则 {counts['regex']})")
+
+    def start_watching(self):
+        """启动轮询线程；fork 出的子进程需要各自调用"""
+        if self.table is None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="routes-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.reload_if_changed()
+
+    def match(self, method, path):
+        table = self.table
+        return table.match(method, path) if table is not None else None
+
+ROUTES = MockRouteTable()
+
+# /files/... 路由对应的本地目录（默认与上传目录相同，便于回传已上传的文件）
+FILES_PREFIX = "/files"
+FILES_DIR = UPLOAD_DIR
+
+def resolve_served_file(url_path):
+    """把 /files/... 路径映射到 FILES_DIR 下的真实路径；越界时返回 None"""
+    relative = unquote(url_path[len(FILES_PREFIX):]).lstrip('/')
+    root = os.path.realpath(FILES_DIR)
+    target = os.path.realpath(os.path.join(root, relative))
+    if target != root and not target.startswith(root + os.sep):
+        return None
+    return target
+
+def parse_byte_range(header, size):
+    """解析单个 Range: bytes=... 区间，返回 (起始, 结束)（含结束位置）
+
+    头部缺失、格式不支持或包含多个区间时返回 None（按完整内容响应）；
+    区间无法满足时抛出 ValueError（响应 416）。
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[len('bytes='):].strip().partition('-')
+    if not all(text == '' or text.isdigit() for text in (start_text, end_text)):
+        return None
+    if start_text == '':
+        # 后缀区间：bytes=-N 表示最后 N 个字节
+        if end_text == '':
+            return None
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise ValueError("unsatisfiable suffix range")
+        return max(0, size - suffix), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+MULTIPART_CHUNK_SIZE = 64 * 1024
+
+class MultipartStreamReader:
+    """增量扫描 multipart/form-data 边界的读取器
+
+    每次从输入流读取固定大小的块，缓冲区中最多只保留一个块加上
+    一个边界长度的数据，因此内存占用与请求体大小无关。
+    content_length 为 None 时（chunked 请求体）一直读取到流结束。
+    """
+
+    def __init__(self, stream, boundary, content_length, chunk_size=MULTIPART_CHUNK_SIZE):
+        self.stream = stream
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        # 在开头补一个 CRLF，使第一个边界与后续边界的格式一致
+        self.buffer = bytearray(b'\r\n')
+        self.delimiter = b'\r\n--' + boundary
+
+    def _fill(self):
+        """从输入流再读取一块数据，流结束时返回 False"""
+        if self.remaining is None:
+            chunk = self.stream.read(self.chunk_size)
+        elif self.remaining > 0:
+            chunk = self.stream.read(min(self.chunk_size, self.remaining))
+        else:
+            return False
+        if not chunk:
+            self.remaining = 0
+            return False
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def _find(self, marker):
+        """在缓冲区中查找标记，必要时继续读取"""
+        start = 0
+        while True:
+            index = self.buffer.find(marker, start)
+            if index >= 0:
+                return index
+            start = max(0, len(self.buffer) - len(marker) + 1)
+            if not self._fill():
+                return -1
+
+    def skip_preamble(self):
+        """跳过第一个边界之前的内容"""
+        index = self._find(self.delimiter)
+        if index < 0:
+            return False
+        del self.buffer[:index + len(self.delimiter)]
+        return True
+
+    def read_part_headers(self):
+        """读取下一个部分的头部；到达结束边界时返回 None"""
+        while len(self.buffer) < 2 and self._fill():
+            pass
+        if self.buffer[:2] == b'--':
+            return None
+        index = self._find(b'\r\n\r\n')
+        if index < 0:
+            return None
+        headers = bytes(self.buffer[:index]).lstrip(b'\r\n')
+        del self.buffer[:index + 4]
+        return headers.decode('utf-8', errors='ignore')
+
+    def iter_part_body(self):
+        """逐块产出当前部分的内容，直到遇到下一个边界"""
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if index > 0:
+                    yield bytes(self.buffer[:index])
+                del self.buffer[:index + len(self.delimiter)]
+                return
+            safe = len(self.buffer) - keep
+            if safe > 0:
+                yield bytes(self.buffer[:safe])
+                del self.buffer[:safe]
+            if not self._fill():
+                # 请求体被截断：把剩余数据作为最后一块
+                if self.buffer:
+                    yield bytes(self.buffer)
+                    self.buffer.clear()
+                return
+
+    def drain(self):
+        """丢弃输入流中未读取的数据，保证连接状态正确"""
+        self.buffer.clear()
+        while self._fill():
+            self.buffer.clear()
+
+def parse_multipart_data(content_type, stream, content_length=None, timings=None):
+    """流式解析 multipart/form-data 数据
+
+    普通字段保存在内存中，文件部分边读取边写入上传目录，
+    返回的文件信息中包含保存路径而不是文件内容。
+    timings 不为 None 时，写盘耗时累加到 timings["disk-write"]。
+    """
     # 从 Content-Type 头中提取 boundary
-    match = re.search(r'boundary=([^;]+)', content_type)
+    match = re.search(r'boundary=("?)([^";]+)\1', content_type)
     if not match:
         return {}, []
 
-    boundary = '--' + match.group(1)
-
-    parts = body.split(boundary.encode())
+    reader = MultipartStreamReader(stream, match.group(2).encode(), content_length)
     fields = {}
     files = []
 
-    for i, part in enumerate(parts):
-        if i == 0 or i == len(parts) - 1:  # 跳过开头和结尾的空部分
-            continue
+    if not reader.skip_preamble():
+        reader.drain()
+        return fields, files
 
-        # 分离头部和内容
-        if b'\r\n\r\n' not in part:
-            continue
-
-        headers, content = part.split(b'\r\n\r\n', 1)
-        headers = headers.decode('utf-8', errors='ignore')
-        content = content.rstrip(b'\r\n')
+    while True:
+        headers = reader.read_part_headers()
+        if headers is None:
+            break
 
         # 解析 Content-Disposition
         disp_match = re.search(r'name="([^"]+)"', headers)
         if not disp_match:
+            for _ in reader.iter_part_body():
+                pass
             continue
 
         field_name = disp_match.group(1)
@@ -67,30 +1364,612 @@ def parse_multipart_data(content_type, body):
         filename_match = re.search(r'filename="([^"]+)"', headers)
 
         if filename_match:
-            # 这是一个文件
+            # 这是一个文件，内容直接写入磁盘
             filename = filename_match.group(1)
             content_type_match = re.search(r'Content-Type: ([^\r\n]+)', headers)
-            content_type = content_type_match.group(1) if content_type_match else 'application/octet-stream'
+            part_content_type = content_type_match.group(1) if content_type_match else 'application/octet-stream'
 
-            files.append({
+            file_info = {
                 'field_name': field_name,
                 'filename': filename,
-                'content_type': content_type,
-                'data': content,
-                'size': len(content)
-            })
+                'content_type': part_content_type,
+                'size': 0
+            }
+            file_info['path'] = save_uploaded_file(file_info, reader.iter_part_body(), timings)
+            files.append(file_info)
         else:
             # 这是一个普通字段
+            content = b''.join(reader.iter_part_body())
             try:
                 value = content.decode('utf-8')
                 fields[field_name] = value
             except:
                 fields[field_name] = str(content)
 
+    reader.drain()
     return fields, files
 
-def save_uploaded_file(file_info):
-    """保存上传的文件"""
+class ChunkedBodyReader:
+    """把 Transfer-Encoding: chunked 请求体解码为普通的可读流"""
+
+    MAX_LINE = 65536
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunk_left = 0
+        self.finished = False
+        self.bytes_read = 0
+
+    def _next_chunk(self):
+        """读取下一个 chunk 的长度行；长度为 0 时跳过 trailer 并结束"""
+        line = self.stream.readline(self.MAX_LINE + 1)
+        if not line:
+            self.finished = True
+            return
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            while True:
+                trailer = self.stream.readline(self.MAX_LINE + 1)
+                if trailer in (b'\r\n', b'\n', b''):
+                    break
+            self.finished = True
+        self.chunk_left = size
+
+    def read(self, size=-1):
+        """读取最多 size 字节（size < 0 时读取全部）；格式错误时抛出 ValueError"""
+        parts = []
+        while not self.finished and size != 0:
+            if self.chunk_left == 0:
+                self._next_chunk()
+                continue
+            n = self.chunk_left if size < 0 else min(size, self.chunk_left)
+            data = self.stream.read(n)
+            if not data:
+                self.finished = True
+                break
+            parts.append(data)
+            self.chunk_left -= len(data)
+            self.bytes_read += len(data)
+            if size > 0:
+                size -= len(data)
+            if self.chunk_left == 0:
+                # 每个 chunk 的数据后面跟着一个 CRLF
+                self.stream.readline(self.MAX_LINE + 1)
+        return b''.join(parts)
+
+class BodyTooLarge(ValueError):
+    """请求体超过 max_body_bytes（响应 413）"""
+
+class BodySizeLimiter:
+    """长度未知的请求体（chunked 或压缩）读取超过上限时抛出 BodyTooLarge"""
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.count = 0
+
+    def read(self, size=-1):
+        # 最多多读一个字节，用于判断是否超过上限
+        allowed = self.max_bytes - self.count + 1
+        data = self.stream.read(allowed if size < 0 else min(size, allowed))
+        self.count += len(data)
+        if self.count > self.max_bytes:
+            raise BodyTooLarge(f"body exceeds {self.max_bytes} bytes")
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class DeadlineReader(io.RawIOBase):
+    """带截止时间的套接字读取器，作为 rfile 的底层流
+
+    每次 recv 前按当前阶段设置套接字超时，逐字节慢速发送也无法拖过截止时间：
+      idle    等待下一个请求，使用空闲超时；收到第一个字节后进入 header
+      header  头部截止时间从第一个字节到达时开始计算
+      body    单次读取超时与请求体整体截止时间中较小的一个
+    超时时在 timed_out 中记录所处阶段，供统计使用；
+    first_byte_at 记录请求第一个字节到达的时间，作为 header-parse 的起点。
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.phase = None
+        self.timeout = None
+        self.deadline = None
+        self.header_timeout = None
+        self.timed_out = None
+        self.first_byte_at = None
+        self._applied_timeout = sock.gettimeout()
+
+    def readable(self):
+        return True
+
+    def wait_for_request(self, idle_timeout, header_timeout):
+        self.phase = "idle"
+        self.timeout = idle_timeout
+        self.deadline = None
+        self.header_timeout = header_timeout or None
+        self.timed_out = None
+        self.first_byte_at = None
+
+    def start_body(self, read_timeout, body_timeout):
+        self.phase = "body"
+        self.timeout = read_timeout or None
+        self.deadline = time.monotonic() + body_timeout if body_timeout else None
+
+    def clear(self, timeout=None):
+        """请求体读取结束：之后的读写（发送响应）使用 timeout 作为套接字超时
+
+        timeout 为 None 表示不限时，只用于 WebSocket 和流式响应这类长期保持的连接。
+        """
+        self.phase = None
+        self.timeout = timeout
+        self.deadline = None
+        self._set_timeout(timeout)
+
+    def _set_timeout(self, timeout):
+        if timeout != self._applied_timeout:
+            self.sock.settimeout(timeout)
+            self._applied_timeout = timeout
+
+    def readinto(self, buffer):
+        timeout = self.timeout
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self.timed_out = self.phase
+                raise TimeoutError(f"{self.phase} deadline exceeded")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._set_timeout(timeout)
+        try:
+            received = self.sock.recv_into(buffer)
+        except TimeoutError:
+            self.timed_out = self.phase
+            raise
+        if received and self.phase == "idle":
+            self.phase = "header"
+            self.first_byte_at = time.perf_counter()
+            if self.header_timeout:
+                self.deadline = time.monotonic() + self.header_timeout
+        return received
+
+# 支持的内容编码，按同等 q 值时的优先顺序排列
+CONTENT_CODINGS = ("br", "gzip", "deflate") if brotli is not None else ("gzip", "deflate")
+DECOMPRESS_ERRORS = (zlib.error,) + ((brotli.error,) if brotli is not None else ())
+
+class UnsupportedEncoding(ValueError):
+    """请求体使用了无法解码的 Content-Encoding（响应 415）"""
+
+def parse_content_encoding(header):
+    """把 Content-Encoding 头拆分为编码列表（按施加顺序），忽略 identity"""
+    codings = [item.strip().lower() for item in (header or '').split(',')]
+    codings = ['gzip' if coding == 'x-gzip' else coding for coding in codings]
+    return [coding for coding in codings if coding and coding != 'identity']
+
+class DecompressingReader:
+    """把 Content-Encoding 压缩的请求体解码为普通的可读流
+
+    每次从底层流读取一块压缩数据，zlib 的解压输出也按块限制长度，
+    内存占用与解压后的大小无关。raw_bytes 为读取的压缩字节数，
+    bytes_read 为解压后的字节数。
+    """
+
+    def __init__(self, stream, encoding, content_length=None, chunk_size=MULTIPART_CHUNK_SIZE):
+        if encoding not in CONTENT_CODINGS:
+            raise UnsupportedEncoding(encoding)
+        self.stream = stream
+        self.encoding = encoding
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        self.raw_bytes = 0
+        self.bytes_read = 0
+        self.pending = b''
+        self.finished = False
+        if encoding == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'br':
+            self.decompressor = brotli.Decompressor()
+        else:
+            # deflate 按标准是 zlib 格式，但不少客户端发送裸 deflate，读到数据后再判断
+            self.decompressor = None
+
+    def _read_raw(self):
+        if self.remaining is None:
+            data = self.stream.read(self.chunk_size)
+        elif self.remaining > 0:
+            data = self.stream.read(min(self.chunk_size, self.remaining))
+            self.remaining -= len(data)
+        else:
+            data = b''
+        if not data:
+            self.remaining = 0
+        self.raw_bytes += len(data)
+        return data
+
+    def _drain_raw(self):
+        """压缩流已结束：丢弃底层流中剩余的数据，保证连接状态正确"""
+        while self._read_raw():
+            pass
+
+    def _stream_finished(self):
+        if self.encoding == 'br':
+            return self.decompressor.is_finished()
+        return self.decompressor is not None and self.decompressor.eof
+
+    def _decode_more(self):
+        """解压出下一批数据放入 pending；没有更多数据时返回 False"""
+        while not self.finished:
+            tail = getattr(self.decompressor, 'unconsumed_tail', b'')
+            data = tail or self._read_raw()
+            if not data:
+                self.finished = True
+                if not self._stream_finished():
+                    raise ValueError(f"truncated {self.encoding} body")
+                break
+            if self.decompressor is None:
+                zlib_header = len(data) >= 2 and data[0] & 0x0F == 8 and int.from_bytes(data[:2], 'big') % 31 == 0
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+            try:
+                if self.encoding == 'br':
+                    out = self.decompressor.process(data)
+                else:
+                    out = self.decompressor.decompress(data, self.chunk_size)
+            except DECOMPRESS_ERRORS as exc:
+                raise ValueError(f"invalid {self.encoding} body: {exc}") from exc
+            if self._stream_finished():
+                self.finished = True
+                self._drain_raw()
+            if out:
+                self.pending = out
+                return True
+        return False
+
+    def read(self, size=-1):
+        """读取最多 size 字节的解压数据（size < 0 时读取全部）；数据损坏时抛出 ValueError"""
+        parts = []
+        while size != 0:
+            if not self.pending and not self._decode_more():
+                break
+            if size < 0 or size >= len(self.pending):
+                data, self.pending = self.pending, b''
+            else:
+                data, self.pending = self.pending[:size], self.pending[size:]
+            parts.append(data)
+            self.bytes_read += len(data)
+            if size > 0:
+                size -= len(data)
+        return b''.join(parts)
+
+def negotiate_encoding(accept_encoding):
+    """按 Accept-Encoding 的 q 值选择响应的压缩格式；不压缩时返回 None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if name == 'x-gzip':
+            name = 'gzip'
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+    best, best_q = None, 0.0
+    for coding in CONTENT_CODINGS:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+class ResponseCompressor:
+    """统一 zlib 与 brotli 的流式压缩接口：compress(data) 与 finish()"""
+
+    def __init__(self, encoding, level=6):
+        self.encoding = encoding
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=min(level, 11))
+            self.compress = compressor.process
+            self.finish = compressor.finish
+        else:
+            wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+            compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+            self.compress = compressor.compress
+            self.finish = compressor.flush
+
+class UploadStore:
+    """内容寻址的上传存储：相同内容只在磁盘上保存一份
+
+    目录结构（位于上传目录下）：
+      objects/<sha256 前两位>/<sha256>   实际内容，边接收边计算哈希
+      <时间戳>_<字段名><扩展名>          每次上传指向内容的硬链接（不支持硬链接时省略）
+      manifest.jsonl                     每次上传的原始文件名、字段名、类型、大小和哈希
+
+    max_bytes 大于 0 时，内容总大小超过上限后按最近使用时间淘汰最旧的内容，
+    连同它的全部硬链接和 manifest 中的记录一起删除。索引只保存在当前进程内，
+    多个进程共用上传目录（reuseport 模式）时无法统一执行上限，因此不能同时使用。
+    """
+
+    def __init__(self, root, max_bytes=0):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifest_path = os.path.join(root, "manifest.jsonl")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # sha256 -> {"size": int, "links": set()}，按最近使用排序
+        self.total_bytes = 0
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def load(self):
+        """扫描已有内容和硬链接重建索引，并清理上次遗留的临时文件"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        found = []
+        inodes = {}
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if prefix.startswith("tmp-"):
+                os.remove(prefix_dir)
+                continue
+            if not os.path.isdir(prefix_dir):
+                continue
+            for digest in os.listdir(prefix_dir):
+                stat = os.stat(os.path.join(prefix_dir, digest))
+                found.append((stat.st_mtime, digest, stat.st_size))
+                inodes[(stat.st_dev, stat.st_ino)] = digest
+
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            for _, digest, size in sorted(found):
+                self.entries[digest] = {"size": size, "links": set()}
+                self.total_bytes += size
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                digest = inodes.get((stat.st_dev, stat.st_ino))
+                if digest is not None:
+                    self.entries[digest]["links"].add(path)
+
+    def store(self, chunks, link_name, meta, timings=None):
+        """边写临时文件边计算 SHA-256，内容已存在时丢弃临时文件
+
+        返回 (保存路径, 哈希, 大小, 是否重复)；保存路径优先使用硬链接。
+        timings 不为 None 时，把写文件、改名、建链接和写 manifest 的耗时累加到 timings["disk-write"]。
+        """
+        os.makedirs(self.objects_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        disk_seconds = 0.0
+        temp_path = os.path.join(self.objects_dir, f"tmp-{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}")
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    started = time.perf_counter()
+                    f.write(chunk)
+                    disk_seconds += time.perf_counter() - started
+                    hasher.update(chunk)
+                    size += len(chunk)
+            finalize_started = time.perf_counter()
+            digest = hasher.hexdigest()
+            object_path = self.object_path(digest)
+
+            with self.lock:
+                duplicate = os.path.exists(object_path)
+                if duplicate:
+                    os.remove(temp_path)
+                    os.utime(object_path)
+                    entry = self.entries.get(digest)
+                    if entry is None:
+                        # 磁盘上有、索引里没有（例如 load 之后由其他进程写入）的内容也要计入总大小
+                        entry = self.entries[digest] = {"size": size, "links": set()}
+                        self.total_bytes += size
+                    self.entries.move_to_end(digest)
+                else:
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.replace(temp_path, object_path)
+                    entry = {"size": size, "links": set()}
+                    self.entries[digest] = entry
+                    self.total_bytes += size
+
+                link_path = os.path.join(self.root, link_name)
+                try:
+                    os.link(object_path, link_path)
+                    entry["links"].add(link_path)
+                    saved_path = link_path
+                except OSError:
+                    link_path = None
+                    saved_path = object_path
+
+                record = dict(meta, sha256=digest, size=size, link=link_path,
+                              duplicate=duplicate, time=datetime.now().isoformat())
+                with open(self.manifest_path, 'a', encoding='utf-8') as manifest:
+                    manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+                self._evict_locked(keep=digest)
+            disk_seconds += time.perf_counter() - finalize_started
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if timings is not None:
+                timings["disk-write"] += disk_seconds
+
+        return saved_path, digest, size, duplicate
+
+    def _evict_locked(self, keep):
+        """超过容量上限时淘汰最久未使用的内容（不淘汰刚写入的内容）"""
+        if self.max_bytes <= 0:
+            return
+        evicted = set()
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            digest, entry = next(iter(self.entries.items()))
+            if digest == keep:
+                self.entries.move_to_end(digest)
+                continue
+            del self.entries[digest]
+            self.total_bytes -= entry["size"]
+            evicted.add(digest)
+            for path in [self.object_path(digest)] + list(entry["links"]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if evicted:
+            self._compact_manifest_locked(evicted)
+
+    def _compact_manifest_locked(self, evicted):
+        """从 manifest 中删除已淘汰内容的记录，写入临时文件后原子替换"""
+        temp_path = self.manifest_path + ".tmp"
+        try:
+            with open(self.manifest_path, encoding='utf-8') as src, \
+                    open(temp_path, 'w', encoding='utf-8') as dst:
+                for line in src:
+                    try:
+                        digest = json.loads(line).get("sha256")
+                    except ValueError:
+                        continue
+                    if digest not in evicted:
+                        dst.write(line)
+            os.replace(temp_path, self.manifest_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+UPLOAD_STORE = UploadStore(UPLOAD_DIR)
+
+class TrafficRecorder:
+    """把请求追加写入抓包文件，供 replay_capture.py 回放
+
+    索引文件每行一个 JSON 对象（键名保持简短）：
+      ts  请求开始时间 (Unix 秒)      m  方法       p  路径（含查询参数）
+      h   请求头 [[名称, 值], ...]   o  请求体在 sidecar 文件中的偏移
+      n   请求体长度                 s  响应状态码  d  处理耗时 (秒)
+    请求体（chunked 已解码，Content-Encoding 压缩保持原样）按顺序追加到 <索引文件>.bodies。
+    """
+
+    SPOOL_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self.path = None
+        self.lock = threading.Lock()
+        self.index_file = None
+        self.blob_file = None
+
+    @property
+    def enabled(self):
+        return self.index_file is not None
+
+    def open(self, path):
+        self.path = path
+        self.index_file = open(path, 'a', encoding='utf-8')
+        self.blob_file = open(path + ".bodies", 'ab')
+
+    def close(self):
+        with self.lock:
+            for f in (self.index_file, self.blob_file):
+                if f is not None:
+                    f.close()
+            self.index_file = None
+            self.blob_file = None
+
+    def record(self, entry, body_spool):
+        """写入一条记录；body_spool 是已定位到开头的请求体临时文件（可为 None）"""
+        with self.lock:
+            if not self.enabled:
+                return
+            offset = self.blob_file.tell()
+            length = 0
+            if body_spool is not None:
+                shutil.copyfileobj(body_spool, self.blob_file)
+                length = self.blob_file.tell() - offset
+            entry["o"] = offset
+            entry["n"] = length
+            self.blob_file.flush()
+            self.index_file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self.index_file.flush()
+
+class CaptureTee:
+    """包装请求体流：读取的数据同时写入临时文件，供 TrafficRecorder 保存"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.spool = tempfile.SpooledTemporaryFile(max_size=TrafficRecorder.SPOOL_SIZE)
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.spool.write(data)
+        return data
+
+    def __getattr__(self, name):
+        # bytes_read 等属性直接取自被包装的流
+        return getattr(self.stream, name)
+
+RECORDER = TrafficRecorder()
+
+# Server-Timing 中的阶段名，也是跟踪日志 timings 的键
+TIMING_PHASES = ("header-parse", "body-read", "multipart-parse", "disk-write")
+
+class TimedStream:
+    """包装请求体流，把 read() 的耗时累加到 timings[key]"""
+
+    def __init__(self, stream, timings, key="body-read"):
+        self.stream = stream
+        self.timings = timings
+        self.key = key
+
+    def read(self, size=-1):
+        started = time.perf_counter()
+        try:
+            return self.stream.read(size)
+        finally:
+            self.timings[self.key] += time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class TraceLog:
+    """逐请求的耗时跟踪日志（JSONL），以 X-Request-Id 与客户端日志对齐
+
+    每行包含请求开始时间、请求 ID、方法、路径、状态码、字节数，
+    以及各阶段耗时（毫秒）：header-parse、body-read、multipart-parse、
+    disk-write、response（发送响应）和 total。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    def open(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = None
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line)
+                self.file.flush()
+
+TRACE = TraceLog()
+
+def save_uploaded_file(file_info, chunks, timings=None):
+    """把上传文件的数据块存入 UPLOAD_STORE，并在 file_info 中记录大小和哈希"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     filename = file_info['filename']
     field_name = file_info['field_name']
@@ -99,23 +1978,735 @@ def save_uploaded_file(file_info):
     # 例如：20250122_143020_123456_file0_photo.jpg
     name_only, ext = os.path.splitext(filename)
     safe_filename = f"{timestamp}_{field_name}{ext}"
-    filepath = os.path.join(UPLOAD_DIR, safe_filename)
 
-    # 写入文件
-    with open(filepath, 'wb') as f:
-        f.write(file_info['data'])
+    meta = {
+        'filename': filename,
+        'field_name': field_name,
+        'content_type': file_info['content_type'],
+    }
+    filepath, digest, size, duplicate = UPLOAD_STORE.store(chunks, safe_filename, meta, timings)
+    file_info['size'] = size
+    file_info['sha256'] = digest
+    file_info['duplicate'] = duplicate
 
     return filepath
 
 class TestRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1：支持持久连接，并由基类自动处理 Expect: 100-continue
+    protocol_version = "HTTP/1.1"
+    # 持久连接上等待下一个请求的空闲超时（秒），None 表示不超时
+    keep_alive_timeout = 5
+    # 是否保持连接；single 模式下关闭，否则一个空闲的持久连接会占住唯一的线程
+    keep_alive = True
+    # 响应头和响应体分两次写出，持久连接上 Nagle 与延迟 ACK 叠加会让每个请求多等约 40ms
+    disable_nagle_algorithm = True
+    # 按 Accept-Encoding 压缩响应；小于 compress_min_bytes 的响应体不压缩
+    compress_responses = True
+    compress_min_bytes = 256
+    compress_level = 6
+    # 每个 WebSocket 连接的发送队列长度（消息数），决定背压与广播丢弃的阈值
+    ws_queue_size = 256
+    # 慢客户端保护（秒，0 表示不限制）：头部截止时间、请求体单次读取超时与整体截止时间
+    header_timeout = 10
+    read_timeout = 30
+    body_timeout = 0
+    # 请求体大小上限（字节，0 表示不限制），超过时返回 413
+    max_body_bytes = 0
+
+    def setup(self):
+        super().setup()
+        # 用带截止时间的读取器替换 rfile，由它在每次 recv 前设置超时
+        self.rfile.close()
+        self.raw_reader = DeadlineReader(self.connection)
+        self.rfile = io.BufferedReader(self.raw_reader)
+
+    def handle_one_request(self):
+        # 等待请求行期间使用空闲超时，收到第一个字节后开始计算头部截止时间；超时后基类会关闭连接
+        self.raw_reader.wait_for_request(self.keep_alive_timeout, self.header_timeout)
+        self.status_code = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_out_raw = 0
+        self.request_started = None
+        self.capture_tee = None
+        self.request_decoder = None
+        self.response_encoding = None
+        self.request_body = None
+        self.request_id = None
+        self.headers_done_at = None
+        self.response_started_at = None
+        self.timings = dict.fromkeys(TIMING_PHASES, 0.0)
+        CONSOLE.begin_request()
+        try:
+            super().handle_one_request()
+            self.handle_read_timeout()
+        finally:
+            # 整个请求的日志一次性交给后台线程输出
+            CONSOLE.end_request()
+            if self.status_code is not None:
+                if CONSOLE.quiet:
+                    CONSOLE.summary.record(self.status_code, self.request_wire_bytes())
+                self.record_stats()
+                self.record_capture()
+                self.record_trace()
+            if self.capture_tee is not None:
+                self.capture_tee.spool.close()
+
+    def handle_read_timeout(self):
+        """统计本次请求中发生的读取超时；头部未收完时直接回复 408 并关闭连接"""
+        phase = self.raw_reader.timed_out
+        if phase is None:
+            return
+        self.raw_reader.timed_out = None
+        STATS.record_event(f"{phase}_timeout")
+        self.close_connection = True
+        if phase == "header":
+            try:
+                self.wfile.write(b"HTTP/1.1 408 Request Timeout\r\nConnection: close\r\nContent-Length: 0\r\n\r\n")
+            except OSError:
+                pass
+
+    def record_stats(self):
+        """把本次请求计入 /__stats 统计（不统计 /__stats 自身）"""
+        if self.request_started is None or not hasattr(self, 'command'):
+            return
+        path = urlparse(self.path).path
+        if path == STATS_PATH:
+            return
+        elapsed = time.perf_counter() - self.request_started
+        STATS.record(self.command, path, self.status_code, self.bytes_in, self.bytes_out, elapsed,
+                     wire_in=self.request_wire_bytes(), raw_out=self.bytes_out_raw,
+                     request_encoding=self.request_decoder is not None,
+                     response_encoding=self.response_encoding)
+
+    def request_wire_bytes(self):
+        """请求体在线上的字节数（压缩请求体为解压前的大小）"""
+        if self.request_decoder is not None:
+            return self.request_decoder.raw_bytes
+        return self.bytes_in
+
+    def request_start_time(self):
+        """请求的起点：第一个字节到达的时间（已在缓冲区中的流水线请求取开始解析的时间）"""
+        first_byte_at = self.raw_reader.first_byte_at
+        if first_byte_at is not None and first_byte_at <= self.request_started:
+            return first_byte_at
+        return self.request_started
+
+    def server_timing_header(self):
+        """各阶段耗时的 Server-Timing 头，单位毫秒"""
+        self.timings["header-parse"] = self.headers_done_at - self.request_start_time()
+        metrics = [f"{name};dur={self.timings[name] * 1000:.3f}" for name in TIMING_PHASES]
+        metrics.append(f"total;dur={(time.perf_counter() - self.request_start_time()) * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def record_trace(self):
+        """跟踪日志开启时写入本次请求的各阶段耗时"""
+        if not TRACE.enabled or self.request_id is None:
+            return
+        finished = time.perf_counter()
+        start = self.request_start_time()
+        timings = {name: round(self.timings[name] * 1000, 3) for name in TIMING_PHASES}
+        if self.response_started_at is not None:
+            timings["response"] = round((finished - self.response_started_at) * 1000, 3)
+        timings["total"] = round((finished - start) * 1000, 3)
+        TRACE.write({
+            "ts": round(self.request_wall_time, 6),
+            "id": self.request_id,
+            "method": self.command,
+            "path": self.path,
+            "status": self.status_code,
+            "bytes_in": self.request_wire_bytes(),
+            "bytes_out": self.bytes_out,
+            "timings_ms": timings,
+        })
+
+    def record_capture(self):
+        """抓包开启时把本次请求写入抓包文件（不记录 /__stats）"""
+        if not RECORDER.enabled or self.request_started is None:
+            return
+        if urlparse(self.path).path == STATS_PATH:
+            return
+        entry = {
+            "ts": round(self.request_wall_time, 6),
+            "m": self.command,
+            "p": self.path,
+            "h": [[name, value] for name, value in self.headers.items()],
+            "s": self.status_code,
+            "d": round(time.perf_counter() - self.request_started, 6),
+        }
+        spool = None
+        if self.capture_tee is not None:
+            spool = self.capture_tee.spool
+            spool.seek(0)
+        RECORDER.record(entry, spool)
+
+    def parse_request(self):
+        self.request_started = time.perf_counter()
+        self.request_wall_time = time.time()
+        self.log_enabled = CONSOLE.should_log_request()
+        if not super().parse_request():
+            return False
+        # Expect: 100-continue 时 handle_expect_100 已经分配过
+        if self.request_id is None:
+            self.headers_done_at = time.perf_counter()
+            self.assign_request_id()
+        # 头部已收完，开始计算请求体的读取超时
+        self.raw_reader.start_body(self.read_timeout, self.body_timeout)
+        return True
+
+    REQUEST_ID_PATTERN = re.compile(r'[\x21-\x7e]{1,128}')
+
+    def assign_request_id(self):
+        """沿用客户端的 X-Request-Id（可见 ASCII 且不超过 128 字符），否则生成一个"""
+        incoming = self.headers.get('X-Request-Id', '').strip()
+        self.request_id = incoming if self.REQUEST_ID_PATTERN.fullmatch(incoming) else uuid.uuid4().hex
+
+    def send_response(self, code, message=None):
+        """最终响应带上 X-Request-Id 和 Server-Timing（100-continue 等中间响应不带）
+
+        不保持连接时最终响应都带 Connection: close，发送完即关闭连接。
+        """
+        super().send_response(code, message)
+        if code >= 200 and not self.keep_alive:
+            super().send_header('Connection', 'close')
+        if code >= 200 and self.request_id is not None:
+            self.response_started_at = time.perf_counter()
+            self.send_header('X-Request-Id', self.request_id)
+            self.send_header('Server-Timing', self.server_timing_header())
+
+    def send_header(self, keyword, value):
+        # 不保持连接时 send_response 已经发送过 Connection: close（send_error 等会再发一次）
+        if not self.keep_alive and keyword.lower() == 'connection' and value.lower() == 'close':
+            return
+        super().send_header(keyword, value)
+
+    def declared_body_too_large(self):
+        """Content-Length 声明的大小超过上限"""
+        if not self.max_body_bytes:
+            return False
+        try:
+            return int(self.headers.get('Content-Length', 0)) > self.max_body_bytes
+        except ValueError:
+            return False
+
+    def handle_expect_100(self):
+        """Expect: 100-continue 时先检查声明的大小，超限直接 413，客户端不必上传请求体
+
+        在基类的 parse_request 中调用，先分配请求 id，提前的 413 也带 X-Request-Id 和 Server-Timing。
+        """
+        self.headers_done_at = time.perf_counter()
+        self.assign_request_id()
+        if self.declared_body_too_large():
+            self.reject_oversized_body()
+            return False
+        return super().handle_expect_100()
+
+    def reject_oversized_body(self):
+        STATS.record_event("body_too_large")
+        self.close_connection = True
+        self.linger_on_close = True
+        self.send_error(413, f"Request body exceeds {self.max_body_bytes} bytes")
+
+    # 提前拒绝后关闭连接前丢弃客户端仍在上传的数据的时长和上限
+    LINGER_SECONDS = 2.0
+    LINGER_MAX_BYTES = 64 * 1024 * 1024
+
+    def finish(self):
+        super().finish()
+        if getattr(self, 'linger_on_close', False):
+            self.linger_close()
+
+    def linger_close(self):
+        """半关闭写方向后短暂读取并丢弃剩余请求体
+
+        客户端还在上传时直接关闭会触发 RST，客户端可能读不到 413 响应，只看到 Broken pipe。
+        """
+        try:
+            self.connection.shutdown(socket.SHUT_WR)
+            deadline = time.monotonic() + self.LINGER_SECONDS
+            drained = 0
+            while drained < self.LINGER_MAX_BYTES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.connection.settimeout(remaining)
+                chunk = self.connection.recv(MULTIPART_CHUNK_SIZE)
+                if not chunk:
+                    break
+                drained += len(chunk)
+        except OSError:
+            pass
+
+    def response_timeout(self):
+        """发送响应时的套接字超时：客户端不读取响应时，写操作最多阻塞这么久，不会一直占住线程"""
+        return self.read_timeout or self.keep_alive_timeout
+
+    def get_body_stream(self, decode=True):
+        """返回 (请求体流, 长度)；chunked 或压缩请求体的长度为 None
+
+        decode 为 True 时按 Content-Encoding 透明解压（多个编码按相反顺序逐层解开），
+        不支持的编码抛出 UnsupportedEncoding。抓包记录的是解压前的请求体。
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            stream, length = ChunkedBodyReader(self.rfile), None
+        else:
+            stream, length = self.rfile, int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError("negative Content-Length")
+            if self.declared_body_too_large():
+                raise BodyTooLarge(f"declared body exceeds {self.max_body_bytes} bytes")
+        if RECORDER.enabled and length != 0:
+            self.capture_tee = CaptureTee(stream)
+            stream = self.capture_tee
+        if decode and length != 0:
+            for encoding in reversed(parse_content_encoding(self.headers.get('Content-Encoding'))):
+                stream = DecompressingReader(stream, encoding, length)
+                length = None
+                if self.request_decoder is None:
+                    self.request_decoder = stream
+        if length is None and self.max_body_bytes:
+            stream = BodySizeLimiter(stream, self.max_body_bytes)
+        return stream, length
+
+    def choose_response_encoding(self, size):
+        """协商响应体的压缩格式；size 为 None 表示长度未知"""
+        if not self.compress_responses:
+            return None
+        if size is not None and size < self.compress_min_bytes:
+            return None
+        return negotiate_encoding(self.headers.get('Accept-Encoding'))
+
+    def send_compression_headers(self, encoding):
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if self.compress_responses:
+            self.send_header('Vary', 'Accept-Encoding')
+
+    def send_body(self, payload, content_type, status=200, headers=()):
+        """发送完整响应体；带上 Content-Length 以便连接复用，客户端支持时压缩
+
+        204/304 只发送响应头，丢弃响应体。
+        """
+        if status in BODYLESS_STATUSES:
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        raw_size = len(payload)
+        encoding = self.choose_response_encoding(raw_size)
+        if encoding:
+            compressor = ResponseCompressor(encoding, self.compress_level)
+            payload = compressor.compress(payload) + compressor.finish()
+            self.response_encoding = encoding
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_compression_headers(encoding)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        self.wfile.write(payload)
+        self.bytes_out += len(payload)
+        self.bytes_out_raw += raw_size
+
+    def send_json(self, response, status=200):
+        """发送 JSON 响应"""
+        payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        self.send_body(payload, 'application/json', status)
+
+    def send_generated_body(self, size, status=200, chunked=False):
+        """流式发送 size 字节的生成数据，不在内存中构造完整响应体
+
+        压缩时边生成边压缩，压缩后的长度未知，因此改用 chunked 发送
+        （HTTP/1.0 客户端不支持 chunked，不压缩）。
+        """
+        encoding = self.choose_response_encoding(size)
+        if self.request_version == 'HTTP/1.0':
+            encoding = None
+        compressor = ResponseCompressor(encoding, self.compress_level) if encoding else None
+        chunked = chunked or compressor is not None
+        self.response_encoding = encoding
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_compression_headers(encoding)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(size))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        view = memoryview(GENERATED_CHUNK)
+        remaining = size
+        while remaining > 0:
+            chunk = view[:min(remaining, len(GENERATED_CHUNK))]
+            remaining -= len(chunk)
+            self.bytes_out_raw += len(chunk)
+            self.write_body_chunk(compressor.compress(chunk) if compressor else chunk, chunked)
+        if compressor:
+            self.write_body_chunk(compressor.finish(), chunked)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def write_body_chunk(self, data, chunked):
+        """写出一段响应体；chunked 时加上长度行（空数据不写，避免提前发出结束块）"""
+        if not data:
+            return
+        if chunked:
+            # 长度行、数据和结尾 CRLF 合并为一次写入，避免小事件被拆成三个 TCP 包
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.wfile.write(data)
+        self.bytes_out += len(data)
+
+    def send_event_stream(self, kind):
+        """保持连接并按固定速率推送事件：kind 为 "sse" 或 "ndjson"
+
+        HTTP/1.1 使用 chunked 发送，流结束后连接可以复用；HTTP/1.0 发送完毕后关闭连接。
+        SSE 支持 Last-Event-ID 续传序号。流式响应不压缩，避免事件被压缩缓冲延迟。
+        """
+        try:
+            params = parse_stream_params(parse_qs(urlparse(self.path).query))
+            seq = int(self.headers.get('Last-Event-ID', -1)) + 1 if kind == "sse" else 0
+        except ValueError:
+            self.send_error(400, "Invalid stream parameter")
+            return
+
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(200)
+        if kind == "sse":
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        else:
+            self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        # 流式响应按速率持续写出，写操作不限时，由客户端断开结束
+        self.raw_reader.clear()
+
+        interval = 1.0 / params["rate"] if params["rate"] > 0 else 0.0
+        started = time.monotonic()
+        next_due = started
+        sent = 0
+        try:
+            if kind == "sse" and params["retry_ms"] is not None:
+                self.write_stream_frame(f"retry: {params['retry_ms']}\n\n", chunked)
+            while params["count"] == 0 or sent < params["count"]:
+                now = time.monotonic()
+                if params["duration"] and now - started >= params["duration"]:
+                    break
+                if next_due > now:
+                    time.sleep(next_due - now)
+                # 按计划时间而不是实际发送时间推进，长时间运行也不会累积漂移
+                next_due += interval
+                data = build_stream_event(seq, params["size"])
+                if kind == "sse":
+                    event_line = f"event: {params['event']}\n" if params["event"] else ""
+                    frame = f"id: {seq}\n{event_line}data: {data}\n\n"
+                else:
+                    frame = data + "\n"
+                self.write_stream_frame(frame, chunked)
+                seq += 1
+                sent += 1
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端主动断开是流式测试的正常结束方式
+            self.close_connection = True
+
+    def write_stream_frame(self, text, chunked):
+        data = text.encode('utf-8')
+        self.bytes_out_raw += len(data)
+        self.write_body_chunk(data, chunked)
+
+    def send_long_poll(self):
+        """GET /__longpoll：等待频道的新消息，最多等待 delay_ms 后应答
+
+          channel=NAME   频道 (默认 default)
+          delay_ms=N     没有新消息时的最长等待时间 (默认 30000)
+          since=N        只接收版本号大于 N 的消息，用于连续轮询不丢消息
+        """
+        query = parse_qs(urlparse(self.path).query)
+        channel = query.get('channel', ['default'])[0]
+        try:
+            delay = float(query.get('delay_ms', ['30000'])[0]) / 1000
+            since = int(query['since'][0]) if query.get('since') else None
+        except ValueError:
+            self.send_error(400, "Invalid long-poll parameter")
+            return
+
+        started = time.monotonic()
+        version, message = LONG_POLL.wait(channel, max(0.0, delay), since)
+        self.send_json({
+            "status": "success",
+            "channel": channel,
+            "version": version,
+            "timed_out": message is None,
+            "message": message,
+            "waited_ms": round((time.monotonic() - started) * 1000, 3),
+        })
+
+    def handle_websocket(self, path):
+        """完成 WebSocket 握手并按模式处理消息，直到连接关闭
+
+          echo       原样回显每条消息
+          broadcast  消息发给同一 room 的所有连接（包括发送者），慢订阅者的消息被丢弃
+          push       按 rate/size/count/duration 推送 JSON 事件（参数同 /__sse）；
+                     客户端把事件原样发回时记录往返延迟
+        """
+        mode = path[len(WS_PREFIX):].strip('/') or "echo"
+        query = parse_qs(urlparse(self.path).query)
+        if mode not in WS_MODES:
+            self.send_json({"status": "error", "message": f"Unknown WebSocket mode: {mode}", "modes": WS_MODES}, 404)
+            return
+        if (self.headers.get('Upgrade', '').lower() != 'websocket'
+                or 'upgrade' not in self.headers.get('Connection', '').lower()):
+            self.send_json({"status": "error", "message": "WebSocket upgrade required"}, 426)
+            return
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key or self.headers.get('Sec-WebSocket-Version') != '13':
+            self.send_error(400, "Invalid WebSocket handshake")
+            return
+        try:
+            params = parse_stream_params(query)
+        except ValueError:
+            self.send_error(400, "Invalid stream parameter")
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key.strip() + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101, "Switching Protocols")
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.close_connection = True
+        # WebSocket 连接可以长时间空闲，读写不限时
+        self.raw_reader.clear()
+
+        ws = WebSocketConnection(self.connection, self.rfile, self.ws_queue_size)
+        room = query.get('room', ['default'])[0]
+        WS_STATS.opened(mode)
+        started = time.monotonic()
+        if mode == "broadcast":
+            WS_HUB.join(room, ws)
+        elif mode == "push":
+            threading.Thread(target=self.run_websocket_push, args=(ws, params), name="ws-push", daemon=True).start()
+
+        close_code = 1000
+        try:
+            while True:
+                opcode, payload = ws.receive()
+                if opcode is None:
+                    break
+                if mode == "echo":
+                    ws.send(opcode, payload)
+                elif mode == "broadcast":
+                    WS_HUB.broadcast(room, opcode, payload)
+                else:
+                    self.record_push_round_trip(payload)
+        except WebSocketClosed as exc:
+            close_code = exc.code
+        finally:
+            if mode == "broadcast":
+                WS_HUB.leave(room, ws)
+            ws.close()
+            WS_STATS.closed()
+            self.bytes_in = ws.bytes_in
+            self.bytes_out += ws.bytes_out
+            self.bytes_out_raw += ws.bytes_out
+
+        if self.log_enabled:
+            elapsed = time.monotonic() - started
+            color_print('cyan', f"\n🔌 WebSocket {mode} 已关闭 (关闭码 {close_code}), 持续 {elapsed:.2f} s")
+            color_print('cyan', f"   收到 {ws.messages_in} 条 / {ws.bytes_in} 字节, "
+                                f"发送 {ws.messages_out} 条 / {ws.bytes_out} 字节"
+                                f" ({ws.bytes_out / 1024 / 1024 / elapsed if elapsed > 0 else 0:.2f} MB/s)"
+                                + (f", 丢弃 {ws.dropped} 条" if ws.dropped else ""))
+            log_print("\n" + "=" * 80 + "\n")
+
+    def run_websocket_push(self, ws, params):
+        """push 模式的发送线程：按计划速率生成事件，发送队列满时阻塞（背压）"""
+        interval = 1.0 / params["rate"] if params["rate"] > 0 else 0.0
+        started = time.monotonic()
+        next_due = started
+        seq = 0
+        while not ws.closed.is_set() and (params["count"] == 0 or seq < params["count"]):
+            now = time.monotonic()
+            if params["duration"] and now - started >= params["duration"]:
+                break
+            if next_due > now:
+                time.sleep(next_due - now)
+            next_due += interval
+            if not ws.send(WS_OP_TEXT, build_stream_event(seq, params["size"]).encode('utf-8')):
+                return
+            seq += 1
+        if not ws.closed.is_set():
+            ws.close(1000, "push finished")
+
+    @staticmethod
+    def record_push_round_trip(payload):
+        """客户端回传的 push 事件带有服务器发送时的 ts，据此计算往返延迟"""
+        try:
+            sent_at = json.loads(payload)["ts"]
+        except (ValueError, KeyError, TypeError):
+            return
+        if isinstance(sent_at, (int, float)):
+            WS_STATS.round_trip(max(0.0, time.time() - sent_at))
+
+    def publish_long_poll(self):
+        """POST /__longpoll?channel=NAME：请求体（JSON 或文本）作为消息发布到频道"""
+        channel = parse_qs(urlparse(self.path).query).get('channel', ['default'])[0]
+        body = self.request_body or b''
+        try:
+            message = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            message = body.decode('utf-8', errors='replace')
+        version, woken = LONG_POLL.publish(channel, message)
+        self.send_json({"status": "success", "channel": channel, "version": version, "woken": woken})
+
+    def send_simulated_response(self, response):
+        """按 ResponseSimulator 的方案发送响应（延迟、状态码、生成的大响应体）"""
+        parsed = urlparse(self.path)
+        try:
+            plan = SIMULATOR.plan(parsed.path, parse_qs(parsed.query))
+        except ValueError:
+            self.send_error(400, "Invalid simulation parameter")
+            return
+
+        if plan["delay"] > 0:
+            time.sleep(plan["delay"])
+
+        match = ROUTES.match(self.command, parsed.path)
+        if match is not None:
+            self.send_mock_response(match[0], match[1], parse_qs(parsed.query), plan["status"])
+            return
+
+        status = plan["status"] or 200
+        if plan["body_bytes"] is not None:
+            self.send_generated_body(plan["body_bytes"], status, plan["chunked"])
+            return
+
+        if status >= 400:
+            response["status"] = "error"
+        if plan["status"] is not None:
+            response["simulated_status"] = status
+        self.send_json(response, status)
+
+    def send_mock_response(self, route, groups, query, status_override=None):
+        """按 --routes 配置中匹配到的路由渲染模板并发送（__status 等模拟参数优先）"""
+        delay = route.delay
+        if route.jitter:
+            delay += random.uniform(-route.jitter, route.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        context = TemplateContext(self.command, urlparse(self.path).path, query, self.headers,
+                                  groups, self.request_id, self.request_body)
+        headers = [(name, template.render(context)) for name, template in route.headers]
+        self.send_body(route.render_body(context), route.content_type, status_override or route.status, headers)
+
+    def send_static_file(self, head_only=False):
+        """响应 /files/... 路由：支持 Range/206、If-Modified-Since，内容通过 sendfile 发送"""
+        path = resolve_served_file(urlparse(self.path).path)
+        if path is None or not os.path.exists(path):
+            self.send_json({"status": "error", "message": "File not found", "path": self.path}, 404)
+            return
+
+        if os.path.isdir(path):
+            entries = []
+            with os.scandir(path) as listing:
+                for entry in sorted(listing, key=lambda item: item.name):
+                    try:
+                        entries.append({"name": entry.name, "size": entry.stat().st_size,
+                                        "is_dir": entry.is_dir()})
+                    except OSError:
+                        # 悬空符号链接、无权限等无法 stat 的条目标记为不可读，不影响整个列表
+                        entries.append({"name": entry.name, "size": None, "is_dir": False, "unreadable": True})
+            self.send_json({"status": "success", "path": self.path, "files": entries})
+            return
+
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            mtime = int(stat.st_mtime)
+            last_modified = formatdate(mtime, usegmt=True)
+
+            since = self.headers.get('If-Modified-Since')
+            if since and not self.headers.get('Range'):
+                try:
+                    if mtime <= parsedate_to_datetime(since).timestamp():
+                        self.send_response(304)
+                        self.send_header('Last-Modified', last_modified)
+                        self.end_headers()
+                        return
+                except (TypeError, ValueError):
+                    pass
+
+            try:
+                byte_range = parse_byte_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if byte_range is None:
+                offset, count = 0, size
+                self.send_response(200)
+            else:
+                offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {byte_range[0]}-{byte_range[1]}/{size}')
+            self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(count))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+
+            if head_only or count == 0:
+                return
+            # socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝发送
+            sent = self.connection.sendfile(f, offset, count)
+            self.bytes_out += sent
+            self.bytes_out_raw += sent
+            if sent < count:
+                self.close_connection = True
+
+    def send_stats(self):
+        """响应保留路由 /__stats：默认 JSON，?format=prometheus 输出 Prometheus 文本"""
+        query = parse_qs(urlparse(self.path).query)
+        if query.get('reset', ['0'])[0] in ('1', 'true'):
+            STATS.reset()
+            WS_STATS.reset()
+        if query.get('format', ['json'])[0] == 'prometheus':
+            payload = (STATS.to_prometheus() + WS_STATS.to_prometheus()).encode('utf-8')
+            self.send_body(payload, 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            stats = STATS.to_dict()
+            stats["websocket"] = WS_STATS.to_dict()
+            self.send_json(stats)
+
     def log_request_details(self):
         """打印请求的完整细节（不包含请求体）"""
-        print("\n" + "=" * 80)
+        if not self.log_enabled:
+            return
+
+        log_print("\n" + "=" * 80)
         color_print('bold', f"📨 收到请求")
-        print("=" * 80)
+        log_print("=" * 80)
 
         # 请求行
         color_print('cyan', f"📍 方法: {self.command}")
+        color_print('cyan', f"🔖 请求 ID: {self.request_id}")
         color_print('cyan', f"📍 路径: {self.path}")
 
         # 解析 URL 和查询参数
@@ -134,39 +2725,18 @@ class TestRequestHandler(BaseHTTPRequestHandler):
 
     def log_request_details_with_body(self, body):
         """打印请求的完整细节（包含请求体）"""
+        if not self.log_enabled:
+            return
+
         self.log_request_details()
 
         content_length = len(body)
         if content_length > 0:
             content_type = self.headers.get('Content-Type', '')
 
-            color_print('magenta', f"\n📦 请求体 ({content_length} 字节, Content-Type: {content_type}):")
-
-            # 处理 multipart/form-data
-            if 'multipart/form-data' in content_type:
-                fields, files = parse_multipart_data(content_type, body)
-
-                if fields:
-                    color_print('blue', "\n📝 表单字段:")
-                    for key, value in fields.items():
-                        color_print('blue', f"   {key} = {value}")
-
-                if files:
-                    color_print('bold', "\n📁 上传的文件:")
-                    for file_info in files:
-                        color_print('bold', f"   字段名: {file_info['field_name']}")
-                        color_print('yellow', f"   文件名: {file_info['filename']}")
-                        color_print('yellow', f"   类型: {file_info['content_type']}")
-                        color_print('yellow', f"   大小: {file_info['size']} 字节")
-
-                        # 保存文件
-                        saved_path = save_uploaded_file(file_info)
-                        color_print('green', f"   ✓ 已保存到: {saved_path}")
-                        print()
-                else:
-                    color_print('red', "   未检测到文件")
+            color_print('magenta', f"\n📦 请求体 ({content_length} 字节{self.describe_request_encoding()}, Content-Type: {content_type}):")
 
-            elif 'application/json' in content_type:
+            if 'application/json' in content_type:
                 try:
                     json_data = json.loads(body.decode('utf-8'))
                     color_print('magenta', json.dumps(json_data, ensure_ascii=False, indent=2))
@@ -195,106 +2765,529 @@ class TestRequestHandler(BaseHTTPRequestHandler):
                 except:
                     color_print('red', "[二进制数据，无法显示]")
 
-        print("\n" + "=" * 80 + "\n")
+        log_print("\n" + "=" * 80 + "\n")
+
+    def log_request_details_with_multipart(self, stream, content_length):
+        """流式解析 multipart/form-data 请求体并打印细节（文件直接写入磁盘）"""
+        content_type = self.headers.get('Content-Type', '')
+        started = time.perf_counter()
+        read_before = self.timings["body-read"]
+        disk_before = self.timings["disk-write"]
+        fields, files = parse_multipart_data(content_type, stream, content_length, self.timings)
+        # 解析耗时 = 总耗时 - 期间读取请求体的耗时 - 写盘耗时
+        elapsed = time.perf_counter() - started
+        waited = (self.timings["body-read"] - read_before) + (self.timings["disk-write"] - disk_before)
+        self.timings["multipart-parse"] += max(0.0, elapsed - waited)
+        if content_length is None:
+            content_length = stream.bytes_read
+        self.bytes_in = content_length
+
+        if not self.log_enabled:
+            return
+
+        self.log_request_details()
+        color_print('magenta', f"\n📦 请求体 ({content_length} 字节{self.describe_request_encoding()}, Content-Type: {content_type}):")
+
+        if fields:
+            color_print('blue', "\n📝 表单字段:")
+            for key, value in fields.items():
+                color_print('blue', f"   {key} = {value}")
+
+        if files:
+            color_print('bold', "\n📁 上传的文件:")
+            for file_info in files:
+                color_print('bold', f"   字段名: {file_info['field_name']}")
+                color_print('yellow', f"   文件名: {file_info['filename']}")
+                color_print('yellow', f"   类型: {file_info['content_type']}")
+                color_print('yellow', f"   大小: {file_info['size']} 字节")
+                color_print('green', f"   ✓ 已保存到: {file_info['path']}")
+                if file_info.get('duplicate'):
+                    color_print('cyan', f"   ♻️ 内容重复，已复用: {UPLOAD_STORE.object_path(file_info['sha256'])}")
+                log_print()
+        else:
+            color_print('red', "   未检测到文件")
+
+        log_print("\n" + "=" * 80 + "\n")
+
+    def describe_request_encoding(self):
+        """压缩请求体的日志说明，例如 ", gzip 压缩后 1234 字节"。未压缩时为空字符串"""
+        if self.request_decoder is None:
+            return ""
+        encoding = self.headers.get('Content-Encoding', '').strip()
+        return f", {encoding} 压缩后 {self.request_decoder.raw_bytes} 字节"
+
+    def read_and_log_body(self):
+        """读取请求体并打印；multipart 请求体按块流式处理，不整体读入内存
+
+        请求体格式错误时返回 400、超过大小上限时返回 413、压缩格式不支持时返回 415、
+        读取超时时返回 408，并返回 False，调用方不再发送响应。
+        """
+        content_type = self.headers.get('Content-Type', '')
+        try:
+            stream, content_length = self.get_body_stream()
+            stream = TimedStream(stream, self.timings)
+            if content_length != 0 and 'multipart/form-data' in content_type:
+                self.log_request_details_with_multipart(stream, content_length)
+            else:
+                if content_length is None:
+                    body = stream.read()
+                else:
+                    body = stream.read(content_length) if content_length > 0 else b''
+                self.bytes_in = len(body)
+                self.request_body = body
+                self.log_request_details_with_body(body)
+        except BodyTooLarge:
+            self.reject_oversized_body()
+            return False
+        except UnsupportedEncoding as exc:
+            self.close_connection = True
+            self.send_error(415, f"Unsupported Content-Encoding: {exc}")
+            return False
+        except ValueError:
+            self.close_connection = True
+            self.send_error(400, "Malformed request body")
+            return False
+        except TimeoutError:
+            self.close_connection = True
+            self.send_error(408, "Request body read timed out")
+            return False
+        finally:
+            self.raw_reader.clear(self.response_timeout())
+        return True
+
+    def discard_body(self):
+        """丢弃不处理的请求体，避免残留数据破坏持久连接上的下一个请求
+
+        请求体超过大小上限或读取超时时直接回复 413/408 并返回 False，调用方不再发送响应。
+        """
+        try:
+            stream, content_length = self.get_body_stream(decode=False)
+            stream = TimedStream(stream, self.timings)
+            if content_length is None:
+                while True:
+                    chunk = stream.read(MULTIPART_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.bytes_in += len(chunk)
+            else:
+                while content_length > 0:
+                    chunk = stream.read(min(MULTIPART_CHUNK_SIZE, content_length))
+                    if not chunk:
+                        break
+                    content_length -= len(chunk)
+                    self.bytes_in += len(chunk)
+        except BodyTooLarge:
+            self.reject_oversized_body()
+            return False
+        except ValueError:
+            self.close_connection = True
+        except TimeoutError:
+            self.close_connection = True
+            self.send_error(408, "Request body read timed out")
+            return False
+        finally:
+            self.raw_reader.clear(self.response_timeout())
+        return True
 
     def do_GET(self):
+        if not self.discard_body():
+            return
+        path = urlparse(self.path).path
+        if path == STATS_PATH:
+            self.send_stats()
+            return
+
         self.log_request_details()
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        response = {
+        if path == FILES_PREFIX or path.startswith(FILES_PREFIX + '/'):
+            self.send_static_file()
+            return
+        if path == SSE_PATH:
+            self.send_event_stream("sse")
+            return
+        if path == NDJSON_PATH:
+            self.send_event_stream("ndjson")
+            return
+        if path == LONGPOLL_PATH:
+            self.send_long_poll()
+            return
+        if path == WS_PREFIX or path.startswith(WS_PREFIX + '/'):
+            self.handle_websocket(path)
+            return
+
+        self.send_simulated_response(self.get_response())
+
+    def get_response(self):
+        """GET 的默认响应；HEAD 也用它，保证响应头（含 Content-Length）与 GET 一致"""
+        return {
             "status": "success",
             "message": "GET request received",
             "path": self.path
         }
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
 
-    def do_POST(self):
-        # 先读取请求体（在 log_request_details 之前）
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length) if content_length > 0 else b''
+    def do_HEAD(self):
+        """与 GET 返回相同的响应头，不发送响应体（send_body/send_generated_body 按 HEAD 跳过写出）
 
-        # 传递请求体给日志方法
-        self.log_request_details_with_body(body)
+        流式响应、长轮询和 WebSocket 没有确定的响应头，回复 405。
+        """
+        if not self.discard_body():
+            return
+        path = urlparse(self.path).path
+        if path == STATS_PATH:
+            self.send_stats()
+            return
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
+        self.log_request_details()
+        if path == FILES_PREFIX or path.startswith(FILES_PREFIX + '/'):
+            self.send_static_file(head_only=True)
+            return
+        if path in (SSE_PATH, NDJSON_PATH, LONGPOLL_PATH) or path == WS_PREFIX or path.startswith(WS_PREFIX + '/'):
+            self.send_response(405)
+            self.send_header('Allow', 'GET')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_simulated_response(self.get_response())
+
+    def do_POST(self):
+        # 先读取请求体（在 log_request_details 之前）并打印
+        if not self.read_and_log_body():
+            return
+        if urlparse(self.path).path == LONGPOLL_PATH:
+            self.publish_long_poll()
+            return
 
         response = {
             "status": "success",
             "message": "POST request received",
             "path": self.path
         }
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        self.send_simulated_response(response)
 
     def do_PUT(self):
-        # 先读取请求体
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length) if content_length > 0 else b''
-
-        self.log_request_details_with_body(body)
-
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
+        # 先读取请求体并打印
+        if not self.read_and_log_body():
+            return
 
         response = {
             "status": "success",
             "message": "PUT request received",
             "path": self.path
         }
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        self.send_simulated_response(response)
 
     def do_DELETE(self):
+        if not self.discard_body():
+            return
         self.log_request_details()
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
         response = {
             "status": "success",
             "message": "DELETE request received",
             "path": self.path
         }
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        self.send_simulated_response(response)
 
     def do_PATCH(self):
-        # 先读取请求体
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length) if content_length > 0 else b''
-
-        self.log_request_details_with_body(body)
-
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
+        # 先读取请求体并打印
+        if not self.read_and_log_body():
+            return
 
         response = {
             "status": "success",
             "message": "PATCH request received",
             "path": self.path
         }
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        self.send_simulated_response(response)
+
+    def log_request(self, code='-', size='-'):
+        """记录响应状态码，供汇总统计使用（不输出默认的访问日志）"""
+        if isinstance(code, int):
+            self.status_code = int(code)
 
     def log_message(self, format, *args):
         """禁用默认的日志输出"""
         pass
 
-def run_server(port=8000):
-    server_address = ('', port)
-    httpd = HTTPServer(server_address, TestRequestHandler)
+class BoundedThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """线程模式：使用固定大小的线程池处理连接
+
+    与 ThreadingHTTPServer 每个连接新建一个线程不同，这里最多同时处理
+    max_workers 个连接；线程池占满时 accept 循环会阻塞，多余的连接留在
+    内核 backlog 中排队，而不是无限制地创建线程。
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, server_address, handler_class, max_workers=64, reuse_port=False):
+        self.max_workers = max_workers
+        self.reuse_port = reuse_port
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http-worker")
+        self._slots = threading.BoundedSemaphore(max_workers)
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request_slot, request, client_address)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_slot(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncioHTTPServer:
+    """asyncio 模式：事件循环负责 accept 和并发准入
 
+    连接由事件循环非阻塞地接收，通过 asyncio.Semaphore 限制同时处理的连接数，
+    再交给有界线程池执行 TestRequestHandler（处理器本身是阻塞式的）。
+    """
+
+    def __init__(self, server_address, handler_class, max_workers=64):
+        self.server_address = server_address
+        self.RequestHandlerClass = handler_class
+        self.max_workers = max_workers
+        self.socket = socket.create_server(server_address, backlog=1024)
+        self.socket.setblocking(False)
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="http-worker") as pool:
+            while True:
+                await slots.acquire()
+                try:
+                    conn, client_address = await loop.sock_accept(self.socket)
+                except BaseException:
+                    slots.release()
+                    raise
+                conn.setblocking(True)
+                future = loop.run_in_executor(pool, self._handle_connection, conn, client_address)
+                future.add_done_callback(lambda _: slots.release())
+
+    def _handle_connection(self, conn, client_address):
+        try:
+            self.RequestHandlerClass(conn, client_address, self)
+        except Exception:
+            pass
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            conn.close()
+
+    def server_close(self):
+        self.socket.close()
+
+
+SERVER_MODES = ("single", "threaded", "asyncio", "reuseport")
+
+def _serve_reuseport_worker(port, workers, capture=None, trace=None):
+    """reuseport 模式下的单个子进程：独立绑定同一端口，由内核分发连接"""
+    CONSOLE.start()
+    ROUTES.start_watching()
+    if capture:
+        # 每个进程写各自的抓包文件，避免多进程交错写入
+        RECORDER.open(f"{capture}.{os.getpid()}")
+    if trace:
+        TRACE.open(f"{trace}.{os.getpid()}")
+    httpd = BoundedThreadingHTTPServer(('', port), TestRequestHandler, max_workers=workers, reuse_port=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        RECORDER.close()
+        TRACE.close()
+        CONSOLE.close()
+
+def run_server(port=8000, mode="threaded", workers=64, processes=None, capture=None, trace=None):
+    if mode == "reuseport" and not hasattr(socket, "SO_REUSEPORT"):
+        color_print('red', "❌ 当前平台不支持 SO_REUSEPORT，无法使用 reuseport 模式")
+        sys.exit(1)
+
+    processes = processes or os.cpu_count() or 1
+
+    CONSOLE.start()
     color_print('bold', f"\n🚀 HTTP 测试服务器启动")
     color_print('green', f"✓ 监听端口: {port}")
     color_print('green', f"✓ 访问地址: http://localhost:{port}")
     color_print('green', f"✓ 文件保存目录: {os.path.abspath(UPLOAD_DIR)}")
+    if UPLOAD_STORE.max_bytes > 0:
+        color_print('green', f"✓ 上传存储上限: {UPLOAD_STORE.max_bytes / 1024 / 1024:.0f} MB (LRU 淘汰)")
+    color_print('green', f"✓ 文件下载: http://localhost:{port}{FILES_PREFIX}/ -> {os.path.abspath(FILES_DIR)}")
+    color_print('green', f"✓ 统计接口: http://localhost:{port}{STATS_PATH} (?format=prometheus, ?reset=1)")
+    if ROUTES.enabled:
+        color_print('green', f"✓ 模拟路由: {os.path.abspath(ROUTES.path)} - {ROUTES.describe(ROUTES.table)}，文件变化时自动重新加载")
+        if mode != "reuseport":
+            ROUTES.start_watching()
+    color_print('green', f"✓ 流式响应: {SSE_PATH} (SSE), {NDJSON_PATH} (NDJSON)  ?rate=&size=&count=&duration=")
+    color_print('green', f"✓ 长轮询: GET {LONGPOLL_PATH}?channel=&delay_ms=&since=  发布: POST {LONGPOLL_PATH}?channel=")
+    color_print('green', f"✓ WebSocket: ws://localhost:{port}{WS_PREFIX}/{{echo,broadcast,push}} (发送队列 {TestRequestHandler.ws_queue_size} 条)")
+    handler = TestRequestHandler
+    limits = [f"头部 {handler.header_timeout or '不限'} s", f"单次读取 {handler.read_timeout or '不限'} s",
+              f"请求体 {handler.body_timeout or '不限'} s",
+              f"大小上限 {f'{handler.max_body_bytes / 1024 / 1024:g} MB' if handler.max_body_bytes else '不限'}"]
+    color_print('green', f"✓ 慢客户端保护: {', '.join(limits)}")
+    codings = ", ".join(CONTENT_CODINGS) + ("" if brotli is not None else " (未安装 brotli，不支持 br)")
+    color_print('green', f"✓ 请求体解压: {codings}")
+    if TestRequestHandler.compress_responses:
+        color_print('green', f"✓ 响应压缩: 按 Accept-Encoding 协商 (≥ {TestRequestHandler.compress_min_bytes} 字节)")
+    if capture:
+        suffix = ".<pid>" if mode == "reuseport" else ""
+        color_print('green', f"✓ 抓包文件: {os.path.abspath(capture)}{suffix} (+ .bodies)")
+        if mode != "reuseport":
+            RECORDER.open(capture)
+    if trace:
+        suffix = ".<pid>" if mode == "reuseport" else ""
+        color_print('green', f"✓ 跟踪日志: {os.path.abspath(trace)}{suffix} (每个请求的 X-Request-Id 与各阶段耗时)")
+        if mode != "reuseport":
+            TRACE.open(trace)
+    if mode == "single":
+        # 单线程一次只能处理一个连接：不保持连接，流式响应、长轮询和 WebSocket 期间其他请求都要等待
+        TestRequestHandler.keep_alive = False
+        color_print('green', f"✓ 并发模式: single (单线程，不保持连接)")
+        color_print('yellow', "⚠️  single 模式下流式响应、长轮询和 WebSocket 会阻塞其他请求，长轮询无法被发布请求唤醒")
+    elif mode == "reuseport":
+        color_print('green', f"✓ 并发模式: reuseport ({processes} 个进程 × {workers} 个工作线程)")
+    else:
+        color_print('green', f"✓ 并发模式: {mode} ({workers} 个工作线程)")
+    if CONSOLE.quiet:
+        color_print('green', f"✓ 日志模式: quiet (每秒汇总)")
+    if CONSOLE.sample_every > 1:
+        color_print('green', f"✓ 采样打印: 每 {CONSOLE.sample_every} 个请求打印 1 个")
     color_print('yellow', "\n提示: 按 Ctrl+C 停止服务器\n")
 
+    server_address = ('', port)
     try:
-        httpd.serve_forever()
+        if mode == "asyncio":
+            httpd = AsyncioHTTPServer(server_address, TestRequestHandler, max_workers=workers)
+            try:
+                asyncio.run(httpd.serve_forever())
+            finally:
+                httpd.server_close()
+        elif mode == "reuseport":
+            # fork 前停止日志线程，子进程各自启动自己的日志线程
+            CONSOLE.close()
+            ctx = multiprocessing.get_context("fork")
+            children = [
+                ctx.Process(target=_serve_reuseport_worker, args=(port, workers, capture, trace), daemon=True)
+                for _ in range(processes)
+            ]
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+        else:
+            if mode == "threaded":
+                httpd = BoundedThreadingHTTPServer(server_address, TestRequestHandler, max_workers=workers)
+            else:
+                httpd = HTTPServer(server_address, TestRequestHandler)
+            try:
+                httpd.serve_forever()
+            finally:
+                httpd.server_close()
     except KeyboardInterrupt:
+        RECORDER.close()
+        TRACE.close()
+        CONSOLE.close()
         color_print('red', "\n\n👋 服务器已停止")
         sys.exit(0)
 
+def build_parser():
+    parser = argparse.ArgumentParser(description="HTTP 测试服务器 - 用于测试 HttpRequestModule")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口 (默认 8000)")
+    parser.add_argument(
+        "--mode",
+        choices=SERVER_MODES,
+        default="threaded",
+        help="并发模式: single=单线程（不保持连接）, threaded=线程池 (默认), asyncio=事件循环+线程池, "
+             "reuseport=多进程 SO_REUSEPORT",
+    )
+    parser.add_argument("--workers", type=int, default=64, help="每个进程的最大并发连接数 (默认 64)")
+    parser.add_argument("--processes", type=int, help="reuseport 模式下的进程数 (默认 CPU 核数)")
+    parser.add_argument(
+        "--keep-alive-timeout",
+        type=float,
+        default=TestRequestHandler.keep_alive_timeout,
+        help="持久连接空闲超时秒数，0 表示不超时 (默认 5)",
+    )
+    parser.add_argument("--header-timeout", type=float, default=TestRequestHandler.header_timeout, help="从收到请求的第一个字节起，读完请求头的截止时间 (秒)，超时回复 408；0 表示不限制 (默认 10)")
+    parser.add_argument("--read-timeout", type=float, default=TestRequestHandler.read_timeout, help="读取请求体时单次等待数据的超时 (秒)，0 表示不限制 (默认 30)")
+    parser.add_argument("--body-timeout", type=float, default=TestRequestHandler.body_timeout, help="读完整个请求体的截止时间 (秒)，0 表示不限制 (默认 0)")
+    parser.add_argument("--max-body-mb", type=float, default=0, help="请求体大小上限 (MB)，超过时回复 413 (带 Expect: 100-continue 的请求在上传前即拒绝)；0 表示不限制")
+    parser.add_argument("--quiet", action="store_true", help="不打印逐请求详情，只输出每秒汇总 (req/s、入站字节、状态码分布)")
+    parser.add_argument("--sample", type=int, default=1, metavar="N", help="每 N 个请求打印 1 个的详细信息 (默认 1，即全部打印)")
+
+    parser.add_argument("--upload-max-mb", type=float, default=0, help="上传目录中内容的总大小上限 (MB)，超过后按 LRU 淘汰；0 表示不限制；不能用于 reuseport 模式")
+    parser.add_argument("--capture", metavar="FILE", help="把每个请求追加写入抓包文件 (JSONL 索引 + FILE.bodies)，可用 replay_capture.py 回放")
+    parser.add_argument("--no-compress", action="store_true", help="不按 Accept-Encoding 压缩响应 (请求体仍会解压)")
+    parser.add_argument("--compress-min-bytes", type=int, default=TestRequestHandler.compress_min_bytes, help="小于该大小的响应体不压缩 (默认 256)")
+    parser.add_argument("--compress-level", type=int, default=TestRequestHandler.compress_level, help="gzip/deflate 压缩级别 1-9，brotli 质量 0-11 (默认 6)")
+    parser.add_argument("--ws-queue", type=int, default=TestRequestHandler.ws_queue_size, help="每个 WebSocket 连接的发送队列长度 (消息数)，满时 push/echo 阻塞、broadcast 丢弃 (默认 256)")
+    parser.add_argument("--routes", metavar="FILE", help="JSON 模拟路由配置 (精确/前缀/正则路由，模板化的状态码、头部、响应体和延迟)，修改后自动重新加载")
+    parser.add_argument("--trace", metavar="FILE", help="把每个请求的 X-Request-Id 和各阶段耗时 (与 Server-Timing 相同) 追加写入 JSONL 跟踪日志")
+    parser.add_argument("--files-dir", default=FILES_DIR, help=f"{FILES_PREFIX}/ 路由提供下载的目录 (默认与上传目录相同)")
+
+    simulation = parser.add_argument_group("响应模拟", "默认值，可被请求中的 __delay/__jitter/__status/__body_mb 查询参数覆盖")
+    simulation.add_argument("--delay-ms", type=float, help="每个响应的固定延迟 (毫秒)")
+    simulation.add_argument("--jitter-ms", type=float, help="延迟的随机抖动幅度 (毫秒)")
+    simulation.add_argument("--status-sequence", metavar="CODES", help="状态码序列，如 503,503,200")
+    simulation.add_argument("--body-mb", type=float, help="返回指定大小 (MB) 的流式生成数据")
+    return parser
+
+def main():
+    global FILES_DIR
+    args = build_parser().parse_args()
+    FILES_DIR = args.files_dir
+    if args.mode == "reuseport" and args.upload_max_mb > 0:
+        # 各进程的 LRU 索引互不相通：每个进程各自执行上限，还会淘汰其他进程仍在使用的内容
+        color_print('red', "❌ --upload-max-mb 不能与 reuseport 模式同时使用")
+        sys.exit(1)
+    UPLOAD_STORE.max_bytes = int(args.upload_max_mb * 1024 * 1024)
+    UPLOAD_STORE.load()
+    if args.routes:
+        try:
+            ROUTES.load(args.routes)
+        except (OSError, ValueError) as exc:
+            color_print('red', f"❌ 无法加载模拟路由 {args.routes}: {exc}")
+            sys.exit(1)
+    TestRequestHandler.keep_alive_timeout = args.keep_alive_timeout or None
+    TestRequestHandler.compress_responses = not args.no_compress
+    TestRequestHandler.compress_min_bytes = args.compress_min_bytes
+    TestRequestHandler.compress_level = args.compress_level
+    TestRequestHandler.ws_queue_size = args.ws_queue
+    TestRequestHandler.header_timeout = args.header_timeout or None
+    TestRequestHandler.read_timeout = args.read_timeout or None
+    TestRequestHandler.body_timeout = args.body_timeout or None
+    TestRequestHandler.max_body_bytes = int(args.max_body_mb * 1024 * 1024)
+    CONSOLE.quiet = args.quiet
+    CONSOLE.sample_every = max(1, args.sample)
+    for name, value in (("delay", args.delay_ms), ("jitter", args.jitter_ms),
+                        ("status", args.status_sequence), ("body_mb", args.body_mb)):
+        if value is not None:
+            SIMULATOR.defaults[name] = value
+    try:
+        SIMULATOR.parse_status_and_body(args.status_sequence, args.body_mb)
+    except ValueError as exc:
+        color_print('red', f"❌ 无效的模拟参数: {exc}")
+        sys.exit(1)
+    run_server(port=args.port, mode=args.mode, workers=args.workers, processes=args.processes,
+               capture=args.capture, trace=args.trace)
+
 if __name__ == '__main__':
-    run_server()
+    main()
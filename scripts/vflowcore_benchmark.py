@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+vFlowCore 往返延迟压测 - 基于 vflowcore_client.py 的协议实现
+
+对每种调用（ping、getClipboard、tap、swipe、exec、capture）在多个并发级别下各发送 N 个请求，
+每次调用的往返时间记入固定桶直方图，统计 p50/p90/p99 与 req/s：
+    warm  每个工作线程一条持久连接，只测请求往返
+    cold  每个请求新建连接，包含建连时间（另外单独统计建连耗时）
+
+传输可以是 TCP 或抽象 UNIX socket（--transports tcp,unix，UNIX 需在设备上运行，如 Termux），
+两者都测时额外输出同一调用、模式、并发下 TCP 与 UNIX 的延迟对比。
+
+结果可输出为 JSON，并记录 vFlowCore 的版本（ping 返回的 versionName/versionCode），
+也可以保存为基线，之后与基线比较，吞吐下降或 p99 上升超过阈值即视为回归（退出码 1）。
+
+注意 tap/swipe 会真的操作屏幕，默认不运行，需要用 --calls 显式指定。
+
+用法：
+    python3 mock_vflowcore.py --latency '*=1~0.5' &
+    python3 vflowcore_benchmark.py --requests 500 --concurrency 1,4,16
+    python3 vflowcore_benchmark.py --calls ping,tap,swipe --json > bench.json
+    python3 vflowcore_benchmark.py --transports tcp,unix --calls ping,capture   # TCP 与 UNIX 对比
+    python3 vflowcore_benchmark.py --save-baseline baseline.json
+    python3 vflowcore_benchmark.py --baseline baseline.json --threshold 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from perf_stats import Histogram
+from vflowcore_client import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_UNIX_SOCKET,
+    VFlowCoreClient,
+    build_request,
+    endpoint_name,
+)
+
+# 可压测的调用：名称 -> (target, method, params)
+CALLS: Dict[str, Tuple[str, str, Dict[str, Any]]] = {
+    "ping": ("system", "ping", {}),
+    "getClipboard": ("clipboard", "getClipboard", {}),
+    "tap": ("input", "tap", {"x": 500, "y": 500}),
+    "swipe": ("input", "swipe", {"x1": 500, "y1": 1200, "x2": 500, "y2": 1000, "duration": 50}),
+    "exec": ("system", "exec", {"cmd": "true"}),
+    "capture": ("screenshot", "captureScreen", {"maxWidth": 540, "includeBase64": True}),
+}
+# 默认只跑没有副作用的调用
+DEFAULT_CALLS = ("ping", "getClipboard", "exec", "capture")
+MODES = ("warm", "cold")
+TRANSPORTS = ("tcp", "unix")
+
+# 压测与推送流统计输出的分位数
+LATENCY_QUANTILES = (0.50, 0.90, 0.99)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Round-trip latency benchmark for vFlowCore calls.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="vFlowCore host.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="vFlowCore port.")
+    parser.add_argument("--socket", default=DEFAULT_UNIX_SOCKET, help="Abstract UNIX socket name for the unix transport.")
+    parser.add_argument(
+        "--transports",
+        default="tcp",
+        help="Comma-separated transports: tcp, unix. Both together add a TCP vs UNIX comparison.",
+    )
+    parser.add_argument(
+        "--calls",
+        default=",".join(DEFAULT_CALLS),
+        help=f"Comma-separated calls to run. Choices: {', '.join(CALLS)}. tap/swipe touch the screen.",
+    )
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes: warm, cold.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels to sweep.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per call/transport/mode/concurrency level.")
+    parser.add_argument("--warmup", type=int, default=10, help="Warm-up requests per level, excluded from stats.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-response timeout in seconds.")
+    parser.add_argument("--baseline", help="Compare results against this baseline file.")
+    parser.add_argument("--save-baseline", help="Write results to this baseline file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Regression threshold in percent for req/s drop and p99 increase.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return parser
+
+
+def make_client(args: argparse.Namespace, transport: str) -> VFlowCoreClient:
+    return VFlowCoreClient(args.host, args.port, timeout=args.timeout,
+                           unix=args.socket if transport == "unix" else None)
+
+
+class CallWorker:
+    """闭环发送同一种调用，直到请求配额用完；每个线程独立记录直方图"""
+
+    def __init__(self, args: argparse.Namespace, request: Dict[str, Any], transport: str, mode: str, total: int):
+        self.args = args
+        self.request = request
+        self.transport = transport
+        self.mode = mode
+        self.remaining = total
+        self.lock = threading.Lock()
+        self.rtt = Histogram()
+        self.connect = Histogram()
+        self.completed = 0
+        self.failures = 0
+        self.errors = 0
+        self.bytes_received = 0
+
+    def _take_ticket(self) -> bool:
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _client(self) -> VFlowCoreClient:
+        return make_client(self.args, self.transport).connect()
+
+    def run(self) -> None:
+        rtt, connect = Histogram(), Histogram()
+        completed = failures = errors = received = 0
+        client: Optional[VFlowCoreClient] = None
+        try:
+            while self._take_ticket():
+                try:
+                    if self.mode == "cold":
+                        started = time.perf_counter()
+                        client = self._client()
+                        connected = time.perf_counter()
+                        result = client.exchange(self.request)
+                        elapsed = time.perf_counter() - started
+                        client.close()
+                        client = None
+                        connect.observe((connected - started) * 1000)
+                    else:
+                        if client is None:
+                            client = self._client()
+                        result = client.exchange(self.request)
+                        elapsed = result.elapsed
+                except OSError:
+                    errors += 1
+                    if client is not None:
+                        client.close()
+                        client = None
+                    continue
+                rtt.observe(elapsed * 1000)
+                completed += 1
+                received += result.bytes_received
+                try:
+                    failures += not result.json().get("success", False)
+                except ValueError:
+                    failures += 1
+        finally:
+            if client is not None:
+                client.close()
+            with self.lock:
+                self.rtt.merge(rtt)
+                self.connect.merge(connect)
+                self.completed += completed
+                self.failures += failures
+                self.errors += errors
+                self.bytes_received += received
+
+
+def run_pool(worker: CallWorker, concurrency: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker.run)
+    return time.perf_counter() - started
+
+
+def run_level(name: str, transport: str, mode: str, concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    target, method, params = CALLS[name]
+    request = build_request(target, method, params)
+    if args.warmup > 0:
+        run_pool(CallWorker(args, request, transport, mode, args.warmup), concurrency)
+
+    worker = CallWorker(args, request, transport, mode, args.requests)
+    duration = run_pool(worker, concurrency)
+    result = {
+        "call": name,
+        "target": target,
+        "method": method,
+        "transport": transport,
+        "mode": mode,
+        "concurrency": concurrency,
+        "completed": worker.completed,
+        "failures": worker.failures,
+        "errors": worker.errors,
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(worker.completed / duration, 2) if duration > 0 else 0.0,
+        "response_bytes_avg": round(worker.bytes_received / worker.completed) if worker.completed else 0,
+        "latency_ms": worker.rtt.to_dict(LATENCY_QUANTILES, digits=3),
+    }
+    if mode == "cold":
+        result["connect_ms"] = worker.connect.to_dict(LATENCY_QUANTILES, digits=3)
+    return result
+
+
+def probe_core(args: argparse.Namespace, transports: List[str]) -> Dict[str, Any]:
+    """用 ping 取 vFlowCore 的版本信息，写入结果以便跨版本比较；每种传输都先连一次确认可用"""
+    info: Dict[str, Any] = {}
+    pipelining = False
+    for transport in transports:
+        with make_client(args, transport) as client:
+            info = client.ping()
+            pipelining = client.supports_pipelining()
+    return {
+        "host": args.host,
+        "port": args.port,
+        "endpoints": {transport: endpoint_name(args.host, args.port, args.socket if transport == "unix" else None)
+                      for transport in transports},
+        "version": info.get("versionName"),
+        "versionCode": info.get("versionCode"),
+        "uid": info.get("uid"),
+        "pipelining": pipelining,
+    }
+
+
+def result_key(result: Dict[str, Any], **override: Any) -> str:
+    fields = {**result, **override}
+    return f"{fields['call']}/{fields['transport']}/{fields['mode']}@{fields['concurrency']}"
+
+
+def latency_delta(base: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, float]:
+    """other 相对 base 的 p50/p99 差值（毫秒）"""
+    delta = {}
+    for q in ("p50", "p99"):
+        if base["latency_ms"][q] is not None and other["latency_ms"][q] is not None:
+            delta[f"{q}_extra_ms"] = round(other["latency_ms"][q] - base["latency_ms"][q], 3)
+    return delta
+
+
+def warm_cold_summary(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一调用、传输、并发下 cold 比 warm 多出的 p50/p99"""
+    by_key = {result_key(r): r for r in results}
+    summary = []
+    for result in results:
+        if result["mode"] != "warm":
+            continue
+        cold = by_key.get(result_key(result, mode="cold"))
+        if not cold:
+            continue
+        entry = {"call": result["call"], "transport": result["transport"], "concurrency": result["concurrency"]}
+        entry.update(latency_delta(result, cold))
+        entry["connect_p50_ms"] = cold["connect_ms"]["p50"]
+        summary.append(entry)
+    return summary
+
+
+def transport_summary(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一调用、模式、并发下 UNIX 相对 TCP 的 p50/p99 差值和吞吐比"""
+    by_key = {result_key(r): r for r in results}
+    summary = []
+    for result in results:
+        if result["transport"] != "tcp":
+            continue
+        unix = by_key.get(result_key(result, transport="unix"))
+        if not unix:
+            continue
+        entry = {"call": result["call"], "mode": result["mode"], "concurrency": result["concurrency"],
+                 "tcp_p50_ms": result["latency_ms"]["p50"], "unix_p50_ms": unix["latency_ms"]["p50"]}
+        entry.update(latency_delta(result, unix))
+        if result["requests_per_second"]:
+            entry["rps_ratio"] = round(unix["requests_per_second"] / result["requests_per_second"], 2)
+        summary.append(entry)
+    return summary
+
+
+def compare_transports(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_name: str = DEFAULT_UNIX_SOCKET,
+                       calls: Tuple[str, ...] = ("ping",), requests: int = 100,
+                       timeout: float = 10.0) -> Dict[str, Any]:
+    """单连接下 TCP 与 UNIX 的快速对比（warm + cold，并发 1），供调试工具调用"""
+    args = build_parser().parse_args([
+        "--host", host, "--port", str(port), "--socket", socket_name,
+        "--requests", str(requests), "--warmup", "5", "--timeout", str(timeout),
+    ])
+    results = [run_level(name, transport, mode, 1, args)
+               for name in calls for mode in MODES for transport in TRANSPORTS]
+    return {"results": results, "tcp_vs_unix": transport_summary(results)}
+
+
+def compare_with_baseline(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float
+) -> List[Dict[str, Any]]:
+    """吞吐下降或 p99 上升超过阈值（百分比）即记为回归"""
+    previous = baseline.get("results", {})
+    regressions: List[Dict[str, Any]] = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if not old:
+            continue
+        old_rps = old.get("requests_per_second") or 0
+        new_rps = result["requests_per_second"]
+        if old_rps > 0 and new_rps < old_rps * (1 - threshold / 100):
+            regressions.append({
+                "key": result_key(result),
+                "metric": "requests_per_second",
+                "baseline": old_rps,
+                "current": new_rps,
+                "change_percent": round((new_rps - old_rps) / old_rps * 100, 1),
+            })
+        old_p99 = (old.get("latency_ms") or {}).get("p99")
+        new_p99 = result["latency_ms"]["p99"]
+        if old_p99 and new_p99 is not None and new_p99 > old_p99 * (1 + threshold / 100):
+            regressions.append({
+                "key": result_key(result),
+                "metric": "latency_p99_ms",
+                "baseline": old_p99,
+                "current": new_p99,
+                "change_percent": round((new_p99 - old_p99) / old_p99 * 100, 1),
+            })
+    return regressions
+
+
+def format_delta(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:+}"
+
+
+def print_results(core: Dict[str, Any], results: List[Dict[str, Any]], summary: List[Dict[str, Any]],
+                  transports: List[Dict[str, Any]], regressions: Optional[List[Dict[str, Any]]],
+                  baseline_version: Optional[str]) -> None:
+    print(f"vFlowCore {core['version']} (versionCode {core['versionCode']}, uid {core['uid']}) "
+          f"@ {', '.join(core['endpoints'].values())}")
+    print("=" * 102)
+    print(f"{'调用':<12}{'传输':<4}{'模式':<6}{'并发':>5}{'完成':>7}{'失败':>6}{'错误':>6}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print("-" * 102)
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['call']:<14}{result['transport']:<6}{result['mode']:<8}{result['concurrency']:>5}"
+              f"{result['completed']:>7}"
+              f"{result['failures']:>6}{result['errors']:>6}{result['requests_per_second']:>10}"
+              f"{latency['p50'] or '-':>10}{latency['p90'] or '-':>10}{latency['p99'] or '-':>10}"
+              f"{latency['max'] or '-':>10}")
+    print("=" * 102)
+    if summary:
+        print("cold 相对 warm 的额外耗时：")
+        for entry in summary:
+            print(f"  {entry['call']:<14}{entry['transport']:<6}@{entry['concurrency']:<4} "
+                  f"p50 {format_delta(entry.get('p50_extra_ms'))} ms  p99 {format_delta(entry.get('p99_extra_ms'))} ms  "
+                  f"(建连 p50 {entry['connect_p50_ms']} ms)")
+    if transports:
+        print("UNIX 相对 TCP：")
+        for entry in transports:
+            print(f"  {entry['call']:<14}{entry['mode']:<6}@{entry['concurrency']:<4} "
+                  f"p50 {entry['tcp_p50_ms']} -> {entry['unix_p50_ms']} ms "
+                  f"({format_delta(entry.get('p50_extra_ms'))})  p99 {format_delta(entry.get('p99_extra_ms'))} ms  "
+                  f"吞吐 x{entry.get('rps_ratio', '-')}")
+    if regressions is None:
+        return
+    suffix = f"（基线版本 {baseline_version}）" if baseline_version else ""
+    if not regressions:
+        print(f"与基线相比没有回归{suffix}")
+        return
+    print(f"发现 {len(regressions)} 项回归{suffix}：")
+    for item in regressions:
+        print(f"  {item['key']:<28} {item['metric']:<22} {item['baseline']} -> {item['current']} "
+              f"({item['change_percent']:+}%)")
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    calls = [name.strip() for name in args.calls.split(",") if name.strip()]
+    unknown = [name for name in calls if name not in CALLS]
+    if unknown:
+        raise SystemExit(f"Unknown call(s): {', '.join(unknown)}")
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    if any(mode not in MODES for mode in modes):
+        raise SystemExit(f"Unknown mode(s): {args.modes}")
+    transports = [transport.strip() for transport in args.transports.split(",") if transport.strip()]
+    if not transports or any(transport not in TRANSPORTS for transport in transports):
+        raise SystemExit(f"Unknown transport(s): {args.transports}")
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    try:
+        core = probe_core(args, transports)
+    except OSError as e:
+        print(f"无法连接到 vFlowCore: {e}", file=sys.stderr)
+        return 2
+
+    results: List[Dict[str, Any]] = []
+    for name in calls:
+        for mode in modes:
+            for concurrency in levels:
+                # 同一组参数下相邻地跑各传输，减少设备负载漂移对对比的影响
+                for transport in transports:
+                    if not args.json:
+                        print(f"运行 {name} ({transport}/{mode}) @ 并发 {concurrency} ...", file=sys.stderr)
+                    results.append(run_level(name, transport, mode, concurrency, args))
+    summary = warm_cold_summary(results)
+    by_transport = transport_summary(results)
+
+    regressions = None
+    baseline_version = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        baseline_version = (baseline.get("vFlowCore") or {}).get("version")
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+
+    created = time.strftime("%Y-%m-%d %H:%M:%S")
+    if args.save_baseline:
+        payload = {
+            "created": created,
+            "vFlowCore": core,
+            "requests": args.requests,
+            "results": {result_key(result): result for result in results},
+        }
+        Path(args.save_baseline).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.json:
+        print(json.dumps({
+            "created": created,
+            "vFlowCore": core,
+            "results": results,
+            "warm_vs_cold": summary,
+            "tcp_vs_unix": by_transport,
+            "regressions": regressions,
+        }, ensure_ascii=False, indent=2))
+    else:
+        print_results(core, results, summary, by_transport, regressions, baseline_version)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,867 @@
+#!/usr/bin/env python3
+"""
+vFlowCore 客户端 - 不依赖 GUI 的协议库和命令行工具
+
+传输：TCP（默认 127.0.0.1:19999）或抽象命名空间 UNIX socket（--unix，仅 Linux/Android）。
+协议：每个请求是一行 JSON（{"target", "method", "params"} + "\\n"），
+vFlowCore 对每个请求返回一行 JSON 响应。请求带 "id" 时 core 并发处理并在响应中回显 id
+（可能乱序），客户端据此流水线发送；旧版 core 不回显 id，客户端自动退回一问一答。
+
+本模块提供同步客户端 VFlowCoreClient 和 asyncio 客户端 AsyncVFlowCoreClient，
+调试工具 vflowcore_debugger.py 也基于它实现。命令行路径不导入 tkinter。
+
+用法：
+    python3 vflowcore_client.py ping
+    python3 vflowcore_client.py call input tap x=500 y=500
+    python3 vflowcore_client.py call clipboard setClipboard text="Hello World"
+    python3 vflowcore_client.py call system exec --params '{"cmd": "ls /sdcard"}'
+    python3 vflowcore_client.py --host 192.168.1.100 test --scope regular
+    python3 vflowcore_client.py --unix ping                                  # 设备上经 @com_chaomixian_vflow_vflow_core
+    python3 vflowcore_client.py --unix --socket com_example_vflow_core ping  # 其他包名的 core
+    python3 vflowcore_client.py burst input tap x=500 y=500 --count 200     # 比较逐个和流水线的吞吐
+
+作为库使用：
+    from vflowcore_client import VFlowCoreClient
+    with VFlowCoreClient("127.0.0.1", 19999) as client:
+        print(client.call("input", "tap", {"x": 500, "y": 500}))
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import socket
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 19999
+# core 监听的抽象 UNIX socket 名（包名中的 . 换成 _，再加 _vflow_core），
+# 在设备上（Termux）可直连，或通过 adb forward tcp:19999 localabstract:<名称> 转发
+DEFAULT_UNIX_SOCKET = "com_chaomixian_vflow_vflow_core"
+# 连接超时（秒）；连接建立后默认不设读写超时，避免长时间无操作断开
+CONNECT_TIMEOUT = 5.0
+# 接收缓冲的初始大小和上限；见过更大的响应帧后按 2 的幂扩大
+RECV_CHUNK = 64 * 1024
+MAX_RECV_CHUNK = 4 * 1024 * 1024
+# asyncio 客户端单帧上限（截图等大响应可达数 MB）
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+# 流水线模式下同时在途的请求数，与 core 端 Config.MAX_PIPELINED_REQUESTS 一致
+PIPELINE_WINDOW = 32
+
+# 自动测试用例：(target, method, params, 描述)
+TEST_CASES: Dict[str, List[Tuple[str, str, Dict[str, Any], str]]] = {
+    "safe": [  # 安全测试（无副作用）
+        ("system", "ping", {}, "Ping 测试"),
+        ("clipboard", "getClipboard", {}, "获取剪贴板"),
+    ],
+    "destructive": [  # 有副作用的测试
+        ("clipboard", "setClipboard", {"text": "Auto Test from vFlowCore Debugger"}, "设置剪贴板"),
+        ("wifi", "setWifiEnabled", {"enabled": True}, "开启 WiFi"),
+        ("wifi", "setWifiEnabled", {"enabled": False}, "关闭 WiFi"),
+        ("bluetooth_manager", "setBluetoothEnabled", {"enabled": True}, "开启蓝牙"),
+        ("bluetooth_manager", "setBluetoothEnabled", {"enabled": False}, "关闭蓝牙"),
+        ("power", "wakeUp", {}, "唤醒屏幕"),
+        ("power", "goToSleep", {}, "关闭屏幕"),
+    ],
+    "dangerous": [  # 危险测试（会杀死应用或影响系统）
+        ("input", "tap", {"x": 500, "y": 500}, "点击屏幕"),
+        ("input", "swipe", {"x1": 500, "y1": 500, "x2": 500, "y2": 1000, "duration": 300}, "滑动屏幕"),
+        ("input", "inputText", {"text": "test"}, "输入文本"),
+        ("activity", "forceStopPackage", {"package": "com.chaomixian.vflow"}, "强制停止应用"),
+    ],
+}
+
+# 测试范围 -> 包含的用例组
+TEST_SCOPES = {
+    "safe": ("safe",),
+    "regular": ("safe", "destructive"),
+    "full": ("safe", "destructive", "dangerous"),
+}
+
+
+class PeerClosed(ConnectionError):
+    """对端在返回完整响应帧之前关闭了连接"""
+
+
+class RequestInterrupted(ConnectionError):
+    """请求已完整发出，连接在收到响应前断开；不自动重发，方法可能已经执行"""
+
+
+class LineReader:
+    """按 \\n 切分响应帧的缓冲读取器
+
+    vFlowCore 的每个响应是一行 JSON，长度不定（截图、exec 输出可达数 MB）。
+    读取器把多次 recv 的数据拼成完整帧，多读到的字节留给下一帧，
+    不会把上一个响应的尾巴算到下一个请求头上。
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.chunk = bytearray(RECV_CHUNK)
+        self.largest_frame = 0
+        self.first_byte_at: Optional[float] = None
+
+    def read_frame(self) -> bytes:
+        """读取一个完整帧（不含结尾的 \\n）"""
+        self.first_byte_at = time.perf_counter() if self.buffer else None
+        scan_from = 0
+        while True:
+            end = self.buffer.find(b"\n", scan_from)
+            if end >= 0:
+                frame = bytes(self.buffer[:end])
+                del self.buffer[:end + 1]
+                if end > self.largest_frame:
+                    self.largest_frame = end
+                    self._grow(end)
+                return frame
+            scan_from = len(self.buffer)
+
+            n = self.sock.recv_into(self.chunk)
+            if n == 0:
+                if self.buffer:
+                    raise ConnectionError(f"连接在响应帧中途关闭（已收到 {len(self.buffer)} 字节）")
+                raise PeerClosed("连接已被 vFlowCore 关闭")
+            if self.first_byte_at is None:
+                self.first_byte_at = time.perf_counter()
+            self.buffer += memoryview(self.chunk)[:n]
+
+    def _grow(self, frame_size: int):
+        """按见过的最大帧预分配接收缓冲，大响应用更少的 recv 读完"""
+        size = len(self.chunk)
+        while size < frame_size and size < MAX_RECV_CHUNK:
+            size *= 2
+        if size != len(self.chunk):
+            self.chunk = bytearray(size)
+
+
+class Exchange(NamedTuple):
+    """一次请求/响应的结果和传输统计"""
+    request: str
+    response: str
+    reconnected: bool
+    bytes_sent: int
+    bytes_received: int
+    elapsed: float       # 发送开始到收到完整响应（秒）
+    first_byte: float    # 发送开始到收到第一个字节（秒）
+
+    def json(self) -> Dict[str, Any]:
+        """解析响应 JSON"""
+        return json.loads(self.response)
+
+    def describe(self) -> str:
+        """传输统计的简短描述"""
+        text = f"{format_bytes(self.bytes_received)}, {self.elapsed * 1000:.1f} ms"
+        if self.bytes_received >= RECV_CHUNK and self.elapsed > 0:
+            text += f", {format_bytes(self.bytes_received / self.elapsed)}/s"
+        return text
+
+
+def format_bytes(size: float) -> str:
+    """字节数转为可读文本"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} MB"
+
+
+def unix_family() -> int:
+    """AF_UNIX；平台不支持时抛出 OSError，与连接失败同样处理"""
+    family = getattr(socket, "AF_UNIX", None)
+    if family is None:
+        raise OSError("当前平台不支持 UNIX socket")
+    return family
+
+
+def abstract_address(name: str) -> str:
+    """抽象命名空间地址：名称前加 NUL 字节（对应 Android 的 LocalSocketAddress.Namespace.ABSTRACT）"""
+    return "\0" + name.lstrip("@")
+
+
+def endpoint_name(host: str, port: int, unix: Optional[str] = None) -> str:
+    """连接端点的显示名称：host:port 或 @name"""
+    return f"@{unix.lstrip('@')}" if unix else f"{host}:{port}"
+
+
+def build_request(target: str, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """构建请求对象"""
+    return {"target": target, "method": method, "params": params or {}}
+
+
+def encode_request(req: Dict[str, Any]) -> bytes:
+    """请求对象编码为一帧"""
+    return (json.dumps(req) + "\n").encode("utf-8")
+
+
+def frame_id(frame: bytes) -> Any:
+    """取出响应帧中回显的请求 id；没有 id 或无法解析时返回 None"""
+    try:
+        response = json.loads(frame)
+    except ValueError:
+        return None
+    return response.get("id") if isinstance(response, dict) else None
+
+
+def make_exchange(payload: bytes, frame: bytes, reconnected: bool,
+                  start: float, first_byte_at: Optional[float], end: float) -> Exchange:
+    """根据收发数据和时间点构建 Exchange"""
+    return Exchange(
+        request=payload.decode("utf-8").strip(),
+        response=frame.decode("utf-8", errors="replace").strip(),
+        reconnected=reconnected,
+        bytes_sent=len(payload),
+        bytes_received=len(frame) + 1,
+        elapsed=end - start,
+        first_byte=max((first_byte_at or end) - start, 0.0),
+    )
+
+
+class VFlowCoreClient:
+    """同步 vFlowCore 客户端
+
+    exchange/call 一次一个请求；pipeline 给请求带上 id，一次保持多个在途，
+    响应按 id 匹配（可乱序）。不是线程安全的；多线程使用时每个线程各建一个客户端，
+    或像调试工具那样由单个 I/O 线程独占。
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 connect_timeout: float = CONNECT_TIMEOUT, timeout: Optional[float] = None,
+                 reconnect: bool = True, unix: Optional[str] = None):
+        self.host = host
+        self.port = port
+        # 抽象 UNIX socket 名；设置后忽略 host/port
+        self.unix = unix
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.socket: Optional[socket.socket] = None
+        self.reader: Optional[LineReader] = None
+        # core 是否回显请求 id（支持流水线）；None 表示尚未探测
+        self.pipelining: Optional[bool] = None
+        self._ids = itertools.count(1)
+        # 连接因 RequestInterrupted 关闭，下一次 exchange 时重连
+        self._dropped = False
+
+    @property
+    def address(self) -> str:
+        return endpoint_name(self.host, self.port, self.unix)
+
+    @property
+    def connected(self) -> bool:
+        return self.socket is not None
+
+    def connect(self) -> "VFlowCoreClient":
+        """建立连接"""
+        self.close()
+        if self.unix:
+            sock = socket.socket(unix_family(), socket.SOCK_STREAM)
+            target: Any = abstract_address(self.unix)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            target = (self.host, self.port)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(target)
+        except Exception:
+            sock.close()
+            raise
+        if not self.unix:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        self.socket = sock
+        # 每个连接使用新的读取器，旧连接残留的字节不会混入
+        self.reader = LineReader(sock)
+        return self
+
+    def close(self):
+        """关闭连接"""
+        self._dropped = False
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+            self.reader = None
+
+    def __enter__(self) -> "VFlowCoreClient":
+        if not self.connected:
+            self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def exchange(self, req: Dict[str, Any]) -> Exchange:
+        """发送请求并读取一个完整响应帧
+
+        发送失败（请求没有发出去）时自动重连一次并重新发送。请求已发出、连接在收到响应前
+        断开时不重发（tap、inputText 等方法可能已经执行），关闭连接并抛出 RequestInterrupted，
+        由调用方决定是否重试；下一次调用时自动重连。
+        """
+        reconnected = False
+        if self.socket is None:
+            if not (self._dropped and self.reconnect):
+                raise ConnectionError("未连接")
+            self.connect()
+            reconnected = True
+        payload = encode_request(req)
+        start = time.perf_counter()
+        try:
+            self.socket.sendall(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            if not self.reconnect:
+                self.close()
+                raise
+            self.connect()
+            reconnected = True
+            start = time.perf_counter()
+            self.socket.sendall(payload)
+        try:
+            frame = self.reader.read_frame()
+        except ConnectionError as e:
+            self.close()
+            self._dropped = True
+            raise RequestInterrupted("请求已发出，连接在收到响应前断开（未重发）") from e
+        end = time.perf_counter()
+        return make_exchange(payload, frame, reconnected, start, self.reader.first_byte_at, end)
+
+    def call(self, target: str, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """调用一个方法并返回解析后的响应"""
+        return self.exchange(build_request(target, method, params)).json()
+
+    def ping(self) -> Dict[str, Any]:
+        """握手测试，返回 uid 等信息"""
+        return self.call("system", "ping")
+
+    def subscribe(self, req: Dict[str, Any]) -> Iterator[Tuple[bytes, float]]:
+        """发送推送式请求（如 clipboard.subscribeClipboardStream），持续产出 (帧, 收到时间)
+
+        收到时间为 time.perf_counter()。订阅独占连接，应使用专用客户端；
+        对端关闭或 interrupt() 后迭代结束，连接随之关闭，不自动重连。
+        """
+        if self.socket is None:
+            raise ConnectionError("未连接")
+        self.socket.sendall(encode_request(req))
+        try:
+            while self.reader is not None:
+                try:
+                    frame = self.reader.read_frame()
+                except PeerClosed:
+                    return
+                yield frame, time.perf_counter()
+        finally:
+            self.close()
+
+    def interrupt(self):
+        """从其他线程唤醒阻塞在读取上的 subscribe()，使其结束"""
+        sock = self.socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def supports_pipelining(self) -> bool:
+        """探测 core 是否回显请求 id；旧版 core 不回显时只能逐个请求"""
+        if self.pipelining is None:
+            req = build_request("system", "ping")
+            req["id"] = next(self._ids)
+            self.pipelining = frame_id(self.exchange(req).response.encode("utf-8")) == req["id"]
+        return self.pipelining
+
+    def pipeline(self, requests: List[Dict[str, Any]], window: int = PIPELINE_WINDOW) -> List[Exchange]:
+        """流水线发送一批请求，返回与 requests 顺序一致的结果
+
+        同时最多 window 个请求在途，响应按回显的 id 匹配，可以乱序返回。
+        core 不支持时退回逐个请求。流水线过程中连接断开会直接抛出异常，
+        不自动重发（在途请求可能已经执行）。
+        """
+        if window <= 1 or not self.supports_pipelining():
+            return [self.exchange(req) for req in requests]
+
+        results: List[Optional[Exchange]] = [None] * len(requests)
+        # id -> (下标, 请求帧, 发送时间)；dict 保持发送顺序
+        pending: Dict[Any, Tuple[int, bytes, float]] = {}
+        next_index = 0
+        while next_index < len(requests) or pending:
+            while next_index < len(requests) and len(pending) < window:
+                req = dict(requests[next_index])
+                req["id"] = next(self._ids)
+                payload = encode_request(req)
+                pending[req["id"]] = (next_index, payload, time.perf_counter())
+                self.socket.sendall(payload)
+                next_index += 1
+
+            frame = self.reader.read_frame()
+            end = time.perf_counter()
+            req_id = frame_id(frame)
+            if req_id is None:
+                # 响应没有回显 id（例如 core 在解析请求前就出错），归给最早发出的在途请求
+                req_id = next(iter(pending))
+            elif req_id not in pending:
+                continue
+            index, payload, start = pending.pop(req_id)
+            results[index] = make_exchange(payload, frame, False, start, None, end)
+        return results
+
+
+class AsyncVFlowCoreClient:
+    """asyncio 版 vFlowCore 客户端，多个协程可以共享一个客户端
+
+    连接时探测 core 是否回显请求 id：支持时请求带 id 并发在途（最多 window 个），
+    由后台读取任务按 id 把响应交给对应的协程；不支持时用锁串行化，一问一答。
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 connect_timeout: float = CONNECT_TIMEOUT, timeout: Optional[float] = None,
+                 reconnect: bool = True, window: int = PIPELINE_WINDOW, unix: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.unix = unix
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.window = window
+        self.reader = None
+        self.writer = None
+        # core 是否回显请求 id（支持流水线）；None 表示尚未探测
+        self.pipelining: Optional[bool] = None
+        self._ids = itertools.count(1)
+        self._lock = None
+        self._slots = None
+        self._read_task = None
+        # id -> Future[(响应帧, 收到时间)]；dict 保持发送顺序
+        self._pending: Dict[Any, Any] = {}
+
+    @property
+    def address(self) -> str:
+        return endpoint_name(self.host, self.port, self.unix)
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    async def connect(self) -> "AsyncVFlowCoreClient":
+        """建立连接并探测是否支持流水线"""
+        async with self._get_lock():
+            await self._open()
+        return self
+
+    def _get_lock(self):
+        # 只在异步路径上导入 asyncio，命令行同步调用不付这部分启动开销
+        import asyncio
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(max(self.window, 1))
+        return self._lock
+
+    async def _reconnect(self):
+        """连接断开后由第一个拿到锁的协程重连，其余协程等它完成后直接复用新连接"""
+        async with self._get_lock():
+            if self.writer is None:
+                await self._open()
+
+    async def _open(self):
+        """（调用方持有 _lock）关闭旧连接，建立新连接；同一时间只有一个读取任务"""
+        import asyncio
+
+        await self.close()
+        if self.unix:
+            unix_family()
+            opening = asyncio.open_unix_connection(abstract_address(self.unix), limit=MAX_FRAME_BYTES)
+        else:
+            opening = asyncio.open_connection(self.host, self.port, limit=MAX_FRAME_BYTES)
+        self.reader, self.writer = await asyncio.wait_for(opening, self.connect_timeout)
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None and not self.unix:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self.pipelining is None:
+            req = build_request("system", "ping")
+            req["id"] = next(self._ids)
+            result = await self._roundtrip(encode_request(req), False)
+            self.pipelining = self.window > 1 and frame_id(result.response.encode("utf-8")) == req["id"]
+        if self.pipelining:
+            self._read_task = asyncio.get_running_loop().create_task(self._read_loop(self.reader))
+
+    async def close(self):
+        """关闭连接，在途请求以 ConnectionError 结束"""
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._fail_pending(ConnectionError("连接已关闭"))
+        if self.writer is not None:
+            writer, self.writer, self.reader = self.writer, None, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def __aenter__(self) -> "AsyncVFlowCoreClient":
+        if not self.connected:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def exchange(self, req: Dict[str, Any]) -> Exchange:
+        """发送请求并等待对应的响应帧"""
+        if self.writer is None:
+            if not self.reconnect or self.pipelining is None:
+                raise ConnectionError("未连接")
+            await self._reconnect()
+        if self.pipelining:
+            return await self._exchange_pipelined(req)
+
+        # 与同步客户端相同：只有发送失败时重连重发，请求发出后断开抛出 RequestInterrupted
+        payload = encode_request(req)
+        async with self._lock:
+            if self.writer is None:
+                # 等锁期间连接被关闭
+                if not self.reconnect:
+                    raise ConnectionError("未连接")
+                await self._open()
+            reconnected = False
+            start = time.perf_counter()
+            try:
+                await self._send(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                if not self.reconnect:
+                    await self.close()
+                    raise
+                await self._open()
+                reconnected = True
+                start = time.perf_counter()
+                await self._send(payload)
+            try:
+                line = await self._receive()
+            except ConnectionError as e:
+                await self.close()
+                raise RequestInterrupted("请求已发出，连接在收到响应前断开（未重发）") from e
+            return make_exchange(payload, line, reconnected, start, None, time.perf_counter())
+
+    async def _send(self, payload: bytes):
+        self.writer.write(payload)
+        await self.writer.drain()
+
+    async def _receive(self) -> bytes:
+        import asyncio
+
+        try:
+            line = await asyncio.wait_for(self.reader.readuntil(b"\n"), self.timeout)
+        except asyncio.IncompleteReadError as e:
+            raise self._eof_error(e) from e
+        return line[:-1]
+
+    async def _roundtrip(self, payload: bytes, reconnected: bool) -> Exchange:
+        start = time.perf_counter()
+        await self._send(payload)
+        line = await self._receive()
+        return make_exchange(payload, line, reconnected, start, None, time.perf_counter())
+
+    async def _exchange_pipelined(self, req: Dict[str, Any]) -> Exchange:
+        import asyncio
+
+        async with self._slots:
+            req = dict(req)
+            req_id = req["id"] = next(self._ids)
+            payload = encode_request(req)
+            # 等待窗口期间读取任务可能已因连接出错把连接关闭
+            writer = self.writer
+            if writer is None:
+                raise ConnectionError("连接已断开")
+            future = asyncio.get_running_loop().create_future()
+            self._pending[req_id] = future
+            start = time.perf_counter()
+            try:
+                writer.write(payload)
+                await writer.drain()
+                frame, end = await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending.pop(req_id, None)
+            return make_exchange(payload, frame, False, start, None, end)
+
+    async def _read_loop(self, reader):
+        """后台读取响应帧，按回显的 id 交给等待中的协程"""
+        import asyncio
+
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    raise self._eof_error(e) from e
+                end = time.perf_counter()
+                frame = line[:-1]
+                req_id = frame_id(frame)
+                if req_id is None and self._pending:
+                    # 响应没有回显 id，归给最早发出的在途请求
+                    req_id = next(iter(self._pending))
+                # 找不到对应请求（例如已超时放弃）的响应直接丢弃
+                future = self._pending.pop(req_id, None)
+                if future is not None and not future.done():
+                    future.set_result((frame, end))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接出错：在途请求全部失败，下次 exchange 时按需重连；
+            # 连接已被替换时（重连后旧任务才结束）不动新连接
+            if self.reader is not reader:
+                return
+            self._read_task = None
+            self._fail_pending(e)
+            if self.writer is not None:
+                self.writer.close()
+                self.writer, self.reader = None, None
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    @staticmethod
+    def _eof_error(e) -> ConnectionError:
+        if e.partial:
+            return ConnectionError(f"连接在响应帧中途关闭（已收到 {len(e.partial)} 字节）")
+        return PeerClosed("连接已被 vFlowCore 关闭")
+
+    async def call(self, target: str, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """调用一个方法并返回解析后的响应"""
+        return (await self.exchange(build_request(target, method, params))).json()
+
+    async def ping(self) -> Dict[str, Any]:
+        """握手测试，返回 uid 等信息"""
+        return await self.call("system", "ping")
+
+
+def measure_pipelining(client: VFlowCoreClient, requests: List[Dict[str, Any]],
+                       window: int = PIPELINE_WINDOW) -> Dict[str, Any]:
+    """同一批请求分别逐个发送和流水线发送，比较吞吐"""
+    start = time.perf_counter()
+    serial = [client.exchange(req) for req in requests]
+    serial_seconds = time.perf_counter() - start
+
+    supported = client.supports_pipelining()
+    start = time.perf_counter()
+    pipelined = client.pipeline(requests, window)
+    pipelined_seconds = time.perf_counter() - start
+
+    def failures(results: List[Exchange]) -> int:
+        count = 0
+        for result in results:
+            try:
+                count += not result.json().get("success", False)
+            except ValueError:
+                count += 1
+        return count
+
+    count = len(requests)
+    return {
+        "requests": count,
+        "window": window,
+        "pipelining_supported": supported,
+        "serial_seconds": round(serial_seconds, 4),
+        "pipelined_seconds": round(pipelined_seconds, 4),
+        "serial_rps": round(count / serial_seconds, 1) if serial_seconds else None,
+        "pipelined_rps": round(count / pipelined_seconds, 1) if pipelined_seconds else None,
+        "speedup": round(serial_seconds / pipelined_seconds, 2) if pipelined_seconds else None,
+        "serial_failures": failures(serial),
+        "pipelined_failures": failures(pipelined),
+    }
+
+
+def select_test_cases(scope: str) -> List[Tuple[str, str, Dict[str, Any], str]]:
+    """按测试范围（safe/regular/full）取出测试用例"""
+    cases: List[Tuple[str, str, Dict[str, Any], str]] = []
+    for group in TEST_SCOPES[scope]:
+        cases.extend(TEST_CASES[group])
+    return cases
+
+
+def run_test_case(exchange: Callable[[Dict[str, Any]], Exchange],
+                  case: Tuple[str, str, Dict[str, Any], str]) -> Dict[str, Any]:
+    """执行一个测试用例，返回结果明细
+
+    exchange 是发送请求的函数（VFlowCoreClient.exchange 或调试工具 I/O 线程的包装）。
+    """
+    target, method, params, description = case
+    try:
+        result = exchange(build_request(target, method, params))
+        response_json = result.json()
+    except Exception as e:
+        return {"name": description, "status": "❌ 异常", "error": str(e)}
+
+    detail = {"name": description, "response": response_json, "transfer": result.describe()}
+    if response_json.get("success", False):
+        detail["status"] = "✅ 通过"
+    else:
+        detail["status"] = "❌ 失败"
+        detail["error"] = response_json.get("error", "Unknown error")
+    return detail
+
+
+def parse_param(item: str) -> Tuple[str, Any]:
+    """解析命令行 key=value 参数；value 能按 JSON 解析则按 JSON（数字、true、对象等），否则作为字符串"""
+    key, sep, value = item.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"参数格式应为 key=value: {item}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def parse_params_json(text: str) -> Dict[str, Any]:
+    """解析 --params：必须是 JSON 对象"""
+    try:
+        params = json.loads(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"不是有效的 JSON: {e}")
+    if not isinstance(params, dict):
+        raise argparse.ArgumentTypeError(f"必须是 JSON 对象: {text}")
+    return params
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vflowcore",
+        description="vFlowCore command-line client (newline-delimited JSON over TCP or UNIX socket).",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="vFlowCore host.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="vFlowCore port.")
+    parser.add_argument("--unix", action="store_true", help="Connect over the abstract UNIX socket instead of TCP.")
+    parser.add_argument("--socket", default=DEFAULT_UNIX_SOCKET, help="Abstract UNIX socket name used with --unix.")
+    parser.add_argument("--timeout", type=float, help="Per-response timeout in seconds (default: none).")
+    parser.add_argument("--json", action="store_true", help="Print compact JSON only (for scripts).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    call = sub.add_parser("call", help="Call TARGET METHOD with key=value params.")
+    call.add_argument("target", help="Target, e.g. input, clipboard, system.")
+    call.add_argument("method", help="Method, e.g. tap, getClipboard, exec.")
+    call.add_argument("params", nargs="*", type=parse_param, metavar="key=value",
+                      help="Params; values are parsed as JSON when possible.")
+    call.add_argument("--params", dest="params_json", type=parse_params_json, default={},
+                      help="Params as a JSON object (merged before key=value).")
+
+    sub.add_parser("ping", help="Run the system.ping handshake.")
+
+    burst = sub.add_parser("burst", help="Send a burst of one call serially and pipelined, compare throughput.")
+    burst.add_argument("target", nargs="?", default="system", help="Target (default: system).")
+    burst.add_argument("method", nargs="?", default="ping", help="Method (default: ping).")
+    burst.add_argument("params", nargs="*", type=parse_param, metavar="key=value", help="Params for every call.")
+    burst.add_argument("--count", type=int, default=200, help="Number of calls per mode.")
+    burst.add_argument("--window", type=int, default=PIPELINE_WINDOW, help="Max in-flight requests when pipelined.")
+
+    test = sub.add_parser("test", help="Run the auto-test cases and print a report.")
+    test.add_argument("--scope", choices=sorted(TEST_SCOPES), default="safe", help="Test scope.")
+    test.add_argument("--interval", type=float, default=0.2, help="Seconds between test cases.")
+    return parser
+
+
+def print_response(result: Exchange, as_json: bool):
+    if as_json:
+        print(result.response)
+        return
+    try:
+        print(json.dumps(result.json(), indent=2, ensure_ascii=False))
+    except ValueError:
+        print(result.response)
+    print(f"# {result.describe()}", file=sys.stderr)
+
+
+def print_burst(report: Dict[str, Any], as_json: bool) -> int:
+    if as_json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        mode = f"流水线（窗口 {report['window']}）" if report["pipelining_supported"] else "core 不回显 id，已退回逐个请求"
+        print(f"请求数: {report['requests']}  模式: {mode}")
+        print(f"逐个:   {report['serial_seconds']:.3f} s  {report['serial_rps']} req/s  失败 {report['serial_failures']}")
+        print(f"流水线: {report['pipelined_seconds']:.3f} s  {report['pipelined_rps']} req/s  失败 {report['pipelined_failures']}")
+        print(f"提升:   {report['speedup']}x")
+    return 0 if not report["serial_failures"] and not report["pipelined_failures"] else 1
+
+
+def run_tests(client: VFlowCoreClient, scope: str, interval: float, as_json: bool) -> int:
+    cases = select_test_cases(scope)
+    details = []
+    for i, case in enumerate(cases, 1):
+        detail = run_test_case(client.exchange, case)
+        details.append(detail)
+        if not as_json:
+            suffix = f" ({detail['transfer']})" if "transfer" in detail else ""
+            error = f" - {detail['error']}" if "error" in detail else ""
+            print(f"[{i}/{len(cases)}] {detail['status']} {detail['name']}{suffix}{error}")
+        if interval > 0 and i < len(cases):
+            time.sleep(interval)
+
+    passed = sum(1 for d in details if d["status"] == "✅ 通过")
+    if as_json:
+        print(json.dumps({"scope": scope, "total": len(cases), "passed": passed,
+                          "failed": len(cases) - passed, "details": details}, ensure_ascii=False))
+    else:
+        print(f"通过: {passed}/{len(cases)}  成功率: {passed / len(cases) * 100:.1f}%")
+    return 0 if passed == len(cases) else 1
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = build_parser()
+    # key=value 出现在 --params 之后时 argparse 不会再归到位置参数，这里补回
+    args, extra = parser.parse_known_args(argv)
+    if extra:
+        if args.command not in ("call", "burst") or any(item.startswith("-") for item in extra):
+            parser.error(f"unrecognized arguments: {' '.join(extra)}")
+        try:
+            args.params.extend(parse_param(item) for item in extra)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    client = VFlowCoreClient(args.host, args.port, timeout=args.timeout,
+                             unix=args.socket if args.unix else None)
+    try:
+        client.connect()
+    except OSError as e:
+        print(f"无法连接到 vFlowCore {client.address}: {e}", file=sys.stderr)
+        return 2
+
+    with client:
+        try:
+            if args.command == "test":
+                return run_tests(client, args.scope, args.interval, args.json)
+
+            if args.command == "burst":
+                req = build_request(args.target, args.method, dict(args.params))
+                return print_burst(measure_pipelining(client, [req] * args.count, args.window), args.json)
+
+            if args.command == "ping":
+                req = build_request("system", "ping")
+            else:
+                params = dict(args.params_json, **dict(args.params))
+                req = build_request(args.target, args.method, params)
+
+            result = client.exchange(req)
+        except OSError as e:
+            print(f"通信错误: {e}", file=sys.stderr)
+            return 2
+
+    print_response(result, args.json)
+    try:
+        return 0 if result.json().get("success", False) else 1
+    except ValueError:
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
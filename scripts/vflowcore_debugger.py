@@ -1,15 +1,385 @@
 #!/usr/bin/env python3
 """
 vFlowCore 调试工具
-使用 tkinter GUI 与 vFlowCore 进行通信调试
+使用 tkinter GUI 与 vFlowCore 进行通信调试，支持 TCP 和抽象 UNIX socket 两种传输
 """
 
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
-import socket
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import json
+import queue
 import threading
-from typing import Dict, Any, Optional
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+from vflowcore_benchmark import compare_transports, format_delta
+from vflowcore_stream import StreamRecorder
+from vflowcore_client import (
+    DEFAULT_UNIX_SOCKET, TEST_CASES, Exchange, RequestInterrupted, VFlowCoreClient, build_request, format_bytes,
+    run_test_case, select_test_cases,
+)
+
+# 主线程轮询 I/O 结果的间隔（毫秒）
+POLL_INTERVAL_MS = 30
+# 每次轮询最多处理的结果数，避免一次性处理过多阻塞界面
+POLL_BATCH = 50
+# 自动测试用例之间的间隔（秒），在 I/O 线程里等待，不影响界面
+AUTO_TEST_INTERVAL = 0.2
+# 传输对比时每种传输、每种模式的请求数
+COMPARE_REQUESTS = 100
+# 日志区最多保留的行数和单行最大字符数，长时间运行时内存和重绘开销保持不变
+LOG_MAX_LINES = 2000
+LOG_LINE_MAX_CHARS = 1000
+# 日志写入控件的合并间隔（毫秒），期间的多条日志一次插入
+LOG_FLUSH_MS = 100
+# 响应区预览的最大字符数，以及预览中单个字符串/数组保留的长度；超出部分点"展开"再渲染
+RESPONSE_PREVIEW_CHARS = 20000
+PREVIEW_STRING_CHARS = 200
+PREVIEW_LIST_ITEMS = 100
+# 推送流窗口：列表保留的行数和界面刷新间隔（毫秒）
+STREAM_VIEW_LINES = 1000
+STREAM_REFRESH_MS = 250
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """超出 limit 的部分替换为省略说明"""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} 字符)"
+
+
+def shorten_json(value: Any) -> Tuple[Any, bool]:
+    """截断 JSON 值中的长字符串（如 base64 截图）和长数组，返回 (预览值, 是否有截断)"""
+    if isinstance(value, str):
+        return truncate_text(value, PREVIEW_STRING_CHARS), len(value) > PREVIEW_STRING_CHARS
+    if isinstance(value, dict):
+        shortened, truncated = {}, False
+        for key, item in value.items():
+            shortened[key], cut = shorten_json(item)
+            truncated = truncated or cut
+        return shortened, truncated
+    if isinstance(value, list):
+        items = [shorten_json(item) for item in value[:PREVIEW_LIST_ITEMS]]
+        shortened = [item for item, _ in items]
+        truncated = any(cut for _, cut in items)
+        if len(value) > PREVIEW_LIST_ITEMS:
+            shortened.append(f"…(+{len(value) - PREVIEW_LIST_ITEMS} 项)")
+            truncated = True
+        return shortened, truncated
+    return value, False
+
+
+def preview_response(response: str) -> Tuple[str, bool]:
+    """响应帧渲染为响应区预览文本，返回 (文本, 是否有截断)
+
+    小响应完整格式化；大响应只格式化截断后的副本，完整内容等用户点"展开"时再渲染。
+    """
+    try:
+        value = json.loads(response)
+    except ValueError:
+        text, truncated = response, False
+    else:
+        if len(response) <= RESPONSE_PREVIEW_CHARS:
+            return json.dumps(value, indent=2, ensure_ascii=False), False
+        shortened, truncated = shorten_json(value)
+        text = json.dumps(shortened, indent=2, ensure_ascii=False)
+    if len(text) > RESPONSE_PREVIEW_CHARS:
+        text, truncated = text[:RESPONSE_PREVIEW_CHARS] + "\n…", True
+    if truncated:
+        text += f"\n\n（预览已截断，完整响应 {format_bytes(len(response.encode('utf-8')))}，点击\"展开\"查看）"
+    return text, truncated
+
+
+class LogBuffer:
+    """固定行数的日志缓冲
+
+    pending 保存尚未写入控件的行（最多 max_lines 行，控件本身就是已显示行的存储）；
+    控件按批追加新行，并从顶部删掉超出上限的旧行，所以控件行数和每次刷新的开销都有上界。
+    """
+
+    def __init__(self, max_lines: int = LOG_MAX_LINES):
+        self.pending: deque = deque(maxlen=max_lines)
+        self.max_lines = max_lines
+        self.shown = 0  # 控件中当前的行数
+
+    def append(self, line: str):
+        self.pending.append(line)
+
+    def take_pending(self) -> Tuple[List[str], int]:
+        """取出待写入控件的新行，以及写入后需要从控件顶部删除的行数"""
+        new = list(self.pending)
+        self.pending.clear()
+        overflow = max(0, self.shown + len(new) - self.max_lines)
+        self.shown = min(self.shown + len(new), self.max_lines)
+        return new, overflow
+
+    def clear(self):
+        self.pending.clear()
+        self.shown = 0
+
+
+def flush_buffer(widget, buffer: LogBuffer):
+    """把缓冲中的新行一次写入文本控件，并删除超出上限的旧行"""
+    new, overflow = buffer.take_pending()
+    if not new:
+        return
+    # 用户向上翻看时不强制滚动到底部
+    follow = widget.yview()[1] >= 0.999
+    widget.insert(tk.END, "".join(new))
+    if overflow:
+        widget.delete("1.0", f"{overflow + 1}.0")
+    if follow:
+        widget.see(tk.END)
+
+
+class SocketWorker:
+    """独占 vFlowCore 连接的后台 I/O 线程
+
+    VFlowCoreClient 的 connect/exchange 全部在该线程中串行执行，结果通过 results 队列交回
+    Tk 主线程，由主线程 root.after 轮询后执行回调。
+    这样慢调用（exec、screenshot 等）和自动测试都不会冻结界面。
+    """
+
+    def __init__(self):
+        self.jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.results: "queue.Queue[tuple]" = queue.Queue()
+        self.client: Optional[VFlowCoreClient] = None
+        self.thread = threading.Thread(target=self._run, name="vflowcore-io", daemon=True)
+        self.thread.start()
+
+    def submit(self, func: Callable, callback: Optional[Callable] = None, *args):
+        """提交任务到 I/O 线程，完成后在主线程调用 callback(result, error)"""
+        self.jobs.put((func, args, callback))
+
+    def post(self, callback: Callable, *args):
+        """从 I/O 线程向主线程投递一次界面更新"""
+        self.results.put((callback, args))
+
+    def drain(self, limit: int = POLL_BATCH):
+        """在主线程中执行已完成任务的回调"""
+        for _ in range(limit):
+            try:
+                callback, args = self.results.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+
+    def stop(self):
+        """停止 I/O 线程并关闭连接"""
+        self.jobs.put(None)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.close()
+                break
+            func, args, callback = job
+            try:
+                result, error = func(*args), None
+            except Exception as e:
+                result, error = None, e
+            if callback is not None:
+                self.results.put((callback, (result, error)))
+
+    # 以下方法只在 I/O 线程中调用
+
+    def open(self, host: str, port: int, unix: Optional[str] = None):
+        """建立连接；unix 为抽象 socket 名时走 UNIX 传输"""
+        self.close()
+        self.client = VFlowCoreClient(host, port, unix=unix).connect()
+        return self.client.address
+
+    def close(self):
+        """关闭连接"""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def exchange(self, req: Dict[str, Any]) -> Exchange:
+        """发送请求并读取一个完整响应帧；请求没发出去时自动重连重发一次，已发出后断开不重发"""
+        if self.client is None:
+            raise ConnectionError("未连接")
+        return self.client.exchange(req)
+
+
+class SubscriptionWindow:
+    """推送流窗口：用专用连接订阅推送式方法（如 clipboard.subscribeClipboardStream）
+
+    订阅线程阻塞读取推送帧并交给 StreamRecorder（环形缓冲 + 统计）；界面每 STREAM_REFRESH_MS
+    取一次新帧和统计，列表行数有上限，推送再密集也不会拖慢界面。主连接不受影响。
+    """
+
+    def __init__(self, debugger: "VFlowCoreDebugger"):
+        self.debugger = debugger
+        self.client: Optional[VFlowCoreClient] = None
+        self.recorder: Optional[StreamRecorder] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = False
+        self.closed = False
+        self.dump_path: Optional[str] = None
+        self.shown = 0  # 已显示的最后一帧序号
+        self.buffer = LogBuffer(STREAM_VIEW_LINES)
+
+        self.window = tk.Toplevel(debugger.root)
+        self.window.title("推送流")
+        self.window.geometry("800x500")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        control_frame = ttk.Frame(self.window, padding=10)
+        control_frame.pack(fill=tk.X)
+
+        ttk.Label(control_frame, text="Target:").grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.target_entry = ttk.Entry(control_frame, width=14)
+        self.target_entry.insert(0, "clipboard")
+        self.target_entry.grid(row=0, column=1, padx=5)
+
+        ttk.Label(control_frame, text="Method:").grid(row=0, column=2, sticky=tk.W, padx=5)
+        self.method_entry = ttk.Entry(control_frame, width=26)
+        self.method_entry.insert(0, "subscribeClipboardStream")
+        self.method_entry.grid(row=0, column=3, padx=5)
+
+        ttk.Label(control_frame, text="参数:").grid(row=0, column=4, sticky=tk.W, padx=5)
+        self.params_entry = ttk.Entry(control_frame, width=14)
+        self.params_entry.insert(0, "{}")
+        self.params_entry.grid(row=0, column=5, padx=5)
+
+        self.start_btn = ttk.Button(control_frame, text="开始", command=self.start)
+        self.start_btn.grid(row=0, column=6, padx=5)
+        self.stop_btn = ttk.Button(control_frame, text="停止", command=self.stop, state=tk.DISABLED)
+        self.stop_btn.grid(row=0, column=7, padx=5)
+
+        self.dump_btn = ttk.Button(control_frame, text="保存到文件...", command=self.choose_dump)
+        self.dump_btn.grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=(5, 0))
+        self.dump_label = ttk.Label(control_frame, text="不保存", foreground="gray")
+        self.dump_label.grid(row=1, column=2, columnspan=6, sticky=tk.W, padx=5, pady=(5, 0))
+
+        self.stats_label = ttk.Label(self.window, text="未订阅", foreground="gray", padding=(10, 0))
+        self.stats_label.pack(fill=tk.X)
+
+        self.frames_text = scrolledtext.ScrolledText(self.window, height=20)
+        self.frames_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.window.after(STREAM_REFRESH_MS, self.refresh)
+
+    def choose_dump(self):
+        """选择保存推送帧的 JSONL 文件（追加写入，下次开始订阅时生效）"""
+        path = filedialog.asksaveasfilename(
+            parent=self.window, defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("所有文件", "*.*")],
+        )
+        self.dump_path = path or None
+        self.dump_label.config(text=self.dump_path or "不保存")
+
+    def start(self):
+        """建立专用连接并开始订阅"""
+        if self.thread is not None or not self.debugger.read_endpoint():
+            return
+        try:
+            params = json.loads(self.params_entry.get() or "{}")
+        except ValueError as e:
+            messagebox.showerror("参数错误", f"参数不是有效的 JSON:\n{e}", parent=self.window)
+            return
+        try:
+            dump = open(self.dump_path, "a", encoding="utf-8") if self.dump_path else None
+        except OSError as e:
+            messagebox.showerror("无法保存", f"无法打开文件:\n{e}", parent=self.window)
+            return
+
+        debugger = self.debugger
+        unix = debugger.socket_name if debugger.transport_var.get() == "UNIX" else None
+        self.client = VFlowCoreClient(debugger.host, debugger.port, unix=unix, reconnect=False)
+        self.recorder = StreamRecorder(dump=dump)
+        self.stopping = False
+        self.shown = 0
+        self.buffer.clear()
+        self.frames_text.delete("1.0", tk.END)
+
+        req = build_request(self.target_entry.get().strip(), self.method_entry.get().strip(), params)
+        self.thread = threading.Thread(target=self._run, args=(self.client, self.recorder, req, dump),
+                                       name="vflowcore-stream", daemon=True)
+        self.thread.start()
+        self.start_btn.config(state=tk.DISABLED)
+        self.stop_btn.config(state=tk.NORMAL)
+        debugger.log(f"📡 订阅 {req['target']}.{req['method']} @ {self.client.address}")
+
+    def _run(self, client: VFlowCoreClient, recorder: StreamRecorder, req: Dict[str, Any], dump):
+        """订阅线程：读取推送帧直到停止或对端关闭"""
+        error = None
+        try:
+            client.connect()
+            recorder.start()
+            if not self.stopping:
+                for raw, at in client.subscribe(req):
+                    recorder.record(raw, at)
+        except Exception as e:
+            # 停止时中断读取引起的异常不算错误
+            error = None if self.stopping else e
+        finally:
+            client.close()
+            if dump is not None:
+                dump.close()
+            self.debugger.io.post(self.on_stopped, error)
+
+    def stop(self):
+        """停止订阅（唤醒阻塞的读取）"""
+        if self.client is None:
+            return
+        self.stopping = True
+        self.client.interrupt()
+
+    def on_stopped(self, error):
+        """订阅线程结束（主线程）"""
+        self.thread = None
+        self.client = None
+        if self.closed:
+            return
+        self.refresh_view()
+        self.start_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        if error is not None:
+            self.debugger.log(f"📡 订阅出错: {error}")
+            messagebox.showerror("订阅出错", f"推送流中断:\n{error}", parent=self.window)
+        else:
+            self.debugger.log("📡 订阅已结束")
+
+    def refresh(self):
+        """定时刷新帧列表和统计"""
+        if self.closed:
+            return
+        self.refresh_view()
+        self.window.after(STREAM_REFRESH_MS, self.refresh)
+
+    def refresh_view(self):
+        if self.recorder is None:
+            return
+        frames = self.recorder.since(self.shown)
+        for frame in frames:
+            self.buffer.append(truncate_text(frame.describe(), LOG_LINE_MAX_CHARS) + "\n")
+        if frames:
+            self.shown = frames[-1].index
+        flush_buffer(self.frames_text, self.buffer)
+
+        stats = self.recorder.stats()
+        intervals = stats["interval_ms"]
+        state = "订阅中" if self.thread is not None else "已结束"
+        self.stats_label.config(
+            text=f"{state} • 帧 {stats['frames']} ({format_bytes(stats['bytes'])}) • "
+                 f"速率 {stats['recent_rate_per_second']:.2f}/s（最近 {stats['rate_window_seconds']:g} s），"
+                 f"平均 {stats['rate_per_second']:.2f}/s • 到达间隔 p50 {intervals['p50'] or '-'} ms "
+                 f"p99 {intervals['p99'] or '-'} ms max {intervals['max']} ms • "
+                 f"序号跳变 {stats['sequence_gaps']} • 错误 {stats['errors']}",
+            foreground="green" if self.thread is not None else "gray",
+        )
+
+    def close(self):
+        """关闭窗口并停止订阅"""
+        self.stop()
+        self.closed = True
+        self.debugger.subscription = None
+        self.window.destroy()
+
 
 class VFlowCoreDebugger:
     def __init__(self, root):
@@ -20,31 +390,75 @@ class VFlowCoreDebugger:
         # 连接配置
         self.host = "127.0.0.1"
         self.port = 19999
-        self.socket: Optional[socket.socket] = None
+        self.socket_name = DEFAULT_UNIX_SOCKET
         self.connected = False
+        self.connecting = False
+        self.comparing = False
+        self.auto_test_running = False
+
+        # 日志先进入环形缓冲，由定时器合并写入控件
+        self.log_buffer = LogBuffer()
+        self.log_flush_pending = False
+        # 响应区当前内容被截断时保存完整响应，供"展开"使用
+        self.response_full: Optional[str] = None
+        # 推送流窗口（同一时间最多一个）
+        self.subscription: Optional[SubscriptionWindow] = None
+
+        # 连接由 I/O 线程独占，界面线程只提交任务和处理回调
+        self.io = SocketWorker()
 
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(POLL_INTERVAL_MS, self.poll_io)
+
+    def poll_io(self):
+        """定时处理 I/O 线程交回的结果"""
+        self.io.drain()
+        self.root.after(POLL_INTERVAL_MS, self.poll_io)
+
+    def on_close(self):
+        """关闭窗口时停止推送流和 I/O 线程"""
+        if self.subscription is not None:
+            self.subscription.stop()
+        self.io.stop()
+        self.root.destroy()
 
     def setup_ui(self):
         # 顶部连接控制区
         connection_frame = ttk.LabelFrame(self.root, text="连接配置", padding=10)
         connection_frame.pack(fill=tk.X, padx=10, pady=5)
 
-        ttk.Label(connection_frame, text="主机:").grid(row=0, column=0, sticky=tk.W, padx=5)
+        ttk.Label(connection_frame, text="传输:").grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.transport_var = tk.StringVar(value="TCP")
+        transport_combo = ttk.Combobox(connection_frame, textvariable=self.transport_var, width=6, state="readonly")
+        transport_combo['values'] = ("TCP", "UNIX")
+        transport_combo.grid(row=0, column=1, padx=5)
+        transport_combo.bind("<<ComboboxSelected>>", self.on_transport_changed)
+
+        ttk.Label(connection_frame, text="主机:").grid(row=0, column=2, sticky=tk.W, padx=5)
         self.host_entry = ttk.Entry(connection_frame, width=20)
         self.host_entry.insert(0, self.host)
-        self.host_entry.grid(row=0, column=1, padx=5)
+        self.host_entry.grid(row=0, column=3, padx=5)
 
-        ttk.Label(connection_frame, text="端口:").grid(row=0, column=2, sticky=tk.W, padx=5)
+        ttk.Label(connection_frame, text="端口:").grid(row=0, column=4, sticky=tk.W, padx=5)
         self.port_entry = ttk.Entry(connection_frame, width=10)
         self.port_entry.insert(0, str(self.port))
-        self.port_entry.grid(row=0, column=3, padx=5)
+        self.port_entry.grid(row=0, column=5, padx=5)
 
         self.connect_btn = ttk.Button(connection_frame, text="连接", command=self.toggle_connection)
-        self.connect_btn.grid(row=0, column=4, padx=10)
+        self.connect_btn.grid(row=0, column=6, padx=10)
 
         self.status_label = ttk.Label(connection_frame, text="未连接", foreground="red")
-        self.status_label.grid(row=0, column=5, padx=10)
+        self.status_label.grid(row=0, column=7, padx=10)
+
+        # UNIX 传输使用的抽象 socket 名（设备上运行时，如 Termux）
+        ttk.Label(connection_frame, text="Socket:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=(5, 0))
+        self.socket_entry = ttk.Entry(connection_frame, width=40)
+        self.socket_entry.insert(0, self.socket_name)
+        self.socket_entry.grid(row=1, column=1, columnspan=3, sticky=tk.EW, padx=5, pady=(5, 0))
+        self.compare_btn = ttk.Button(connection_frame, text="⏱ TCP/UNIX 对比", command=self.run_transport_compare)
+        self.compare_btn.grid(row=1, column=4, columnspan=3, padx=5, pady=(5, 0))
+        self.on_transport_changed(None)
 
         # 主要内容区 - 使用 PanedWindow 分割
         paned = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
@@ -83,6 +497,7 @@ class VFlowCoreDebugger:
         ttk.Button(button_frame, text="清空", command=self.clear_params).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="发送请求", command=self.send_request).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="🧪 自动测试", command=self.run_auto_test).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="📡 推送流", command=self.open_subscription).pack(side=tk.LEFT, padx=5)
 
         # 预设请求区
         preset_frame = ttk.LabelFrame(left_frame, text="快捷操作", padding=5)
@@ -97,12 +512,23 @@ class VFlowCoreDebugger:
         self.response_text = scrolledtext.ScrolledText(right_frame, width=40, height=20)
         self.response_text.pack(fill=tk.BOTH, expand=True)
 
+        response_bar = ttk.Frame(right_frame)
+        response_bar.pack(fill=tk.X, pady=(5, 0))
+
+        # 最近一次响应的传输字节数和耗时
+        self.transfer_label = ttk.Label(response_bar, text="", foreground="gray")
+        self.transfer_label.pack(side=tk.LEFT)
+
+        self.expand_btn = ttk.Button(response_bar, text="展开", command=self.expand_response, state=tk.DISABLED)
+        self.expand_btn.pack(side=tk.RIGHT)
+
         # 底部日志区
         log_frame = ttk.LabelFrame(self.root, text="日志", padding=10)
         log_frame.pack(fill=tk.X, padx=10, pady=5)
 
+        ttk.Button(log_frame, text="清空", command=self.clear_log).pack(side=tk.RIGHT, anchor=tk.N, padx=(5, 0))
         self.log_text = scrolledtext.ScrolledText(log_frame, height=6)
-        self.log_text.pack(fill=tk.BOTH)
+        self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # 初始化
         self.on_target_changed(None)
@@ -287,6 +713,13 @@ class VFlowCoreDebugger:
 
         self.send_request()
 
+    def on_transport_changed(self, event):
+        """切换传输时只启用对应的输入框"""
+        unix = self.transport_var.get() == "UNIX"
+        self.host_entry.config(state=tk.DISABLED if unix else tk.NORMAL)
+        self.port_entry.config(state=tk.DISABLED if unix else tk.NORMAL)
+        self.socket_entry.config(state=tk.NORMAL if unix else tk.DISABLED)
+
     def toggle_connection(self):
         """切换连接状态"""
         if self.connected:
@@ -295,37 +728,50 @@ class VFlowCoreDebugger:
             self.connect()
 
     def connect(self):
-        """连接到 vFlowCore"""
+        """连接到 vFlowCore（在 I/O 线程中进行）"""
+        if self.connecting:
+            return
+        if not self.read_endpoint():
+            return
+        unix = self.socket_name if self.transport_var.get() == "UNIX" else None
+
+        self.connecting = True
+        self.connect_btn.config(state=tk.DISABLED)
+        self.status_label.config(text="连接中...", foreground="orange")
+        self.io.submit(self.io.open, self.on_connected, self.host, self.port, unix)
+
+    def read_endpoint(self) -> bool:
+        """从输入框读取主机、端口和 socket 名"""
         try:
             self.host = self.host_entry.get()
             self.port = int(self.port_entry.get())
+        except ValueError as e:
+            messagebox.showerror("连接失败", f"端口格式错误:\n{e}")
+            return False
+        self.socket_name = self.socket_entry.get().strip() or DEFAULT_UNIX_SOCKET
+        return True
+
+    def on_connected(self, address, error):
+        """连接结果回调（主线程）"""
+        self.connecting = False
+        self.connect_btn.config(state=tk.NORMAL)
+        if error is not None:
+            self.status_label.config(text="未连接", foreground="red")
+            self.log(f"连接失败: {error}")
+            messagebox.showerror("连接失败", f"无法连接到 vFlowCore:\n{error}")
+            return
 
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # 设置连接超时为 5 秒，但不设置读写超时（避免长时间无操作断开）
-            self.socket.settimeout(5)
-            self.socket.connect((self.host, self.port))
-            # 连接成功后移除超时，保持长连接
-            self.socket.settimeout(None)
-
-            self.connected = True
-            self.connect_btn.config(text="断开")
-            self.status_label.config(text="已连接", foreground="green")
-            self.log(f"已连接到 {self.host}:{self.port}")
+        self.connected = True
+        self.connect_btn.config(text="断开")
+        self.status_label.config(text="已连接", foreground="green")
+        self.log(f"已连接到 {address} ({self.transport_var.get()})")
 
-            # 自动 ping 测试
-            self.send_ping()
-        except Exception as e:
-            messagebox.showerror("连接失败", f"无法连接到 vFlowCore:\n{e}")
-            self.log(f"连接失败: {e}")
+        # 自动 ping 测试
+        self.send_ping()
 
     def disconnect(self):
         """断开连接"""
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
-            self.socket = None
+        self.io.submit(self.io.close)
 
         self.connected = False
         self.connect_btn.config(text="连接")
@@ -356,49 +802,108 @@ class VFlowCoreDebugger:
             messagebox.showerror("错误", f"发送请求失败:\n{e}")
 
     def send_request_raw(self, req: Dict[str, Any]):
-        """发送原始请求"""
-        if not self.connected or not self.socket:
+        """发送原始请求（提交到 I/O 线程，不阻塞界面）"""
+        if not self.connected:
             messagebox.showwarning("未连接", "请先连接到 vFlowCore")
             return
 
-        try:
-            # 发送请求
-            req_str = json.dumps(req) + "\n"
-            self.socket.sendall(req_str.encode('utf-8'))
+        self.log(f"发送: {json.dumps(req)}")
+        self.io.submit(self.io.exchange, self.on_response, req)
+
+    def on_response(self, result, error):
+        """响应回调（主线程）"""
+        if error is not None:
+            if isinstance(error, RequestInterrupted):
+                # 连接已关闭，下一次请求时自动重连；不自动重发，避免 tap 等操作执行两次
+                self.log(f"⚠️ {error}，请求可能已执行，如需要请手动重发")
+                messagebox.showwarning("连接断开", f"{error}\n请求可能已经执行，如需要请手动重发。")
+            elif isinstance(error, OSError):
+                # 已在 I/O 线程中重连过一次仍失败
+                self.log(f"❌ 连接已断开且重连失败: {error}")
+                self.disconnect()
+                messagebox.showerror("连接断开", f"连接已断开且重连失败:\n{error}")
+            else:
+                self.log(f"通信错误: {error}")
+                messagebox.showerror("通信错误", f"与 vFlowCore 通信失败:\n{error}")
+            return
 
-            self.log(f"发送: {req_str.strip()}")
+        response = result.response
+        if result.reconnected:
+            self.log("⚠️ 连接已断开，✅ 重连成功并已发送请求")
+        self.log(f"接收 ({result.describe()}): {response}")
+        self.transfer_label.config(
+            text=f"发送 {format_bytes(result.bytes_sent)} / 接收 {format_bytes(result.bytes_received)}"
+                 f" • 首字节 {result.first_byte * 1000:.1f} ms • 总耗时 {result.elapsed * 1000:.1f} ms"
+        )
+
+        # 显示响应（大响应只显示预览）
+        self.show_response(response)
+
+    def show_response(self, response: str, header: str = ""):
+        """在响应区显示一个响应帧；被截断时启用"展开"按钮"""
+        text, truncated = preview_response(response)
+        self.show_response_text(header + text, response if truncated else None)
+
+    def show_response_text(self, text: str, full: Optional[str] = None):
+        """替换响应区内容；full 为可展开的完整响应"""
+        self.response_full = full
+        self.response_text.delete("1.0", tk.END)
+        self.response_text.insert("1.0", text)
+        self.expand_btn.config(state=tk.NORMAL if full is not None else tk.DISABLED)
 
-            # 接收响应
-            response = self.socket.recv(4096).decode('utf-8').strip()
-            self.log(f"接收: {response}")
+    def expand_response(self):
+        """完整渲染被截断的响应（可能较慢，只在用户要求时进行）"""
+        full = self.response_full
+        if full is None:
+            return
+        try:
+            text = json.dumps(json.loads(full), indent=2, ensure_ascii=False)
+        except ValueError:
+            text = full
+        self.show_response_text(text)
+        self.log(f"已展开完整响应 ({format_bytes(len(full.encode('utf-8')))})")
+
+    def open_subscription(self):
+        """打开推送流窗口；已打开时切到前台"""
+        if self.subscription is not None:
+            self.subscription.window.lift()
+            return
+        self.subscription = SubscriptionWindow(self)
 
-            # 显示响应
-            self.response_text.delete("1.0", tk.END)
-            try:
-                response_json = json.loads(response)
-                self.response_text.insert("1.0", json.dumps(response_json, indent=2, ensure_ascii=False))
-            except:
-                self.response_text.insert("1.0", response)
-
-        except BrokenPipeError:
-            # 连接已断开，尝试重连
-            self.log("⚠️ 连接已断开，尝试重连...")
-            self.disconnect()
+    def run_transport_compare(self):
+        """对比 TCP 与 UNIX 传输的往返延迟
 
-            # 自动重连
-            try:
-                self.connect()
-                if self.connected:
-                    self.log("✅ 重连成功，重新发送请求")
-                    # 重新发送请求
-                    self.send_request_raw(req)
-            except Exception as e:
-                self.log(f"❌ 重连失败: {e}")
-                messagebox.showerror("连接断开", f"连接已断开且重连失败:\n{e}")
+        使用独立的临时连接，不影响当前连接；在 I/O 线程中执行，期间提交的请求排队等待。
+        """
+        if self.comparing or not self.read_endpoint():
+            return
+        self.comparing = True
+        self.compare_btn.config(state=tk.DISABLED)
+        self.log(f"开始对比 TCP {self.host}:{self.port} 与 UNIX @{self.socket_name}（每项 {COMPARE_REQUESTS} 次 ping）")
+        self.io.submit(compare_transports, self.on_transport_compare_done,
+                       self.host, self.port, self.socket_name, ("ping",), COMPARE_REQUESTS)
+
+    def on_transport_compare_done(self, report, error):
+        """传输对比结果回调（主线程）"""
+        self.comparing = False
+        self.compare_btn.config(state=tk.NORMAL)
+        if error is not None:
+            self.log(f"传输对比失败: {error}")
+            messagebox.showerror("传输对比失败", f"两种传输都需要可连接:\n{error}")
+            return
 
-        except Exception as e:
-            self.log(f"通信错误: {e}")
-            messagebox.showerror("通信错误", f"与 vFlowCore 通信失败:\n{e}")
+        lines = ["⏱ TCP / UNIX 延迟对比", "=" * 40, "",
+                 f"{'传输':<6}{'模式':<6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'错误':>6}"]
+        for result in report["results"]:
+            latency = result["latency_ms"]
+            lines.append(f"{result['transport']:<8}{result['mode']:<8}{latency['p50'] or '-':>10}"
+                         f"{latency['p99'] or '-':>10}{result['requests_per_second']:>10}{result['errors']:>6}")
+        lines.append("")
+        for entry in report["tcp_vs_unix"]:
+            lines.append(f"{entry['mode']}: UNIX p50 {format_delta(entry.get('p50_extra_ms'))} ms, "
+                         f"吞吐 x{entry.get('rps_ratio', '-')}（相对 TCP）")
+        self.show_response_text("\n".join(lines))
+        self.log("传输对比完成")
 
     def format_params(self):
         """格式化参数 JSON"""
@@ -418,9 +923,24 @@ class VFlowCoreDebugger:
         self.params_text.insert("1.0", "{}")
 
     def log(self, message: str):
-        """添加日志"""
-        self.log_text.insert(tk.END, f"[{self.get_timestamp()}] {message}\n")
-        self.log_text.see(tk.END)
+        """添加日志：写入环形缓冲，由定时器合并刷新到控件"""
+        prefix = f"[{self.get_timestamp()}] "
+        for i, part in enumerate(message.split("\n")):
+            line = truncate_text(part, LOG_LINE_MAX_CHARS)
+            self.log_buffer.append(f"{prefix if i == 0 else ''}{line}\n")
+        if not self.log_flush_pending:
+            self.log_flush_pending = True
+            self.root.after(LOG_FLUSH_MS, self.flush_log)
+
+    def flush_log(self):
+        """把缓冲中的新日志一次写入控件"""
+        self.log_flush_pending = False
+        flush_buffer(self.log_text, self.log_buffer)
+
+    def clear_log(self):
+        """清空日志"""
+        self.log_buffer.clear()
+        self.log_text.delete("1.0", tk.END)
 
     @staticmethod
     def get_timestamp():
@@ -430,33 +950,16 @@ class VFlowCoreDebugger:
 
     def get_test_cases(self):
         """获取所有测试用例"""
-        return {
-            "safe": [  # 安全测试（无副作用）
-                ("system", "ping", {}, "Ping 测试"),
-                ("clipboard", "getClipboard", {}, "获取剪贴板"),
-            ],
-            "destructive": [  # 有副作用的测试
-                ("clipboard", "setClipboard", {"text": "Auto Test from vFlowCore Debugger"}, "设置剪贴板"),
-                ("wifi", "setWifiEnabled", {"enabled": True}, "开启 WiFi"),
-                ("wifi", "setWifiEnabled", {"enabled": False}, "关闭 WiFi"),
-                ("bluetooth_manager", "setBluetoothEnabled", {"enabled": True}, "开启蓝牙"),
-                ("bluetooth_manager", "setBluetoothEnabled", {"enabled": False}, "关闭蓝牙"),
-                ("power", "wakeUp", {}, "唤醒屏幕"),
-                ("power", "goToSleep", {}, "关闭屏幕"),
-            ],
-            "dangerous": [  # 危险测试（会杀死应用或影响系统）
-                ("input", "tap", {"x": 500, "y": 500}, "点击屏幕"),
-                ("input", "swipe", {"x1": 500, "y1": 500, "x2": 500, "y2": 1000, "duration": 300}, "滑动屏幕"),
-                ("input", "inputText", {"text": "test"}, "输入文本"),
-                ("activity", "forceStopPackage", {"package": "com.chaomixian.vflow"}, "强制停止应用"),
-            ]
-        }
+        return TEST_CASES
 
     def run_auto_test(self):
         """运行自动测试"""
         if not self.connected:
             messagebox.showwarning("未连接", "请先连接到 vFlowCore")
             return
+        if self.auto_test_running:
+            messagebox.showwarning("测试进行中", "自动测试正在运行，请等待完成")
+            return
 
         # 创建自定义对话框
         dialog = tk.Toplevel(self.root)
@@ -525,134 +1028,123 @@ class VFlowCoreDebugger:
         choice = result["choice"]
         if choice is None:
             return
-        elif choice == "safe":
-            test_cases = self.get_test_cases()["safe"]
-        elif choice == "regular":
-            test_cases = self.get_test_cases()["safe"] + self.get_test_cases()["destructive"]
-        else:  # full
-            test_cases = (self.get_test_cases()["safe"] +
-                         self.get_test_cases()["destructive"] +
-                         self.get_test_cases()["dangerous"])
+        test_cases = select_test_cases(choice)
+
+        self.auto_test_running = True
 
         # 清空响应区并显示测试开始
-        self.response_text.delete("1.0", tk.END)
+        self.show_response_text("")
         self.log("=" * 60)
         self.log(f"🧪 开始自动测试 - 共 {len(test_cases)} 个测试用例")
         self.log("=" * 60)
 
-        # 运行测试
+        # 测试在 I/O 线程中依次执行，进度通过队列回到主线程
+        self.io.submit(self.auto_test_worker, self.on_auto_test_done, test_cases)
+
+    def auto_test_worker(self, test_cases):
+        """在 I/O 线程中依次执行测试用例，返回统计结果"""
         results = {
             "passed": 0,
             "failed": 0,
             "skipped": 0,
+            "total": len(test_cases),
             "details": []
         }
 
-        for i, (target, method, params, description) in enumerate(test_cases, 1):
-            self.log(f"\n[{i}/{len(test_cases)}] 测试: {description}")
-            self.log(f"  Target: {target}, Method: {method}")
+        for i, case in enumerate(test_cases, 1):
+            target, method, _, description = case
+            self.io.post(self.on_auto_test_start, i, len(test_cases), target, method, description)
 
-            # 构建请求
-            req = {
-                "target": target,
-                "method": method,
-                "params": params
-            }
+            detail = run_test_case(self.io.exchange, case)
+            if detail["status"] == "✅ 通过":
+                results["passed"] += 1
+            else:
+                results["failed"] += 1
+            results["details"].append(detail)
 
-            try:
-                # 发送请求
-                req_str = json.dumps(req) + "\n"
-                self.socket.sendall(req_str.encode('utf-8'))
-
-                # 接收响应
-                response = self.socket.recv(4096).decode('utf-8').strip()
-                response_json = json.loads(response)
-
-                # 判断测试结果
-                success = response_json.get("success", False)
-
-                if success:
-                    results["passed"] += 1
-                    self.log(f"  ✅ 通过 - {response}")
-                    results["details"].append({
-                        "name": description,
-                        "status": "✅ 通过",
-                        "response": response_json
-                    })
-                else:
-                    results["failed"] += 1
-                    error_msg = response_json.get("error", "Unknown error")
-                    self.log(f"  ❌ 失败 - {error_msg}")
-                    results["details"].append({
-                        "name": description,
-                        "status": "❌ 失败",
-                        "error": error_msg,
-                        "response": response_json
-                    })
-
-                # 在响应区显示实时结果
-                self.response_text.delete("1.0", tk.END)
-                self.response_text.insert("1.0", f"正在测试: [{i}/{len(test_cases)}] {description}\n\n")
-                self.response_text.insert(tk.END, json.dumps(response_json, indent=2, ensure_ascii=False))
+            self.io.post(self.on_auto_test_result, i, len(test_cases), detail)
 
-            except Exception as e:
-                results["failed"] += 1
-                self.log(f"  ❌ 异常 - {e}")
-                results["details"].append({
-                    "name": description,
-                    "status": "❌ 异常",
-                    "error": str(e)
-                })
-
-            # 短暂延迟，避免请求过快
-            self.root.update()
-            import time
-            time.sleep(0.2)
+            # 短暂延迟，避免请求过快（只阻塞 I/O 线程）
+            time.sleep(AUTO_TEST_INTERVAL)
+
+        return results
+
+    def on_auto_test_start(self, i, total, target, method, description):
+        """单个测试开始（主线程）"""
+        self.log(f"\n[{i}/{total}] 测试: {description}")
+        self.log(f"  Target: {target}, Method: {method}")
+
+    def on_auto_test_result(self, i, total, detail):
+        """单个测试完成（主线程）"""
+        if detail["status"] == "✅ 通过":
+            self.log(f"  ✅ 通过 ({detail['transfer']}) - {json.dumps(detail['response'], ensure_ascii=False)}")
+        elif detail["status"] == "❌ 失败":
+            self.log(f"  ❌ 失败 ({detail['transfer']}) - {detail['error']}")
+        else:
+            self.log(f"  ❌ 异常 - {detail['error']}")
+
+        # 在响应区显示实时结果
+        header = f"正在测试: [{i}/{total}] {detail['name']}\n\n"
+        if "response" in detail:
+            self.show_response(json.dumps(detail["response"], ensure_ascii=False), header)
+        else:
+            self.show_response_text(header)
+
+    def on_auto_test_done(self, results, error):
+        """自动测试结束（主线程），显示测试报告"""
+        self.auto_test_running = False
+        if error is not None:
+            self.log(f"❌ 自动测试中断: {error}")
+            messagebox.showerror("测试中断", f"自动测试中断:\n{error}")
+            return
+
+        total = results["total"]
 
         # 显示测试报告
         self.log("\n" + "=" * 60)
         self.log("📊 测试报告")
         self.log("=" * 60)
-        self.log(f"总计: {len(test_cases)} 个测试")
+        self.log(f"总计: {total} 个测试")
         self.log(f"通过: {results['passed']} 个 ✅")
         self.log(f"失败: {results['failed']} 个 ❌")
         self.log(f"跳过: {results['skipped']} 个 ⏭️")
-        self.log(f"成功率: {results['passed'] / len(test_cases) * 100:.1f}%")
+        self.log(f"成功率: {results['passed'] / total * 100:.1f}%")
         self.log("=" * 60)
 
         # 在响应区显示完整报告
-        self.response_text.delete("1.0", tk.END)
         report = ["🧪 vFlowCore 自动测试报告", "=" * 40, ""]
         report.append(f"测试时间: {self.get_timestamp()}")
-        report.append(f"总计: {len(test_cases)} 个测试")
+        report.append(f"总计: {total} 个测试")
         report.append(f"通过: {results['passed']} 个 ✅")
         report.append(f"失败: {results['failed']} 个 ❌")
-        report.append(f"成功率: {results['passed'] / len(test_cases) * 100:.1f}%")
+        report.append(f"成功率: {results['passed'] / total * 100:.1f}%")
         report.append("")
         report.append("详细结果:")
         report.append("-" * 40)
 
         for detail in results["details"]:
             report.append(f"\n{detail['status']} {detail['name']}")
+            if "transfer" in detail:
+                report.append(f"  传输: {detail['transfer']}")
             if "error" in detail:
                 report.append(f"  错误: {detail['error']}")
             if "response" in detail:
-                report.append(f"  响应: {json.dumps(detail['response'], ensure_ascii=False)}")
+                report.append(f"  响应: {json.dumps(shorten_json(detail['response'])[0], ensure_ascii=False)}")
 
         report.append("\n" + "=" * 40)
 
-        self.response_text.insert("1.0", "\n".join(report))
+        self.show_response_text("\n".join(report))
 
         # 弹窗显示总结
         if results["failed"] == 0:
-            messagebox.showinfo("测试完成", f"🎉 全部通过！\n\n{results['passed']}/{len(test_cases)} 个测试通过")
+            messagebox.showinfo("测试完成", f"🎉 全部通过！\n\n{results['passed']}/{total} 个测试通过")
         else:
             messagebox.showwarning(
                 "测试完成",
                 f"⚠️ 部分测试失败\n\n"
                 f"通过: {results['passed']} 个\n"
                 f"失败: {results['failed']} 个\n"
-                f"成功率: {results['passed'] / len(test_cases) * 100:.1f}%"
+                f"成功率: {results['passed'] / total * 100:.1f}%"
             )
 
 def main():
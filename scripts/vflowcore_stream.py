@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+vFlowCore 推送流查看器 - 订阅 subscribeClipboardStream 等推送式方法
+
+推送式方法发送一次请求后在同一连接上持续推送帧，不是一问一答，所以使用专用连接。
+每帧记录收到时间，最近的帧保存在固定长度的环形缓冲中，并统计事件速率（滑动窗口）、
+到达间隔分布，以及序号跳变（core 把多次变化合并成了一次推送）。
+帧可以逐行写入 JSONL 文件（带本机收到时间），用于离线分析投递延迟。
+
+--probe N 会在另一条连接上依次用 setClipboard 写入带标记的文本，测量从发出写入请求到
+收到对应推送的端到端投递延迟（会覆盖设备剪贴板）。
+
+调试工具 vflowcore_debugger.py 的"推送流"窗口也基于本模块。
+
+用法：
+    python3 vflowcore_stream.py                                     # 订阅剪贴板，Ctrl+C 结束并打印统计
+    python3 vflowcore_stream.py --dump clipboard.jsonl --duration 600
+    python3 vflowcore_stream.py --probe 50 --quiet                  # 投递延迟
+    python3 vflowcore_stream.py --unix clipboard subscribeClipboardStream
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import IO, Any, Dict, List, NamedTuple, Optional
+
+from perf_stats import Histogram
+from vflowcore_benchmark import LATENCY_QUANTILES
+from vflowcore_client import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_UNIX_SOCKET,
+    VFlowCoreClient,
+    build_request,
+    parse_param,
+)
+
+# 环形缓冲保留的帧数
+STREAM_BUFFER_FRAMES = 1000
+# 计算当前事件速率的滑动窗口（秒）
+RATE_WINDOW = 10.0
+# 投递延迟探测：两次写入剪贴板之间的间隔（秒）；core 会合并过快的变化
+PROBE_INTERVAL = 0.2
+PROBE_PREFIX = "vflow-probe"
+
+
+class StreamFrame(NamedTuple):
+    """收到的一帧推送"""
+
+    index: int  # 从 1 开始的帧序号
+    received: float  # 收到时的墙上时间（time.time()）
+    elapsed: float  # 距订阅开始的秒数
+    interval: Optional[float]  # 距上一帧的秒数，第一帧为 None
+    size: int  # 帧字节数
+    frame: str  # 原始帧文本
+    event: Optional[str]  # 帧中的 event 字段
+    sequence: Optional[int]  # 帧中的 sequence 字段
+
+    def describe(self, limit: int = 200) -> str:
+        """单行描述，供列表显示"""
+        interval = "-" if self.interval is None else f"{self.interval * 1000:.1f}"
+        text = self.frame if len(self.frame) <= limit else f"{self.frame[:limit]}…"
+        return f"#{self.index} +{self.elapsed * 1000:.1f} ms Δ {interval} ms {self.event or '-'} {text}"
+
+
+class StreamRecorder:
+    """推送流记录器：环形缓冲 + 速率、到达间隔、序号跳变和投递延迟统计
+
+    由订阅线程调用 record()，界面或主线程随时读取 stats()/since()，内部加锁。
+    """
+
+    def __init__(self, capacity: int = STREAM_BUFFER_FRAMES, rate_window: float = RATE_WINDOW,
+                 dump: Optional[IO[str]] = None):
+        self.frames: deque = deque(maxlen=capacity)
+        self.rate_window = rate_window
+        self.dump = dump
+        self.lock = threading.Lock()
+        self.started: Optional[float] = None
+        self.last_at: Optional[float] = None
+        self.count = 0
+        self.bytes = 0
+        self.events: Dict[str, int] = {}
+        self.errors = 0
+        self.sequence_gaps = 0
+        self.last_sequence: Optional[int] = None
+        self.intervals = Histogram()
+        self.recent: deque = deque()  # 滑动窗口内的收到时间
+        # 投递延迟探测：标记文本 -> 发出写入请求的时间
+        self.probes: Dict[str, float] = {}
+        self.probes_sent = 0
+        self.delivery = Histogram()
+
+    def start(self, at: Optional[float] = None):
+        with self.lock:
+            self.started = time.perf_counter() if at is None else at
+
+    def expect(self, text: str, sent_at: float):
+        """登记一次探测写入，收到文本相同的推送时记录投递延迟"""
+        with self.lock:
+            self.probes[text] = sent_at
+            self.probes_sent += 1
+
+    def record(self, raw: bytes, at: float) -> StreamFrame:
+        """记录一帧；at 为 time.perf_counter() 收到时间"""
+        text = raw.decode("utf-8", errors="replace")
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            payload = {}
+        event = payload.get("event")
+        sequence = payload.get("sequence") if isinstance(payload.get("sequence"), int) else None
+
+        with self.lock:
+            if self.started is None:
+                self.started = at
+            interval = None if self.last_at is None else at - self.last_at
+            self.last_at = at
+            self.count += 1
+            self.bytes += len(raw)
+            if interval is not None:
+                self.intervals.observe(interval * 1000)
+            self.recent.append(at)
+            while self.recent and at - self.recent[0] > self.rate_window:
+                self.recent.popleft()
+            self.events[event or "-"] = self.events.get(event or "-", 0) + 1
+            if payload.get("success") is False:
+                self.errors += 1
+            # 序号跳过 1 以上说明中间的变化被合并，没有单独推送
+            if sequence is not None and self.last_sequence is not None and sequence > self.last_sequence + 1:
+                self.sequence_gaps += sequence - self.last_sequence - 1
+            if sequence is not None:
+                self.last_sequence = sequence
+            sent_at = self.probes.pop(payload.get("text"), None) if isinstance(payload.get("text"), str) else None
+            if sent_at is not None:
+                self.delivery.observe((at - sent_at) * 1000)
+
+            frame = StreamFrame(self.count, time.time(), at - self.started, interval, len(raw), text, event, sequence)
+            self.frames.append(frame)
+            if self.dump is not None:
+                self.dump.write(json.dumps({
+                    "index": frame.index,
+                    "received": round(frame.received, 6),
+                    "elapsed_ms": round(frame.elapsed * 1000, 3),
+                    "interval_ms": None if interval is None else round(interval * 1000, 3),
+                    "size": frame.size,
+                    "frame": payload or text,
+                }, ensure_ascii=False) + "\n")
+        return frame
+
+    def since(self, index: int) -> List[StreamFrame]:
+        """序号大于 index 且仍在环形缓冲中的帧"""
+        with self.lock:
+            return [frame for frame in self.frames if frame.index > index]
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """滑动窗口内的事件速率（帧/秒）"""
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            if self.started is None:
+                return 0.0
+            recent = sum(1 for at in self.recent if now - at <= self.rate_window)
+            return recent / min(self.rate_window, max(now - self.started, 1e-6))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        rate = self.rate(now)
+        with self.lock:
+            duration = now - self.started if self.started is not None else 0.0
+            result = {
+                "frames": self.count,
+                "bytes": self.bytes,
+                "errors": self.errors,
+                "duration_seconds": round(duration, 3),
+                "rate_per_second": round(self.count / duration, 3) if duration > 0 else 0.0,
+                "recent_rate_per_second": round(rate, 3),
+                "rate_window_seconds": self.rate_window,
+                "events": dict(self.events),
+                "sequence_gaps": self.sequence_gaps,
+                "interval_ms": self.intervals.to_dict(LATENCY_QUANTILES, digits=3),
+            }
+            if self.probes_sent:
+                result["probe"] = {
+                    "sent": self.probes_sent,
+                    "delivered": self.delivery.count,
+                    "lost": self.probes_sent - self.delivery.count,
+                    "latency_ms": self.delivery.to_dict(LATENCY_QUANTILES, digits=3),
+                }
+        return result
+
+
+def run_probe(client: VFlowCoreClient, recorder: StreamRecorder, count: int,
+              interval: float = PROBE_INTERVAL, stop: Optional[threading.Event] = None):
+    """依次写入带标记的剪贴板文本，由 recorder 匹配推送并记录投递延迟"""
+    token = uuid.uuid4().hex[:8]
+    for i in range(count):
+        if stop is not None and stop.is_set():
+            return
+        text = f"{PROBE_PREFIX}-{token}-{i}"
+        # 发出请求前登记：推送可能先于 setClipboard 的响应到达
+        recorder.expect(text, time.perf_counter())
+        client.call("clipboard", "setClipboard", {"text": text})
+        time.sleep(interval)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Subscribe to a vFlowCore push stream and profile event delivery.")
+    parser.add_argument("target", nargs="?", default="clipboard", help="Target (default: clipboard).")
+    parser.add_argument("method", nargs="?", default="subscribeClipboardStream",
+                        help="Push-style method (default: subscribeClipboardStream).")
+    parser.add_argument("params", nargs="*", type=parse_param, metavar="key=value", help="Params for the request.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="vFlowCore host.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="vFlowCore port.")
+    parser.add_argument("--unix", action="store_true", help="Connect over the abstract UNIX socket instead of TCP.")
+    parser.add_argument("--socket", default=DEFAULT_UNIX_SOCKET, help="Abstract UNIX socket name used with --unix.")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds.")
+    parser.add_argument("--count", type=int, help="Stop after this many frames.")
+    parser.add_argument("--buffer", type=int, default=STREAM_BUFFER_FRAMES, help="Frames kept in the ring buffer.")
+    parser.add_argument("--dump", help="Append every frame with its receive time to this JSONL file.")
+    parser.add_argument("--probe", type=int, default=0,
+                        help="Write N marked clipboard texts on a second connection and measure delivery latency.")
+    parser.add_argument("--probe-interval", type=float, default=PROBE_INTERVAL, help="Seconds between probe writes.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print each frame.")
+    parser.add_argument("--json", action="store_true", help="Print only the final statistics, as JSON.")
+    return parser
+
+
+def print_stats(stats: Dict[str, Any]):
+    intervals = stats["interval_ms"]
+    print("=" * 60, file=sys.stderr)
+    print(f"帧数: {stats['frames']}  字节: {stats['bytes']}  错误: {stats['errors']}  "
+          f"时长: {stats['duration_seconds']} s", file=sys.stderr)
+    print(f"速率: {stats['rate_per_second']} 帧/s（最近 {stats['rate_window_seconds']:g} s: "
+          f"{stats['recent_rate_per_second']} 帧/s）", file=sys.stderr)
+    print(f"到达间隔: p50 {intervals['p50']} ms  p99 {intervals['p99']} ms  max {intervals['max']} ms",
+          file=sys.stderr)
+    print(f"事件: {stats['events']}  序号跳变: {stats['sequence_gaps']}", file=sys.stderr)
+    if "probe" in stats:
+        probe = stats["probe"]
+        latency = probe["latency_ms"]
+        print(f"投递延迟: 发送 {probe['sent']}  收到 {probe['delivered']}  丢失 {probe['lost']}  "
+              f"p50 {latency['p50']} ms  p99 {latency['p99']} ms  max {latency['max']} ms", file=sys.stderr)
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    unix = args.socket if args.unix else None
+    client = VFlowCoreClient(args.host, args.port, unix=unix, reconnect=False)
+    try:
+        client.connect()
+    except OSError as e:
+        print(f"无法连接到 vFlowCore {client.address}: {e}", file=sys.stderr)
+        return 2
+
+    dump = open(args.dump, "a", encoding="utf-8") if args.dump else None
+    recorder = StreamRecorder(args.buffer, dump=dump)
+    stop = threading.Event()
+
+    def finish():
+        stop.set()
+        client.interrupt()
+
+    if args.duration:
+        timer = threading.Timer(args.duration, finish)
+        timer.daemon = True
+        timer.start()
+
+    probe_thread = None
+    if args.probe > 0:
+        def probe():
+            try:
+                with VFlowCoreClient(args.host, args.port, unix=unix) as prober:
+                    run_probe(prober, recorder, args.probe, args.probe_interval, stop)
+            except OSError as e:
+                print(f"探测连接错误: {e}", file=sys.stderr)
+            # 留出最后一次推送的时间后结束订阅
+            if not stop.wait(max(args.probe_interval, 1.0)):
+                finish()
+
+        probe_thread = threading.Thread(target=probe, name="vflowcore-probe", daemon=True)
+
+    print(f"已订阅 {args.target}.{args.method} @ {client.address}（Ctrl+C 结束）", file=sys.stderr)
+    exit_code = 0
+    recorder.start()
+    try:
+        for raw, at in client.subscribe(build_request(args.target, args.method, dict(args.params))):
+            frame = recorder.record(raw, at)
+            if not args.quiet and not args.json:
+                print(frame.describe(), flush=True)
+            if frame.index == 1 and probe_thread is not None:
+                # 等第一帧（ready）到达后再开始写入，保证订阅已生效
+                probe_thread.start()
+            if args.count and frame.index >= args.count:
+                break
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        if not stop.is_set():
+            print(f"通信错误: {e}", file=sys.stderr)
+            exit_code = 2
+    finally:
+        stop.set()
+        client.close()
+        if dump is not None:
+            dump.close()
+
+    stats = recorder.stats()
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        print_stats(stats)
+    if exit_code == 0 and stats["errors"]:
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())